@@ -0,0 +1,51 @@
+export const runtime = "nodejs";
+export const dynamic = "force-dynamic";
+
+const HANDW_API_BASE = process.env.HANDW_API_BASE!;
+const HANDW_API_KEY = process.env.HANDW_API_KEY!;
+
+/**
+ * Server-Sent Events proxy for OCR job progress.
+ * EventSource cannot send the x-api-key header, so the browser
+ * subscribes here and we pipe the backend stream through.
+ */
+export async function GET(req: Request) {
+  const { searchParams } = new URL(req.url);
+  const jobId = searchParams.get("jobId");
+
+  if (!jobId) {
+    return new Response(
+      JSON.stringify({ error: "jobId missing" }),
+      { status: 400 }
+    );
+  }
+
+  const res = await fetch(
+    `${HANDW_API_BASE}/api/job-events?jobId=${jobId}`,
+    {
+      headers: {
+        "x-api-key": HANDW_API_KEY,
+        Accept: "text/event-stream",
+      },
+      cache: "no-store",
+      signal: req.signal,
+    }
+  );
+
+  if (!res.ok || !res.body) {
+    const text = await res.text();
+    return new Response(text, {
+      status: res.status,
+      headers: { "Content-Type": "application/json" },
+    });
+  }
+
+  return new Response(res.body, {
+    status: 200,
+    headers: {
+      "Content-Type": "text/event-stream",
+      "Cache-Control": "no-cache, no-transform",
+      Connection: "keep-alive",
+    },
+  });
+}
@@ -9,19 +9,34 @@
 # =============================================================
 
 import os
+import asyncio
 import base64
+import copy
+import hashlib
 import json
 import re
+import sqlite3
 import unicodedata
-import requests
+import zipfile
+import httpx
 import traceback
 import io
+import mmap
+import tempfile
 import fitz          # PyMuPDF
 import time
+import threading
 import numpy as np
 import cv2
+import multiprocessing as mp
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks, Request
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from xml.sax.saxutils import escape as xml_escape
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
 from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
@@ -30,10 +45,14 @@ from datetime import datetime
 
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
-from docx.shared import RGBColor, Inches, Pt
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import RGBColor, Inches, Pt, Emu
 from docx.enum.table import WD_TABLE_ALIGNMENT
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
+from docx.image.image import Image as DocxImage
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import qn, nsdecls, nsmap as DOCX_NSMAP
+from lxml import etree
 
 from dotenv import load_dotenv
 
@@ -48,7 +67,102 @@ ENGINE_VERSION     = "v2.0.0"
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_URL     = "https://openrouter.ai/api/v1/chat/completions"
 MODEL              = "openai/gpt-4o-mini"
-MAX_PDF_PAGES      = 20
+
+# "per-page": every PDF page runs stage 1 + 2 as its own concurrent task.
+# "stitched": legacy mode, all pages stitched into one tall image.
+OCR_PAGE_MODE      = os.getenv("OCR_PAGE_MODE", "per-page")
+OCR_PAGE_WORKERS   = int(os.getenv("OCR_PAGE_WORKERS", "4"))
+
+# Pages one OCR job reads (per-page mode renders them one at a time, so this
+# is a cost budget, not a memory limit); further pages are skipped and counted
+# in _audit. The stitched canvas grows with every page and stays at 20.
+OCR_PAGE_BUDGET      = int(os.getenv("OCR_PAGE_BUDGET", "200"))
+OCR_STITCH_MAX_PAGES = 20
+
+# Processes rendering + encoding per-page OCR images (0 = one page at a time
+# in a thread). The default leaves a core for the event loop.
+OCR_RENDER_WORKERS = int(os.getenv("OCR_RENDER_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+
+# Hybrid routing (per-page mode only): PDF pages with a usable text layer
+# are read locally and skip stage 1 + 2; only scanned pages reach the model.
+OCR_HYBRID         = os.getenv("OCR_HYBRID", "1") == "1"
+
+# "local": deterministic Markdown → TipTap converter (default).
+# "llm":   legacy stage-3 LLM call.
+STAGE3_MODE        = os.getenv("STAGE3_MODE", "local")
+
+# OCR image preprocessing (see PREPROCESSING below). Model sides match
+# what the vision model actually sees: fit in 2048², short side ≤ 768.
+OCR_RENDER_DPI       = int(os.getenv("OCR_RENDER_DPI", "300"))      # upper bound
+OCR_MIN_RENDER_DPI   = int(os.getenv("OCR_MIN_RENDER_DPI", "150"))
+OCR_AUTOCROP         = os.getenv("OCR_AUTOCROP", "1") == "1"
+OCR_COLOR_MODE       = os.getenv("OCR_COLOR_MODE", "gray")          # color | gray | binary
+OCR_MODEL_LONG_SIDE  = int(os.getenv("OCR_MODEL_LONG_SIDE", "2048"))
+OCR_MODEL_SHORT_SIDE = int(os.getenv("OCR_MODEL_SHORT_SIDE", "768"))
+OCR_IMAGE_FORMAT     = os.getenv("OCR_IMAGE_FORMAT", "jpeg")        # png | jpeg | webp
+OCR_IMAGE_QUALITY    = int(os.getenv("OCR_IMAGE_QUALITY", "85"))
+
+# Stream stage-1 tokens: partial markdown shows up on the job while the
+# call runs, and generation is cut off at the truncation marker.
+OCR_STREAM_STAGE1           = os.getenv("OCR_STREAM_STAGE1", "0") == "1"
+OCR_STREAM_PUBLISH_INTERVAL = float(os.getenv("OCR_STREAM_PUBLISH_INTERVAL", "0.5"))
+TRUNCATION_MARKER           = "[DOCUMENT TRUNCATED]"
+JOB_PARTIAL_TAIL_CHARS      = int(os.getenv("JOB_PARTIAL_TAIL_CHARS", "4000"))   # partialMarkdown kept on the job
+
+# OCR job scheduler: concurrent jobs, queue high-water mark (→ 429),
+# and how long shutdown waits for running jobs to finish.
+OCR_WORKERS          = int(os.getenv("OCR_WORKERS", "2"))
+OCR_QUEUE_HIGH_WATER = int(os.getenv("OCR_QUEUE_HIGH_WATER", "50"))
+OCR_DRAIN_TIMEOUT    = float(os.getenv("OCR_DRAIN_TIMEOUT", "120"))
+OCR_STALE_SECONDS    = float(os.getenv("OCR_STALE_SECONDS", "900"))   # "processing" without an update → re-queued
+
+# Shared, pooled HTTP client limits (see HTTP CLIENTS below)
+OPENROUTER_TIMEOUT         = float(os.getenv("OPENROUTER_TIMEOUT", "90"))
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+OPENROUTER_MAX_CONCURRENCY = int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "8"))
+OPENROUTER_HTTP2           = os.getenv("OPENROUTER_HTTP2", "1") == "1"
+ASSET_FETCH_TIMEOUT        = float(os.getenv("ASSET_FETCH_TIMEOUT", "8"))
+
+# Process-wide cache for header / footer / logo / signature images
+ASSET_CACHE_MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ASSET_CACHE_TTL       = int(os.getenv("ASSET_CACHE_TTL", "300"))      # seconds before revalidating
+ASSET_NEGATIVE_TTL    = int(os.getenv("ASSET_NEGATIVE_TTL", "60"))    # failing URLs are not retried sooner
+ASSET_EMBED_DPI       = int(os.getenv("ASSET_EMBED_DPI", "200"))      # pixels per inch of embedded width
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# DOCX engine: "python-docx" | "stream" | "auto" (stream once a document has
+# at least DOCX_STREAM_MIN_NODES top-level nodes)
+DOCX_ENGINE           = os.getenv("DOCX_ENGINE", "auto")
+DOCX_STREAM_MIN_NODES = int(os.getenv("DOCX_STREAM_MIN_NODES", "300"))
+
+# Rendered XML of top-level nodes, reused by the stream engine on re-export
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Export process pool (0 workers = everything in a thread). Documents up to
+# EXPORT_INLINE_MAX_NODES top-level nodes / PDFs up to EXPORT_INLINE_MAX_BYTES
+# skip the pool; pooled exports are killed after EXPORT_TIMEOUT seconds.
+EXPORT_WORKERS          = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_TIMEOUT          = float(os.getenv("EXPORT_TIMEOUT", "60"))
+EXPORT_INLINE_MAX_NODES = int(os.getenv("EXPORT_INLINE_MAX_NODES", "40"))
+EXPORT_INLINE_MAX_BYTES = int(os.getenv("EXPORT_INLINE_MAX_BYTES", str(256 * 1024)))
+EXPORT_DISCONNECT_POLL  = float(os.getenv("EXPORT_DISCONNECT_POLL", "0.5"))
+EXPORT_STREAM_POLL      = float(os.getenv("EXPORT_STREAM_POLL", "0.05"))   # streamed export: new-bytes check
+EXPORT_BATCH_MAX_ITEMS  = int(os.getenv("EXPORT_BATCH_MAX_ITEMS", "500"))
+
+# Digital PDF → DOCX: "plain" (text blocks, one document in memory) or
+# "layout" (structured spans → headings / bold / tables, extracted on
+# EXPORT_POOL in PDF_EXPORT_RANGE_PAGES-page ranges and streamed out)
+PDF_EXPORT_MODE        = os.getenv("PDF_EXPORT_MODE", "plain")
+PDF_EXPORT_RANGE_PAGES = int(os.getenv("PDF_EXPORT_RANGE_PAGES", "8"))
+PDF_EXPORT_TABLES      = os.getenv("PDF_EXPORT_TABLES", "1") == "1"
+PDF_BODY_SAMPLE_PAGES  = int(os.getenv("PDF_BODY_SAMPLE_PAGES", "50"))   # pages sampled for the body font size
+
+# Finished exports by request hash. Entries expire with the asset cache so a
+# changed header / logo / signature image shows up on the next export.
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+EXPORT_CACHE_TTL       = int(os.getenv("EXPORT_CACHE_TTL", str(ASSET_CACHE_TTL)))
 
 OCR_HEADERS = {
     "Authorization": f"Bearer {OPENROUTER_API_KEY}",
@@ -63,6 +177,31 @@ if not OPENROUTER_API_KEY:
 BASE_DIR      = os.path.dirname(__file__)
 BASE_TEMPLATE = os.path.join(BASE_DIR, "base.docx")
 
+# Job store backend: "sqlite" (default, WAL) | "redis" | "memory"
+JOB_STORE_BACKEND   = os.getenv("JOB_STORE_BACKEND", "sqlite")
+JOB_STORE_PATH      = os.getenv("JOB_STORE_PATH", os.path.join(BASE_DIR, "jobs.db"))
+JOB_STORE_REDIS_URL = os.getenv("JOB_STORE_REDIS_URL", "redis://localhost:6379/0")
+JOB_TTL_SECONDS     = int(os.getenv("JOB_TTL_SECONDS", str(24 * 3600)))
+JOB_PURGE_INTERVAL  = int(os.getenv("JOB_PURGE_INTERVAL", "600"))
+JOB_EVENTS_POLL     = float(os.getenv("JOB_EVENTS_POLL", "1.0"))   # SSE cross-worker fallback poll
+
+# Content-addressed OCR stage cache (0 bytes disables it)
+OCR_CACHE_DIR       = os.getenv("OCR_CACHE_DIR", os.path.join(BASE_DIR, "ocr_cache"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Uploads: streamed to disk in UPLOAD_CHUNK_BYTES pieces, stored under their
+# SHA-256 (identical files share one copy), rejected past UPLOAD_MAX_BYTES
+# (→ 413) and removed UPLOAD_TTL_SECONDS after the last upload of that file.
+UPLOAD_DIR         = os.getenv("UPLOAD_DIR", os.path.join(BASE_DIR, "uploads"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_BYTES   = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_TTL_SECONDS = int(os.getenv("UPLOAD_TTL_SECONDS", str(JOB_TTL_SECONDS)))
+
+# PDF type detection: a page with both text and images counts as scanned when
+# one image covers PDF_DETECT_IMAGE_COVER of it and it yields < PDF_DETECT_MIN_CHARS.
+PDF_DETECT_IMAGE_COVER = float(os.getenv("PDF_DETECT_IMAGE_COVER", "0.5"))
+PDF_DETECT_MIN_CHARS   = int(os.getenv("PDF_DETECT_MIN_CHARS", "20"))
+
 API_KEY = os.getenv("HANDW_API_KEY")
 if not API_KEY:
     raise RuntimeError(
@@ -75,7 +214,23 @@ if not API_KEY:
 # FASTAPI APP + MIDDLEWARE
 # ─────────────────────────────────────────────────────────────
 
-app = FastAPI(title="Handwritten-to-Doc Engine v2")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    purger = asyncio.create_task(purge_jobs_forever())
+    SCHEDULER.start()
+    await SCHEDULER.recover()
+    await asyncio.to_thread(TEMPLATES.warm)
+    EXPORT_POOL.start()
+    RENDER_POOL.start()
+    yield
+    RENDER_POOL.shutdown()
+    EXPORT_POOL.shutdown()
+    await SCHEDULER.shutdown()
+    purger.cancel()
+    await close_http_clients()
+
+
+app = FastAPI(title="Handwritten-to-Doc Engine v2", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -91,8 +246,8 @@ async def api_key_guard(request: Request, call_next):
     # Always allow docs
     if request.url.path in ["/docs", "/openapi.json", "/redoc"]:
         return await call_next(request)
-    # Guard both /api/* routes AND /generate-docx
-    if request.url.path.startswith("/api") or request.url.path == "/generate-docx":
+    # Guard both /api/* routes AND /generate-docx (+ /generate-docx/batch)
+    if request.url.path.startswith("/api") or request.url.path.startswith("/generate-docx"):
         key = request.headers.get("x-api-key")
         if not API_KEY or key != API_KEY:
             return JSONResponse(status_code=401, content={"error": "UNAUTHORIZED"})
@@ -100,18 +255,257 @@ async def api_key_guard(request: Request, call_next):
 
 
 # ─────────────────────────────────────────────────────────────
-# JOB STORE  (in-memory)
+# JOB STORE  (pluggable, shared across uvicorn workers)
 # ─────────────────────────────────────────────────────────────
+#
+# Every backend exposes the same small interface:
+#   get(jobId) · update(jobId, updates) · transition(jobId, from_states, updates)
+#   ids_in_state(state) · purge_expired()
+# update / transition are atomic read-modify-writes. Finished jobs get an
+# expiry of JOB_TTL_SECONDS and are removed by purge_expired().
+
+FINISHED_JOB_STATES = ("ready", "free-ready", "error")
+
+
+def _stamp_job(job: dict, updates: dict) -> dict:
+    now = int(time.time() * 1000)
+    job.setdefault("createdAt", now)
+    job.update(updates)
+    job["updatedAt"] = now
+    job["version"]   = job.get("version", 0) + 1
+    return job
+
+
+def _job_expiry(job: dict) -> Optional[float]:
+    return time.time() + JOB_TTL_SECONDS if job.get("state") in FINISHED_JOB_STATES else None
+
+
+class MemoryJobStore:
+    """Single-process store — only for local development and tests."""
+
+    def __init__(self):
+        self._jobs: dict = {}
+        self._expiry: dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, jobId: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(jobId)
+            return json.loads(json.dumps(job)) if job else None
+
+    def _write(self, jobId: str, job: dict):
+        self._jobs[jobId] = job
+        self._expiry[jobId] = _job_expiry(job)
+
+    def update(self, jobId: str, updates: dict) -> dict:
+        with self._lock:
+            job = _stamp_job(self._jobs.get(jobId) or {"jobId": jobId}, updates)
+            self._write(jobId, job)
+            return job
+
+    def transition(self, jobId: str, from_states: tuple, updates: dict) -> bool:
+        with self._lock:
+            job = self._jobs.get(jobId)
+            if not job or job.get("state") not in from_states:
+                return False
+            self._write(jobId, _stamp_job(job, updates))
+            return True
+
+    def ids_in_state(self, state: str) -> list:
+        with self._lock:
+            return [k for k, v in self._jobs.items() if v.get("state") == state]
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            dead = [k for k, exp in self._expiry.items() if exp and exp < now]
+            for k in dead:
+                self._jobs.pop(k, None); self._expiry.pop(k, None)
+            return len(dead)
+
+
+class SQLiteJobStore:
+    """SQLite in WAL mode: safe for several uvicorn workers on one host, survives restarts."""
+
+    def __init__(self, path: str):
+        self.path   = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id     TEXT PRIMARY KEY,
+                    state      TEXT,
+                    data       TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_state   ON jobs(state);
+                CREATE INDEX IF NOT EXISTS idx_jobs_expires ON jobs(expires_at);
+            """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, jobId: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT data FROM jobs WHERE job_id = ?", (jobId,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _modify(self, jobId: str, updates: dict, from_states: Optional[tuple]) -> Optional[dict]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (jobId,)).fetchone()
+            job = json.loads(row[0]) if row else None
+            if from_states is not None and (not job or job.get("state") not in from_states):
+                conn.execute("ROLLBACK")
+                return None
+            job = _stamp_job(job or {"jobId": jobId}, updates)
+            conn.execute(
+                "INSERT INTO jobs (job_id, state, data, updated_at, expires_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                "updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+                (jobId, job.get("state"), json.dumps(job), time.time(), _job_expiry(job)),
+            )
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update(self, jobId: str, updates: dict) -> dict:
+        return self._modify(jobId, updates, None)
+
+    def transition(self, jobId: str, from_states: tuple, updates: dict) -> bool:
+        return self._modify(jobId, updates, tuple(from_states)) is not None
+
+    def ids_in_state(self, state: str) -> list:
+        rows = self._conn().execute("SELECT job_id FROM jobs WHERE state = ?", (state,)).fetchall()
+        return [r[0] for r in rows]
+
+    def purge_expired(self) -> int:
+        cur = self._conn().execute(
+            "DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        return cur.rowcount
+
+
+class RedisJobStore:
+    """
+    Redis-protocol store. Jobs live under the same `job:<id>` JSON keys
+    lib/jobStore-server.ts uses; per-state sets give indexed lookup and
+    finished jobs expire natively via the key TTL.
+    """
+
+    JOB_PREFIX   = "job:"
+    STATE_PREFIX = "jobs:state:"
+
+    def __init__(self, url: str):
+        import redis   # optional dependency, only needed for this backend
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, jobId: str) -> str:
+        return f"{self.JOB_PREFIX}{jobId}"
+
+    def get(self, jobId: str) -> Optional[dict]:
+        raw = self.r.get(self._key(jobId))
+        return json.loads(raw) if raw else None
+
+    def _modify(self, jobId: str, updates: dict, from_states: Optional[tuple]) -> Optional[dict]:
+        key = self._key(jobId)
+
+        def txn(pipe):
+            raw = pipe.get(key)
+            job = json.loads(raw) if raw else None
+            if from_states is not None and (not job or job.get("state") not in from_states):
+                return None
+            old_state = (job or {}).get("state")
+            job       = _stamp_job(job or {"jobId": jobId}, updates)
+            pipe.multi()
+            ttl = JOB_TTL_SECONDS if job.get("state") in FINISHED_JOB_STATES else None
+            pipe.set(key, json.dumps(job), ex=ttl)
+            if old_state and old_state != job.get("state"):
+                pipe.srem(f"{self.STATE_PREFIX}{old_state}", jobId)
+            if job.get("state"):
+                pipe.sadd(f"{self.STATE_PREFIX}{job['state']}", jobId)
+            return job
+
+        return self.r.transaction(txn, key, value_from_callable=True)
+
+    def update(self, jobId: str, updates: dict) -> dict:
+        return self._modify(jobId, updates, None)
+
+    def transition(self, jobId: str, from_states: tuple, updates: dict) -> bool:
+        return self._modify(jobId, updates, tuple(from_states)) is not None
+
+    def ids_in_state(self, state: str) -> list:
+        return sorted(self.r.smembers(f"{self.STATE_PREFIX}{state}"))
+
+    def purge_expired(self) -> int:
+        # Job keys expire on their own; drop index entries that point at them.
+        removed = 0
+        for state in FINISHED_JOB_STATES:
+            set_key = f"{self.STATE_PREFIX}{state}"
+            for jobId in self.r.smembers(set_key):
+                if not self.r.exists(self._key(jobId)):
+                    removed += self.r.srem(set_key, jobId)
+        return removed
+
+
+def create_job_store():
+    if JOB_STORE_BACKEND == "redis":
+        return RedisJobStore(JOB_STORE_REDIS_URL)
+    if JOB_STORE_BACKEND == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(JOB_STORE_PATH)
+
+
+JOB_STORE = create_job_store()
+
+
+# In-process wake-ups for /api/job-events. Other workers' writes are
+# picked up by the SSE loop's JOB_EVENTS_POLL fallback.
+JOB_WATCHERS: dict = {}   # jobId → set of (loop, asyncio.Event)
+
+
+def notify_job(jobId: str):
+    for loop, event in list(JOB_WATCHERS.get(jobId, ())):
+        loop.call_soon_threadsafe(event.set)
 
-JOB_STORE: dict = {}
 
 def load_job(jobId: str):
     return JOB_STORE.get(jobId)
 
 def update_job(jobId: str, **updates):
-    if jobId not in JOB_STORE:
-        JOB_STORE[jobId] = {"jobId": jobId}
-    JOB_STORE[jobId].update(updates)
+    job = JOB_STORE.update(jobId, updates)
+    notify_job(jobId)
+    return job
+
+def transition_job(jobId: str, from_states: tuple, **updates) -> bool:
+    """Atomically apply `updates` only if the job is currently in one of `from_states`."""
+    ok = JOB_STORE.transition(jobId, from_states, updates)
+    if ok:
+        notify_job(jobId)
+    return ok
+
+
+async def purge_jobs_forever():
+    while True:
+        try:
+            removed = await asyncio.to_thread(JOB_STORE.purge_expired)
+            if removed:
+                log("Purged expired jobs", removed)
+            removed = await asyncio.to_thread(purge_uploads)
+            if removed:
+                log("Purged expired uploads", removed)
+            await SCHEDULER.requeue_stale()
+        except Exception as e:
+            log("⚠️ Job purge failed", repr(e))
+        await asyncio.sleep(JOB_PURGE_INTERVAL)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -125,6 +519,107 @@ def log(step, data=None):
         print(data)
 
 
+# ─────────────────────────────────────────────────────────────
+# HTTP CLIENTS  (pooled, keep-alive, shared by every stage)
+# ─────────────────────────────────────────────────────────────
+#
+# One AsyncClient serves all OpenRouter calls so connections (and TLS
+# sessions) are reused; a semaphore caps in-flight LLM requests.
+# fetch_image runs inside the sync DOCX renderer, so it gets a pooled
+# sync client instead.
+
+def _http2_available() -> bool:
+    if not OPENROUTER_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client:  Optional[httpx.Client]      = None
+_llm_slots = asyncio.Semaphore(OPENROUTER_MAX_CONCURRENCY)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            http2   = _http2_available(),
+            headers = OCR_HEADERS,
+            timeout = httpx.Timeout(OPENROUTER_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+            limits  = httpx.Limits(max_connections=OPENROUTER_MAX_CONNECTIONS,
+                                   max_keepalive_connections=OPENROUTER_MAX_CONNECTIONS,
+                                   keepalive_expiry=60),
+        )
+    return _async_client
+
+
+def get_sync_client() -> httpx.Client:
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        _sync_client = httpx.Client(
+            http2            = _http2_available(),
+            timeout          = ASSET_FETCH_TIMEOUT,
+            follow_redirects = True,
+            limits           = httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+    return _sync_client
+
+
+async def close_http_clients():
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.aclose(); _async_client = None
+    if _sync_client is not None:
+        _sync_client.close(); _sync_client = None
+
+
+async def openrouter_chat(payload: dict) -> str:
+    """POST a chat completion through the shared client; returns the message content."""
+    async with _llm_slots:
+        res = await get_async_client().post(OPENROUTER_URL, json=payload)
+    res.raise_for_status()
+    return res.json()["choices"][0]["message"]["content"]
+
+
+async def openrouter_chat_stream(payload: dict, on_delta=None, stop_marker: Optional[str] = None) -> str:
+    """
+    Streaming chat completion. `on_delta(text_so_far)` runs per chunk. When
+    `stop_marker` shows up the connection is closed straight away, which
+    cancels generation upstream so tokens after the marker are not billed.
+    """
+    text = ""
+    async with _llm_slots:
+        async with get_async_client().stream("POST", OPENROUTER_URL, json={**payload, "stream": True}) as res:
+            res.raise_for_status()
+            async for line in res.aiter_lines():
+                if not line.startswith("data:"):
+                    continue    # blank lines and ": OPENROUTER PROCESSING" keep-alives
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if chunk.get("error"):
+                    raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+                delta = ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content") or ""
+                if not delta:
+                    continue
+                text += delta
+                if stop_marker and stop_marker in text:
+                    text = text[:text.index(stop_marker) + len(stop_marker)]
+                    log("⚠️ Stream stopped at marker", f"{len(text)} chars")
+                    break
+                if on_delta:
+                    on_delta(text)
+    return text
+
+
 # =============================================================
 # ░░░░  SECTION 1 — OCR / VISION PIPELINE  ░░░░░░░░░░░░░░░░░░
 # =============================================================
@@ -137,73 +632,528 @@ def is_pdf(data: bytes) -> bool:
     return data[:4] == b"%PDF"
 
 
-def pdf_page_to_image_bytes(page) -> bytes:
-    pix = page.get_pixmap(dpi=300)
-    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-    if pix.n == 4:
-        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-    ok, buf = cv2.imencode(".png", img)
-    if not ok:
-        raise ValueError("Failed to encode PDF page as PNG")
-    return buf.tobytes()
+def open_pdf(pdf) -> "fitz.Document":
+    """PDF bytes, or a path PyMuPDF reads from disk as needed."""
+    return fitz.open(pdf, filetype="pdf") if isinstance(pdf, str) else fitz.open(stream=pdf, filetype="pdf")
 
 
-def pdf_to_image_bytes(pdf_bytes: bytes) -> bytes:
-    """Render all pages (up to MAX_PDF_PAGES) and stitch vertically into one PNG."""
-    doc         = fitz.open(stream=pdf_bytes, filetype="pdf")
-    total_pages = min(len(doc), MAX_PDF_PAGES)
+def ocr_render_dpi(page) -> int:
+    """Lowest DPI that still gives ~2× the model's short side, capped at OCR_RENDER_DPI."""
+    short_pt = max(1.0, min(page.rect.width, page.rect.height))
+    wanted   = 2 * OCR_MODEL_SHORT_SIDE * 72 / short_pt
+    return int(min(OCR_RENDER_DPI, max(OCR_MIN_RENDER_DPI, wanted)))
+
+
+def pixmap_view(pix) -> np.ndarray:
+    """H×W×n uint8 view over a pixmap's sample buffer (zero-copy where PyMuPDF exposes samples_mv)."""
+    buf = getattr(pix, "samples_mv", None) or pix.samples
+    return np.frombuffer(buf, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+
+def render_pdf_page(page) -> np.ndarray:
+    """Render one page straight to an array: grayscale unless OCR_COLOR_MODE is "color"."""
+    if OCR_COLOR_MODE == "color":
+        pix = page.get_pixmap(dpi=ocr_render_dpi(page), colorspace=fitz.csRGB, alpha=False)
+        return cv2.cvtColor(pixmap_view(pix), cv2.COLOR_RGB2BGR)
+    pix = page.get_pixmap(dpi=ocr_render_dpi(page), colorspace=fitz.csGRAY, alpha=False)
+    return pixmap_view(pix)[..., 0].copy()
+
+
+def pdf_to_stitched_array(pdf) -> np.ndarray:
+    """
+    Render all pages (up to OCR_STITCH_MAX_PAGES) into one preallocated canvas,
+    stacked vertically with a 10 px white gap. Pixmaps are copied straight
+    from their sample buffer into the canvas slice — no per-page PNG
+    encode/decode and no hstack/vstack temporaries.
+    """
+    doc         = open_pdf(pdf)
+    total_pages = min(len(doc), OCR_STITCH_MAX_PAGES)
     log("PDF pages to render", f"{total_pages} / {len(doc)}")
 
-    page_images = []
-    for i in range(total_pages):
-        raw = pdf_page_to_image_bytes(doc.load_page(i))
-        page_images.append(cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR))
+    color  = OCR_COLOR_MODE == "color"
+    pages  = [doc.load_page(i) for i in range(total_pages)]
+    mats   = [fitz.Matrix(ocr_render_dpi(p) / 72, ocr_render_dpi(p) / 72) for p in pages]
+    rects  = [(p.rect * m).irect for p, m in zip(pages, mats)]
+    gap    = 10
+    max_w  = max(r.width for r in rects)
+    total_h = sum(r.height for r in rects) + gap * (len(rects) - 1)
+    canvas = np.full((total_h, max_w, 3) if color else (total_h, max_w), 255, dtype=np.uint8)
+
+    y = 0
+    for page, mat, rect in zip(pages, mats, rects):
+        pix = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB if color else fitz.csGRAY, alpha=False)
+        h, w = min(pix.height, rect.height), min(pix.width, max_w)
+        src = pixmap_view(pix)[:h, :w]
+        if color:
+            canvas[y:y + h, :w] = src[..., ::-1]     # RGB → BGR, written in place
+        else:
+            canvas[y:y + h, :w] = src[..., 0]
+        del src, pix
+        y += rect.height + gap
+
+    log("Stitched image size", f"{canvas.shape[1]}×{canvas.shape[0]} px")
+    return canvas
+
+
+def iter_pdf_page_images(pdf, pages: Optional[list] = None):
+    """
+    Render and preprocess one page at a time, in page order: every page up to
+    OCR_PAGE_BUDGET, or only the 0-based `pages` given. A page's pixmap and
+    full-size array are gone once its image is encoded, so memory stays flat
+    however many pages are pulled. Images carry their 1-based "page".
+    """
+    with open_pdf(pdf) as doc:
+        indices = [i for i in (range(min(len(doc), OCR_PAGE_BUDGET)) if pages is None else pages) if i < len(doc)]
+        log("PDF pages to render", f"{len(indices)} / {len(doc)} (per-page)")
+        for i in indices:
+            t0    = time.perf_counter()
+            image = {**preprocess_for_ocr(render_pdf_page(doc.load_page(i))), "page": i + 1}
+            image["renderSeconds"] = time.perf_counter() - t0
+            fitz.TOOLS.store_shrink(100)     # MuPDF keeps decoded page images in its store (256 MB)
+            yield image
+
 
-    if len(page_images) == 1:
-        stitched = page_images[0]
+def pdf_to_page_images(pdf, pages: Optional[list] = None) -> list:
+    return list(iter_pdf_page_images(pdf, pages))
+
+
+_RENDER_DOC: dict = {}   # render worker: the document it has open, by (path, mtime)
+
+
+def render_pdf_page_image(file_path: str, index: int) -> dict:
+    """One page → preprocessed OCR image. Runs in a RENDER_POOL worker, which keeps its own copy of the PDF open."""
+    key = (file_path, os.path.getmtime(file_path))
+    if key not in _RENDER_DOC:
+        for doc in _RENDER_DOC.values():
+            doc.close()
+        _RENDER_DOC.clear()
+        _RENDER_DOC[key] = open_pdf(file_path)
+    t0    = time.perf_counter()
+    image = {**preprocess_for_ocr(render_pdf_page(_RENDER_DOC[key].load_page(index))), "page": index + 1}
+    image["renderSeconds"] = time.perf_counter() - t0
+    fitz.TOOLS.store_shrink(100)
+    return image
+
+
+async def aiter_pdf_page_images(file_path: str, pages: list):
+    """
+    Page images for the 0-based `pages`, in page order, rendered on
+    RENDER_POOL: up to one page per worker is in flight ahead of the one
+    being handed to OCR, so rendering overlaps the first LLM calls.
+    """
+    todo    = deque(pages)
+    pending = deque()
+    window  = max(1, RENDER_POOL.workers)
+    log("PDF pages to render", f"{len(pages)} (process pool, {RENDER_POOL.workers} workers)")
+    try:
+        while todo or pending:
+            while todo and len(pending) < window:
+                pending.append(asyncio.ensure_future(RENDER_POOL.run(render_pdf_page_image, file_path, todo.popleft())))
+            yield await pending.popleft()
+    finally:
+        for task in pending:   # job failed or was cancelled: stop the renders still running
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+# ─────────────────────────────────────────────────────────────
+# PREPROCESSING  (crop → gray/binary → downscale → encode)
+# ─────────────────────────────────────────────────────────────
+#
+# Every OCR image is a dict: {"data": bytes, "mime": str, "bytes": {...}}
+# where "bytes" records the payload size after each step so upload
+# savings can be weighed against OCR accuracy.
+
+OCR_IMAGE_MIME = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def autocrop_margins(img: np.ndarray, pad_ratio: float = 0.02) -> np.ndarray:
+    """Trim blank page margins. Specks are ignored via a median blur on the ink mask."""
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    ink  = cv2.medianBlur((gray < 200).astype(np.uint8) * 255, 5)
+    pts  = cv2.findNonZero(ink)
+    if pts is None:
+        return img
+    x, y, w, h = cv2.boundingRect(pts)
+    pad = int(max(img.shape[:2]) * pad_ratio)
+    y0, y1 = max(0, y - pad), min(img.shape[0], y + h + pad)
+    x0, x1 = max(0, x - pad), min(img.shape[1], x + w + pad)
+    return img[y0:y1, x0:x1]
+
+
+def model_scale(width: int, height: int) -> float:
+    """Downscale factor (≤ 1) matching the vision model's own resize rules."""
+    return min(1.0, OCR_MODEL_LONG_SIDE / max(width, height), OCR_MODEL_SHORT_SIDE / min(width, height))
+
+
+def encode_ocr_image(img: np.ndarray) -> tuple:
+    fmt = OCR_IMAGE_FORMAT if OCR_IMAGE_FORMAT in OCR_IMAGE_MIME else "png"
+    if fmt == "png" or (OCR_COLOR_MODE == "binary" and fmt == "jpeg"):
+        fmt, params = "png", [cv2.IMWRITE_PNG_COMPRESSION, 6]   # JPEG smears 1-bit scans
+    elif fmt == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, OCR_IMAGE_QUALITY]
     else:
-        max_w = max(img.shape[1] for img in page_images)
-        padded = []
-        for img in page_images:
-            h, w = img.shape[:2]
-            if w < max_w:
-                img = np.hstack([img, np.ones((h, max_w - w, 3), dtype=np.uint8) * 255])
-            padded.append(img)
-        sep         = np.ones((10, max_w, 3), dtype=np.uint8) * 255
-        interleaved = []
-        for i, img in enumerate(padded):
-            interleaved.append(img)
-            if i < len(padded) - 1:
-                interleaved.append(sep)
-        stitched = np.vstack(interleaved)
-
-    ok, buf = cv2.imencode(".png", stitched)
+        params = [cv2.IMWRITE_WEBP_QUALITY, OCR_IMAGE_QUALITY]
+    ok, buf = cv2.imencode(f".{'jpg' if fmt == 'jpeg' else fmt}", img, params)
     if not ok:
-        raise ValueError("Failed to encode stitched PDF as PNG")
-    log("Stitched image size", f"{stitched.shape[1]}×{stitched.shape[0]} px")
-    return buf.tobytes()
+        raise ValueError(f"Failed to encode OCR image as {fmt}")
+    return buf.tobytes(), OCR_IMAGE_MIME[fmt]
+
 
+def preprocess_for_ocr(img: np.ndarray, source_bytes: Optional[int] = None) -> dict:
+    stats = {"decoded": img.nbytes}
+    if source_bytes is not None:
+        stats = {"source": source_bytes, **stats}
 
-def to_png_bytes(raw_bytes: bytes) -> bytes:
-    img = cv2.imdecode(np.frombuffer(raw_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if OCR_AUTOCROP:
+        img = autocrop_margins(img)
+        stats["cropped"] = img.nbytes
+
+    if OCR_COLOR_MODE != "color" and img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        stats["grayscale"] = img.nbytes
+
+    scale = model_scale(img.shape[1], img.shape[0])
+    if scale < 1.0:
+        img = cv2.resize(img, (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale))),
+                         interpolation=cv2.INTER_AREA)
+        stats["resized"] = img.nbytes
+
+    if OCR_COLOR_MODE == "binary":
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        img  = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15)
+
+    data, mime = encode_ocr_image(img)
+    stats["encoded"] = len(data)
+    stats["base64"]  = 4 * ((len(data) + 2) // 3)
+    return {"data": data, "mime": mime, "size": [img.shape[1], img.shape[0]], "bytes": stats}
+
+
+def sum_image_bytes(pages: list) -> dict:
+    totals: dict = {}
+    for page in pages:
+        for k, v in page.get("bytes", {}).items():
+            totals[k] = totals.get(k, 0) + v
+    return totals
+
+
+def _file_is_pdf(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        return is_pdf(f.read(4))
+
+
+def iter_file_page_images(file_path: str, pages: Optional[list] = None):
+    """
+    Like load_page_images, but lazy and without reading the file into bytes:
+    PyMuPDF opens PDFs by path and renders a page per next(); images are
+    decoded from an mmap.
+    """
+    if not _file_is_pdf(file_path):
+        yield _read_image_file(file_path)
+    elif OCR_PAGE_MODE == "stitched":
+        yield preprocess_for_ocr(pdf_to_stitched_array(file_path))
+    else:
+        yield from iter_pdf_page_images(file_path, pages)
+
+
+def _read_image_file(file_path: str) -> dict:
+    with open(file_path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            raise ValueError("Cannot decode image")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            buf = np.frombuffer(mm, np.uint8)
+            img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+            del buf                          # release the export before the mmap closes
+            size = len(mm)
     if img is None:
         raise ValueError("Cannot decode image")
-    ok, buf = cv2.imencode(".png", img)
-    if not ok:
-        raise ValueError("Failed to re-encode image as PNG")
-    return buf.tobytes()
+    return preprocess_for_ocr(img, source_bytes=size)
+
+
+def load_page_images(raw_bytes: bytes, pages: Optional[list] = None) -> list:
+    """Upload bytes → list of preprocessed OCR images (one per page, or per listed PDF page)."""
+    if not is_pdf(raw_bytes):
+        img = cv2.imdecode(np.frombuffer(raw_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Cannot decode image")
+        return [preprocess_for_ocr(img, source_bytes=len(raw_bytes))]
+    return _pdf_page_images(raw_bytes, pages)
+
+
+def _pdf_page_images(pdf, pages: Optional[list] = None) -> list:
+    if OCR_PAGE_MODE == "stitched":
+        return [preprocess_for_ocr(pdf_to_stitched_array(pdf))]
+    pages = pdf_to_page_images(pdf, pages)
+    log("OCR image bytes", sum_image_bytes(pages))
+    return pages
+
+
+# ─────────────────────────────────────────────────────────────
+# OCR STAGE CACHE  (content-addressed, on disk, LRU)
+# ─────────────────────────────────────────────────────────────
+#
+# Each stage is cached on its own, keyed by the hash of its input
+# (normalized page image for stage 1, markdown for stages 2 and 3)
+# plus MODEL, ENGINE_VERSION and that stage's prompt hash. Editing
+# one prompt therefore only invalidates that stage.
+
+class DiskLRUCache:
+    """JSON values stored one file per key, evicted least-recently-used past max_bytes."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root      = root
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._lock  = threading.Lock()
+        self._index = OrderedDict()   # key → size, least recently used first
+        self._size  = 0
+        if max_bytes > 0:
+            self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        entries = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".json"):
+                    st = os.stat(os.path.join(dirpath, name))
+                    entries.append((st.st_mtime, name[:-5], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size; self._size += size
+
+    def get(self, key: str):
+        if self.max_bytes <= 0:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+                self._size  -= self._index.pop(key, 0)
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._index:
+                self._index.move_to_end(key)
+        return value
+
+    def put(self, key: str, value):
+        if self.max_bytes <= 0:
+            return
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            log("⚠️ OCR cache write failed", repr(e))
+            return
+        with self._lock:
+            self._size -= self._index.pop(key, 0)
+            self._index[key] = len(data); self._size += len(data)
+            while self._size > self.max_bytes and len(self._index) > 1:
+                old_key, old_size = self._index.popitem(last=False)
+                self._size -= old_size; self.evictions += 1
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":   len(self._index),
+                "bytes":     self._size,
+                "maxBytes":  self.max_bytes,
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "evictions": self.evictions,
+                "hitRate":   round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+OCR_CACHE = DiskLRUCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES)
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def ocr_cache_key(stage: str, stage_input: bytes) -> str:
+    prompt_hash = sha256_hex(STAGE_PROMPTS[stage].encode("utf-8"))
+    return sha256_hex("|".join((
+        stage, MODEL, ENGINE_VERSION, prompt_hash, sha256_hex(stage_input),
+    )).encode("utf-8"))
+
+
+# ─────────────────────────────────────────────────────────────
+# UPLOAD STORE  (streamed, content-addressed, TTL)
+# ─────────────────────────────────────────────────────────────
+#
+# An upload is copied to UPLOAD_DIR/.tmp chunk by chunk while it is hashed,
+# then renamed to UPLOAD_DIR/<sha[:2]>/<sha><ext>. A second upload of the
+# same bytes drops its copy and refreshes the stored file's mtime, which is
+# what purge_uploads ages out. The name carries the hash, so later steps
+# (detection cache, OCR cache) never hash a stored upload again.
+
+UPLOAD_NAME_RE = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,8})?$")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def spool_upload(file: UploadFile, directory: Optional[str] = None,
+                       max_bytes: Optional[int] = None) -> tuple:
+    """Copy an upload to a temp file chunk by chunk while hashing it → (path, sha256, size)."""
+    digest, size = hashlib.sha256(), 0
+    fd, path = tempfile.mkstemp(suffix=".upload", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(f"upload exceeds {max_bytes} bytes")
+                digest.update(chunk); f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def _upload_ext(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,8}", ext) else ""
+
+
+async def store_upload(file: UploadFile) -> dict:
+    """Stream an upload into UPLOAD_DIR under its hash → {"filePath", "hash", "size", "deduplicated"}."""
+    tmp_dir = os.path.join(UPLOAD_DIR, ".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp, file_hash, size = await spool_upload(file, tmp_dir, UPLOAD_MAX_BYTES)
+    path = os.path.join(UPLOAD_DIR, file_hash[:2], file_hash + _upload_ext(file.filename))
+    try:
+        os.utime(path)                       # already stored: keep that copy alive
+        os.remove(tmp)
+        deduplicated = True
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+        deduplicated = False
+    return {"filePath": path, "hash": file_hash, "size": size, "deduplicated": deduplicated}
+
+
+def stored_upload_hash(file_path: str) -> Optional[str]:
+    """The SHA-256 a stored upload is named after, or None for any other path."""
+    m = UPLOAD_NAME_RE.match(os.path.basename(file_path))
+    return m.group(1) if m else None
+
+
+def file_sha256(path: str) -> str:
+    if stored := stored_upload_hash(path):
+        return stored
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def purge_uploads() -> int:
+    """Remove stored uploads not uploaded again for UPLOAD_TTL_SECONDS, and stale temp files."""
+    if not os.path.isdir(UPLOAD_DIR):
+        return 0
+    cutoff, removed = time.time() - UPLOAD_TTL_SECONDS, 0
+    for dirpath, _, files in os.walk(UPLOAD_DIR):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path); removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+# ─────────────────────────────────────────────────────────────
+# PDF TYPE DETECTION  (structure first, per page, cached by file hash)
+# ─────────────────────────────────────────────────────────────
+#
+# Each page is classified from its resources and content stream: no
+# fonts or no text operators → scanned if it draws an image or vector
+# paths (tablet handwriting is exported as ink strokes), digital only when
+# the page is truly empty. Text without images is digital. Only pages with both — a scan under an invisible OCR layer,
+# a typed page with a logo — get a coverage check and, if one image
+# fills most of the page, a text extraction to settle it.
+#
+# The result lives in OCR_CACHE under the file's hash, so the OCR job and
+# the export re-use it instead of parsing the PDF again.
+
+def pdf_kinds_cache_key(file_hash: str) -> str:
+    return sha256_hex("|".join((
+        "pdf-pages/2", ENGINE_VERSION, str(PDF_DETECT_IMAGE_COVER), str(PDF_DETECT_MIN_CHARS), file_hash,
+    )).encode("utf-8"))
+
+
+def _page_draws_text(page) -> bool:
+    if not page.get_fonts():
+        return False
+    # Text can also sit inside a form XObject; treat those pages as having text ops.
+    return b"BT" in page.read_contents() or bool(page.get_xobjects())
+
+
+def classify_pdf_page(page) -> str:
+    has_text   = _page_draws_text(page)
+    has_images = bool(page.get_images())
+    if not has_text:
+        return "scanned" if has_images or page.get_drawings() else "digital"   # digital: blank page
+    if not has_images:
+        return "digital"
+    area  = max(1.0, abs(page.rect))
+    cover = max((abs(fitz.Rect(info["bbox"]) & page.rect) / area for info in page.get_image_info()), default=0.0)
+    if cover < PDF_DETECT_IMAGE_COVER:
+        return "digital"
+    return "digital" if len(page.get_text().strip()) >= PDF_DETECT_MIN_CHARS else "scanned"
+
+
+def classify_pdf(file_path: str) -> dict:
+    """One pass over the file → {"pageCount", "pages": ["digital" | "scanned", ...]} (index = page - 1)."""
+    with fitz.open(file_path, filetype="pdf") as doc:
+        pages = [classify_pdf_page(page) for page in doc]
+    return {"pageCount": len(pages), "pages": pages}
+
+
+def pdf_page_kinds(file_path: str, file_hash: Optional[str] = None) -> dict:
+    """Per-page digital / scanned map for a PDF on disk, from OCR_CACHE when this file was seen before."""
+    file_hash = file_hash or file_sha256(file_path)
+    key       = pdf_kinds_cache_key(file_hash)
+    cached    = OCR_CACHE.get(key)
+    if cached is not None:
+        return cached
+    t0     = time.time()
+    result = {**classify_pdf(file_path), "hash": file_hash}
+    log("PDF pages classified", f"{result['pages'].count('scanned')} scanned / {result['pageCount']} "
+        f"in {round(time.time() - t0, 3)}s")
+    OCR_CACHE.put(key, result)
+    return result
 
 
 # ─────────────────────────────────────────────────────────────
 # STAGE 1 — VISUAL ANCHOR
 # ─────────────────────────────────────────────────────────────
 
-def stage1_extract_markdown(image_bytes: bytes) -> str:
-    log("STAGE 1 — Visual Anchor")
-    t0  = time.time()
-    b64 = base64.b64encode(image_bytes).decode("utf-8")
+STAGE1_SYSTEM = "You are a precise document transcription engine. Return clean Markdown only."
 
-    prompt = """Transcribe this document EXACTLY into Markdown.
+STAGE1_PROMPT = """Transcribe this document EXACTLY into Markdown.
 
 Rules:
 - Preserve ALL text exactly as written. Do not paraphrase or summarize.
@@ -230,20 +1180,35 @@ CRITICAL RULES TO PREVENT HALLUCINATION:
 - If ANY word is blurry or illegible, write [?] — do NOT guess.
 - Output ONLY the Markdown. No explanation. No commentary."""
 
+
+async def stage1_extract_markdown(image_bytes: bytes, on_partial=None, mime: str = "image/png") -> str:
+    log("STAGE 1 — Visual Anchor")
+    key    = ocr_cache_key("stage1", image_bytes)
+    cached = OCR_CACHE.get(key)
+    if cached is not None:
+        log("STAGE 1 cache hit", key[:12])
+        return cached["markdown"]
+
+    t0  = time.time()
+    b64 = base64.b64encode(image_bytes).decode("utf-8")
+
     payload = {
         "model": MODEL, "temperature": 0, "max_tokens": 4000,
         "messages": [
-            {"role": "system", "content": "You are a precise document transcription engine. Return clean Markdown only."},
+            {"role": "system", "content": STAGE1_SYSTEM},
             {"role": "user", "content": [
-                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64}"}},
-                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}},
+                {"type": "text", "text": STAGE1_PROMPT},
             ]},
         ],
     }
-    res = requests.post(OPENROUTER_URL, headers=OCR_HEADERS, json=payload, timeout=90)
-    res.raise_for_status()
-    result = res.json()["choices"][0]["message"]["content"]
+    if OCR_STREAM_STAGE1:
+        result = await openrouter_chat_stream(payload, on_delta=on_partial, stop_marker=TRUNCATION_MARKER)
+    else:
+        result = await openrouter_chat(payload)
     log("STAGE 1 done", f"{round(time.time()-t0, 2)}s | {len(result)} chars")
+    if result.strip():
+        OCR_CACHE.put(key, {"markdown": result})
     return result
 
 
@@ -261,11 +1226,9 @@ def extract_json_safe(text: str) -> dict:
         return {}
 
 
-def stage2_audit(raw_markdown: str) -> dict:
-    log("STAGE 2 — Auditor")
-    t0 = time.time()
+STAGE2_SYSTEM = "Return clean structured JSON only."
 
-    prompt = f"""You are a strict document auditor. Analyze the transcription below and return a JSON report.
+STAGE2_PROMPT = """You are a strict document auditor. Analyze the transcription below and return a JSON report.
 
 TRANSCRIPTION:
 ```
@@ -301,19 +1264,30 @@ Return ONLY this exact JSON (no extra text, no code fences):
   "corrected_markdown": "<full corrected Markdown — remove any POTENTIAL_FABRICATION from the end>"
 }}"""
 
+
+async def stage2_audit(raw_markdown: str) -> dict:
+    log("STAGE 2 — Auditor")
+    key    = ocr_cache_key("stage2", raw_markdown.encode("utf-8"))
+    cached = OCR_CACHE.get(key)
+    if cached is not None:
+        log("STAGE 2 cache hit", key[:12])
+        return cached
+
+    t0 = time.time()
+
     payload = {
         "model": MODEL, "temperature": 0, "max_tokens": 4000,
         "messages": [
-            {"role": "system", "content": "Return clean structured JSON only."},
-            {"role": "user",   "content": prompt},
+            {"role": "system", "content": STAGE2_SYSTEM},
+            {"role": "user",   "content": STAGE2_PROMPT.format(raw_markdown=raw_markdown)},
         ],
     }
-    res    = requests.post(OPENROUTER_URL, headers=OCR_HEADERS, json=payload, timeout=90)
-    res.raise_for_status()
-    result = extract_json_safe(res.json()["choices"][0]["message"]["content"])
+    result = extract_json_safe(await openrouter_chat(payload))
     risk   = result.get("hallucination_risk", "?").upper()
     log(f"STAGE 2 done {'🟢' if risk=='LOW' else '🟡' if risk=='MEDIUM' else '🔴'}",
         f"{round(time.time()-t0, 2)}s | risk={risk} | issues={len(result.get('issues_found', []))}")
+    if result:
+        OCR_CACHE.put(key, result)
     return result
 
 
@@ -321,11 +1295,9 @@ Return ONLY this exact JSON (no extra text, no code fences):
 # STAGE 3 — TIPTAP JSON
 # ─────────────────────────────────────────────────────────────
 
-def stage3_to_tiptap(markdown: str) -> dict:
-    log("STAGE 3 — TipTap JSON")
-    t0 = time.time()
+STAGE3_SYSTEM = "Return valid TipTap JSON only."
 
-    prompt = f"""Convert the following Markdown into a TipTap editor JSON document.
+STAGE3_PROMPT = """Convert the following Markdown into a TipTap editor JSON document.
 
 Rules:
 - Root node: {{ "type": "doc", "content": [...] }}
@@ -340,102 +1312,796 @@ Rules:
 MARKDOWN:
 {markdown}"""
 
+
+async def stage3_to_tiptap_llm(markdown: str) -> dict:
+    log("STAGE 3 — TipTap JSON (LLM)")
+    key    = ocr_cache_key("stage3", markdown.encode("utf-8"))
+    cached = OCR_CACHE.get(key)
+    if cached is not None:
+        log("STAGE 3 cache hit", key[:12])
+        return cached
+
+    t0 = time.time()
+
     payload = {
         "model": MODEL, "temperature": 0, "max_tokens": 4000,
         "messages": [
-            {"role": "system", "content": "Return valid TipTap JSON only."},
-            {"role": "user",   "content": prompt},
+            {"role": "system", "content": STAGE3_SYSTEM},
+            {"role": "user",   "content": STAGE3_PROMPT.format(markdown=markdown)},
         ],
     }
-    res = requests.post(OPENROUTER_URL, headers=OCR_HEADERS, json=payload, timeout=90)
-    res.raise_for_status()
-    doc = extract_json_safe(res.json()["choices"][0]["message"]["content"])
+    doc = extract_json_safe(await openrouter_chat(payload))
     if doc.get("type") != "doc":
         doc = {"type": "doc", "content": doc.get("content", [])}
     log("STAGE 3 done", f"{round(time.time()-t0, 2)}s")
+    if doc.get("content"):
+        OCR_CACHE.put(key, doc)
+    return doc
+
+
+# ── Local Markdown → TipTap converter ────────────────────────
+#
+# Emits only the node / mark types listed in STAGE3_PROMPT. Every
+# non-blank source line becomes its own paragraph: transcriptions use
+# single newlines for real line breaks (addresses, signature blocks),
+# and render_node already treats extra paragraphs inside a listItem as
+# continuation lines.
+
+MD_HR_RE        = re.compile(r"^\s{0,3}([-*])(?:\s*\1){2,}\s*$")   # not "_": STAGE1_PROMPT writes blanks as ____
+MD_HEADING_RE   = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)(?:\s+#+)?\s*$")
+MD_LIST_RE      = re.compile(r"^(\s*)(?:([-*+])|(\d{1,9})[.)])\s+(.*)$")
+MD_QUOTE_RE     = re.compile(r"^\s{0,3}>\s?(.*)$")
+MD_FENCE_RE     = re.compile(r"^\s{0,3}(```|~~~)")
+MD_TABLE_SEP_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$")
+MD_INLINE_RE    = re.compile(
+    r"(?P<c>`(?P<c_t>[^`]+)`)"   # code: no code mark in STAGE3_PROMPT, kept as literal text
+    r"|(?P<bi>\*\*\*(?=\S)(?P<bi_t>.+?)(?<=\S)\*\*\*)"
+    r"|(?P<b>\*\*(?=\S)(?P<b_t>.+?)(?<=\S)\*\*)"
+    r"|(?P<b2>(?<![\w_])__(?=[^\s_])(?P<b2_t>.+?)(?<=[^\s_])__(?![\w_]))"
+    r"|(?P<s>~~(?=\S)(?P<s_t>.+?)(?<=\S)~~)"
+    r"|(?P<u><u>(?P<u_t>.+?)</u>)"
+    r"|(?P<i>\*(?=[^\s*])(?P<i_t>.+?)(?<=[^\s*])\*)"
+    r"|(?P<i2>(?<![\w_])_(?=[^\s_])(?P<i2_t>.+?)(?<=[^\s_])_(?![\w_]))"
+)
+MD_INLINE_MARKS = {"bi": ("bold", "italic"), "b": ("bold",), "b2": ("bold",),
+                   "s": ("strike",), "u": ("underline",), "i": ("italic",), "i2": ("italic",)}
+MD_MARK_ORDER   = ("bold", "italic", "underline", "strike")
+MD_ESCAPE_RE    = re.compile(r"\\([\\`*_{}\[\]()#+\-.!~|><])")
+MD_ESCAPED_RE   = re.compile("[\ue000-\ue07f]")   # escaped chars parked in the private-use area
+
+
+def _md_text_nodes(text: str, marks: tuple, out: list):
+    pos = 0
+    for m in MD_INLINE_RE.finditer(text):
+        if m.start() > pos:
+            _md_append_text(text[pos:m.start()], marks, out)
+        kind = m.lastgroup
+        if kind == "c":
+            _md_append_text(m.group("c_t"), marks, out)
+            pos = m.end(); continue
+        inner_marks = tuple(sorted(set(marks) | set(MD_INLINE_MARKS[kind]), key=MD_MARK_ORDER.index))
+        _md_text_nodes(m.group(f"{kind}_t"), inner_marks, out)
+        pos = m.end()
+    if pos < len(text):
+        _md_append_text(text[pos:], marks, out)
+
+
+def _md_append_text(text: str, marks: tuple, out: list):
+    text = MD_ESCAPED_RE.sub(lambda m: chr(ord(m.group()) - 0xE000), text)
+    if not text:
+        return
+    if out and tuple(m["type"] for m in out[-1].get("marks", [])) == marks:
+        out[-1]["text"] += text
+        return
+    node = {"type": "text", "text": text}
+    if marks:
+        node["marks"] = [{"type": m} for m in marks]
+    out.append(node)
+
+
+def parse_inline_markdown(text: str) -> list:
+    """Inline Markdown → list of TipTap text nodes (bold / italic / underline / strike)."""
+    out: list = []
+    text = MD_ESCAPE_RE.sub(lambda m: chr(0xE000 + ord(m.group(1))), text.strip())
+    _md_text_nodes(text, (), out)
+    return out
+
+
+def _md_paragraph(text: str) -> dict:
+    content = parse_inline_markdown(text)
+    return {"type": "paragraph", "content": content} if content else {"type": "paragraph"}
+
+
+def _md_split_row(line: str) -> list:
+    row = line.strip()
+    if row.startswith("|"): row = row[1:]
+    if row.endswith("|") and not row.endswith("\\|"): row = row[:-1]
+    return [c.strip().replace("\\|", "|") for c in re.split(r"(?<!\\)\|", row)]
+
+
+def _md_table(lines: list) -> Optional[dict]:
+    """None when every line is a |---| separator: there is nothing to put in the table."""
+    has_header = len(lines) > 1 and MD_TABLE_SEP_RE.match(lines[1]) is not None
+    rows  = [_md_split_row(l) for l in lines if not MD_TABLE_SEP_RE.match(l)]
+    if not rows:
+        return None
+    width = max(len(r) for r in rows)
+    content = []
+    for r_idx, cells in enumerate(rows):
+        cell_type = "tableHeader" if (has_header and r_idx == 0) else "tableCell"
+        cells    += [""] * (width - len(cells))
+        content.append({"type": "tableRow", "content": [
+            {"type": cell_type, "content": [_md_paragraph(c)]} for c in cells
+        ]})
+    return {"type": "table", "content": content}
+
+
+def _md_is_table_line(line: str) -> bool:
+    return line.lstrip().startswith("|") and line.count("|") >= 2
+
+
+def _md_list(lines: list, i: int) -> tuple:
+    """Parse one (possibly nested) list starting at lines[i] → (node, next_index)."""
+    first   = MD_LIST_RE.match(lines[i])
+    indent  = len(first.group(1).expandtabs(4))
+    ordered = first.group(3) is not None
+    node    = {"type": "orderedList" if ordered else "bulletList"}
+    if ordered and int(first.group(3)) != 1:
+        node["attrs"] = {"start": int(first.group(3))}
+    node["content"] = []
+
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            j = i
+            while j < len(lines) and not lines[j].strip():
+                j += 1
+            if j == len(lines):
+                return node, j
+            nxt = MD_LIST_RE.match(lines[j])
+            nxt_indent = len(lines[j]) - len(lines[j].lstrip())
+            if not (nxt and len(nxt.group(1).expandtabs(4)) == indent) and nxt_indent <= indent:
+                return node, i
+            i = j
+            continue
+
+        m = MD_LIST_RE.match(line)
+        line_indent = len(line.expandtabs(4)) - len(line.expandtabs(4).lstrip())
+        if m and line_indent == indent and not MD_HR_RE.match(line):
+            if (m.group(3) is not None) != ordered:
+                return node, i
+            node["content"].append({"type": "listItem", "content": [_md_paragraph(m.group(4))]})
+            i += 1
+        elif m and line_indent > indent and node["content"] and not MD_HR_RE.match(line):
+            child, i = _md_list(lines, i)
+            node["content"][-1]["content"].append(child)
+        elif line_indent > indent and node["content"]:
+            node["content"][-1]["content"].append(_md_paragraph(line))
+            i += 1
+        else:
+            return node, i
+    return node, i
+
+
+def iter_markdown_blocks(lines: list):
+    """Yield top-level TipTap block nodes one at a time as the Markdown lines are consumed."""
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip() or MD_FENCE_RE.match(line):
+            i += 1
+            continue
+        if MD_HR_RE.match(line):
+            yield {"type": "horizontalRule"}
+            i += 1
+            continue
+        m = MD_HEADING_RE.match(line)
+        if m:
+            content = parse_inline_markdown(m.group(2))
+            node    = {"type": "heading", "attrs": {"level": len(m.group(1))}}
+            if content:
+                node["content"] = content
+            yield node
+            i += 1
+            continue
+        if _md_is_table_line(line):
+            j = i
+            while j < len(lines) and _md_is_table_line(lines[j]):
+                j += 1
+            table = _md_table(lines[i:j])
+            if table:
+                yield table
+            i = j
+            continue
+        if MD_QUOTE_RE.match(line):
+            j = i
+            while j < len(lines) and MD_QUOTE_RE.match(lines[j]):
+                j += 1
+            inner = [MD_QUOTE_RE.match(l).group(1) for l in lines[i:j]]
+            yield {"type": "blockquote", "content": list(iter_markdown_blocks(inner)) or [{"type": "paragraph"}]}
+            i = j
+            continue
+        if MD_LIST_RE.match(line):
+            node, i = _md_list(lines, i)
+            yield node
+            continue
+        yield _md_paragraph(line)
+        i += 1
+
+
+def markdown_to_tiptap(markdown: str) -> dict:
+    return {"type": "doc", "content": list(iter_markdown_blocks(markdown.splitlines()))}
+
+
+async def stage3_to_tiptap(markdown: str) -> dict:
+    if STAGE3_MODE == "llm":
+        return await stage3_to_tiptap_llm(markdown)
+    log("STAGE 3 — TipTap JSON (local)")
+    t0  = time.time()
+    doc = markdown_to_tiptap(markdown)
+    log("STAGE 3 done", f"{round((time.time()-t0) * 1000, 1)}ms | {len(doc['content'])} blocks")
     return doc
 
 
+STAGE_PROMPTS = {
+    "stage1": STAGE1_SYSTEM + STAGE1_PROMPT,
+    "stage2": STAGE2_SYSTEM + STAGE2_PROMPT,
+    "stage3": STAGE3_SYSTEM + STAGE3_PROMPT,
+}
+
+
+# ─────────────────────────────────────────────────────────────
+# TEXT-LAYER PAGES  (hybrid routing)
+# ─────────────────────────────────────────────────────────────
+#
+# Pages classified "digital" by pdf_page_kinds are read with the same
+# span extraction as the layout export and written back as Markdown, so
+# they join the OCR'd pages in the merged markdown that stage 3 converts
+# once. Each one saves the stage 1 and stage 2 calls.
+
+LLM_CALLS_PER_OCR_PAGE = 2   # stage 1 + stage 2; stage 3 runs once per document either way
+
+MD_SPECIAL_RE    = re.compile(r"([\\`*_~|<>#\[\]])")
+MD_LINE_START_RE = re.compile(r"^([-+]|\d+(?=[.)]))")   # would open a list
+
+
+def _md_escape(text: str) -> str:
+    return MD_SPECIAL_RE.sub(r"\\\1", text)
+
+
+def _md_inline(content: list) -> str:
+    out = []
+    for node in content:
+        text  = node.get("text", "")
+        marks = {m["type"] for m in node.get("marks", [])}
+        core  = text.strip()
+        wrap  = "***" if {"bold", "italic"} <= marks else "**" if "bold" in marks else "*" if "italic" in marks else ""
+        if not core or not wrap:
+            out.append(_md_escape(text)); continue
+        lead, trail = text[:len(text) - len(text.lstrip())], text[len(text.rstrip()):]
+        out.append(f"{lead}{wrap}{_md_escape(core)}{wrap}{trail}")
+    line = "".join(out).replace("\n", " ").strip()
+    return MD_LINE_START_RE.sub(lambda m: "\\" + m.group() if not m.group().isdigit() else m.group() + "\\", line, count=1)
+
+
+def tiptap_nodes_to_markdown(nodes: list) -> str:
+    """Markdown for the heading / paragraph / table nodes pdf_pages_to_tiptap emits."""
+    blocks = []
+    for node in nodes:
+        kind = node.get("type")
+        if kind == "heading":
+            blocks.append("#" * node.get("attrs", {}).get("level", 1) + " " + _md_inline(node.get("content", [])))
+        elif kind == "table":
+            rows = [[_md_inline(cell["content"][0].get("content", [])) for cell in row["content"]]
+                    for row in node.get("content", [])]
+            lines = ["| " + " | ".join(row) + " |" for row in rows]
+            lines.insert(1, "|" + "---|" * len(rows[0]))
+            blocks.append("\n".join(lines))
+        else:
+            text = _md_inline(node.get("content", []))
+            if text:
+                blocks.append(text)
+    return "\n\n".join(blocks)
+
+
+def pdf_text_page_markdown(file_path: str, pages: list) -> dict:
+    """{1-based page: markdown} for the given 0-based text-layer pages, headings judged against the whole document."""
+    body = pdf_body_size(file_path) if pages else None
+    return {i + 1: tiptap_nodes_to_markdown(pdf_pages_to_tiptap(file_path, i, i + 1, body)) for i in pages}
+
+
 # ─────────────────────────────────────────────────────────────
 # PIPELINE ORCHESTRATOR
 # ─────────────────────────────────────────────────────────────
 
+PAGE_SEPARATOR = "\n\n---\n\n"   # between pages in the merged markdown
+
+
 def strip_truncated(markdown: str) -> str:
     """
     Hard enforcement: cut everything at and after [DOCUMENT TRUNCATED].
     Also trims any trailing sentence that ends with an em-dash or mid-word,
     which are tell-tale signs of fabricated completions.
     """
-    marker = "[DOCUMENT TRUNCATED]"
+    marker = TRUNCATION_MARKER
     if marker in markdown:
         markdown = markdown[:markdown.index(marker)].rstrip()
         log("⚠️ TRUNCATION MARKER found — content cut at that point")
     return markdown
 
 
-def parse_document(image_bytes: bytes) -> dict:
-    try:
-        log("START parse_document", f"bytes={len(image_bytes)}")
-        t0 = time.time()
-
-        raw_markdown = stage1_extract_markdown(image_bytes)
-        if not raw_markdown.strip():
-            raise ValueError("Stage 1 returned empty markdown")
+class PipelineProgress:
+    """
+    Tracks stage timings for one pipeline run. Stages: render, stage1,
+    stage2, stage3. With per-page OCR stage 1/2 overlap across pages, so a
+    stage's timing is the wall time from its first start to its last finish.
+    """
 
-        # Hard-strip any truncation marker before auditing
-        raw_markdown = strip_truncated(raw_markdown)
+    def __init__(self):
+        self.stage      = None
+        self.pages      = 0
+        self.pages_done = 0
+        self.timings: dict = {}
+        self._started: dict = {}
+        self._page_markdown: dict = {}
+        self._page_draft: dict = {}
+        self._draft_published: dict = {}
+        self._prefix: list = []       # non-empty markdown of pages 1.._prefix_next-1
+        self._prefix_next  = 1
+        self._prefix_chars = 0        # len() of the prefix joined with PAGE_SEPARATOR
+
+    def stage_started(self, stage: str, page: Optional[int] = None):
+        self._started.setdefault(stage, time.time())
+        self.stage = stage
+        self.publish(page=page)
+
+    def stage_finished(self, stage: str, page: Optional[int] = None):
+        self.timings[stage] = round(time.time() - self._started.get(stage, time.time()), 3)
+        self.publish(page=page)
+
+    def page_partial(self, page: int, text: str):
+        """Streaming stage-1 text for a page; published at most every OCR_STREAM_PUBLISH_INTERVAL."""
+        for k in range(len(TRUNCATION_MARKER) - 1, 0, -1):   # hide a half-streamed marker
+            if text.endswith(TRUNCATION_MARKER[:k]):
+                text = text[:-k]; break
+        self._page_draft[page] = text
+        now = time.time()
+        if now - self._draft_published.get(page, 0) >= OCR_STREAM_PUBLISH_INTERVAL:
+            self._draft_published[page] = now
+            self.publish(page=page, partial=True)
+
+    def page_done(self, page: int, markdown: str):
+        self.pages_done += 1
+        self._page_markdown[page] = markdown
+        while self._prefix_next in self._page_markdown:
+            md = self._page_markdown[self._prefix_next]
+            if md.strip():
+                self._prefix_chars += len(md) + (len(PAGE_SEPARATOR) if self._prefix else 0)
+                self._prefix.append(md)
+            self._prefix_next += 1
+        self.publish(page=page, partial=True)
+
+    def _partial_parts(self) -> list:
+        draft = self._page_draft.get(self._prefix_next, "")
+        return self._prefix + [draft] if draft.strip() else self._prefix
+
+    def partial_markdown(self) -> str:
+        """
+        Verified markdown of the pages finished so far, in order, stopping at
+        the first gap; that page's streaming draft (if any) is appended last.
+        """
+        return PAGE_SEPARATOR.join(self._partial_parts())
+
+    def partial_tail(self, limit: int) -> tuple:
+        """(offset, text): the last `limit` chars of partial_markdown(), built from the end in O(limit)."""
+        parts = self._partial_parts()
+        total = self._prefix_chars
+        if len(parts) > len(self._prefix):
+            total += len(parts[-1]) + (len(PAGE_SEPARATOR) if self._prefix else 0)
+        tail, size = [], 0
+        for part in reversed(parts):
+            tail.append(part); size += len(part) + len(PAGE_SEPARATOR)
+            if size >= limit:
+                break
+        text = PAGE_SEPARATOR.join(reversed(tail))[-limit:] if limit > 0 else ""
+        return total - len(text), text
+
+    def snapshot(self, page: Optional[int] = None) -> dict:
+        return {"stage": self.stage, "page": page, "pages": self.pages,
+                "pagesDone": self.pages_done, "timings": dict(self.timings)}
+
+    def publish(self, page: Optional[int] = None, partial: bool = False):
+        pass
 
-        audit             = stage2_audit(raw_markdown)
-        risk              = audit.get("hallucination_risk", "low")
-        verified_markdown = audit.get("corrected_markdown") or raw_markdown
-        if not verified_markdown.strip():
-            verified_markdown = raw_markdown
 
-        # Hard-strip again in case auditor reintroduced or missed the marker
-        verified_markdown = strip_truncated(verified_markdown)
+class JobProgress(PipelineProgress):
+    """
+    Publishes progress onto the job record, which /api/job-status and
+    /api/job-events read. Only the last JOB_PARTIAL_TAIL_CHARS of the partial
+    markdown are stored (partialOffset says where they start), so a write
+    costs the same on page 200 as on page 1. Writes run in a thread, one in
+    flight per job; snapshots published meanwhile are merged into the next.
+    """
 
-        doc           = stage3_to_tiptap(verified_markdown)
+    def __init__(self, jobId: str):
+        super().__init__()
+        self.jobId    = jobId
+        self._updates: dict = {}
+        self._writer: Optional[asyncio.Task] = None
+
+    def publish(self, page: Optional[int] = None, partial: bool = False):
+        self._updates.update(stage=self.stage, progress=self.snapshot(page))
+        if partial:
+            offset, tail = self.partial_tail(JOB_PARTIAL_TAIL_CHARS)
+            self._updates.update(partialMarkdown=tail, partialOffset=offset)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._write())
+
+    async def _write(self):
+        while self._updates:
+            updates, self._updates = self._updates, {}
+            try:
+                await asyncio.to_thread(update_job, self.jobId, **updates)
+            except Exception as e:
+                log("⚠️ Progress write failed", repr(e))
+
+    async def flush(self):
+        """Wait until every published snapshot is in the store (before the final state write)."""
+        while self._writer is not None and not self._writer.done():
+            await self._writer
+
+
+RISK_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+
+async def ocr_page(image: dict, page_no: int = 1, progress: Optional[PipelineProgress] = None) -> tuple:
+    """Stage 1 + Stage 2 for one image → (verified_markdown, audit)."""
+    progress = progress or PipelineProgress()
+    progress.stage_started("stage1", page_no)
+    raw_markdown = await stage1_extract_markdown(
+        image["data"], on_partial=lambda text: progress.page_partial(page_no, text), mime=image["mime"])
+    progress.stage_finished("stage1", page_no)
+
+    # Hard-strip any truncation marker before auditing
+    raw_markdown = strip_truncated(raw_markdown)
+    if not raw_markdown.strip():
+        # Separator sheet / empty back side: nothing to audit, and no reason to fail the job
+        log("Stage 1 found no text", f"page {page_no}")
+        progress.page_done(page_no, "")
+        return "", {"hallucination_risk": "low", "issues_found": ["Blank page: no text recognised"]}
+
+    progress.stage_started("stage2", page_no)
+    audit             = await stage2_audit(raw_markdown)
+    progress.stage_finished("stage2", page_no)
+    verified_markdown = audit.get("corrected_markdown") or raw_markdown
+    if not verified_markdown.strip():
+        verified_markdown = raw_markdown
+
+    # Hard-strip again in case auditor reintroduced or missed the marker
+    verified_markdown = strip_truncated(verified_markdown)
+    progress.page_done(page_no, verified_markdown)
+    return verified_markdown, audit
+
+
+def merge_page_audits(audits: list, page_numbers: Optional[list] = None) -> dict:
+    """Combine per-page audit reports; issues are prefixed with their page number."""
+    if len(audits) == 1 and not page_numbers:
+        a = audits[0]
+        return {
+            "hallucination_risk": a.get("hallucination_risk", "low"),
+            "issues_found":       a.get("issues_found", []),
+            "corrections_made":   a.get("corrections_made", []),
+            "illegible_fields":   a.get("illegible_fields", []),
+        }
+    merged = {"hallucination_risk": "low", "issues_found": [], "corrections_made": [], "illegible_fields": []}
+    for page_no, a in zip(page_numbers or range(1, len(audits) + 1), audits):
+        risk = str(a.get("hallucination_risk", "low")).lower()
+        if RISK_ORDER.get(risk, 0) > RISK_ORDER[merged["hallucination_risk"]]:
+            merged["hallucination_risk"] = risk
+        for key in ("issues_found", "corrections_made", "illegible_fields"):
+            merged[key].extend(f"Page {page_no}: {item}" for item in a.get(key, []) or [])
+    return merged
+
+
+async def parse_pages(page_images, progress: Optional[PipelineProgress] = None,
+                      text_pages: Optional[dict] = None, page_count: Optional[int] = None) -> dict:
+    """
+    Run stage 1 + 2 for every page concurrently (bounded by OCR_PAGE_WORKERS),
+    merge the verified markdown in page order with --- separators, then run
+    stage 3 once on the merged markdown. `text_pages` ({page: markdown}, from
+    the PDF's text layer) skip stage 1 + 2 and are merged in at their page.
+
+    `page_images` is a list, or an iterator that renders lazily (pass
+    `page_count`): a sync one is advanced in a thread, an async one (e.g.
+    aiter_pdf_page_images) awaited, and only when a slot frees up, so at
+    most OCR_PAGE_WORKERS page images wait on OCR at once.
+    """
+    text_pages = text_pages or {}
+    lazy       = not isinstance(page_images, list)
+    is_async   = hasattr(page_images, "__anext__")
+    images     = page_images if is_async else iter(page_images)
+    tasks: list = []
+    try:
+        page_count = len(page_images) if page_count is None else page_count
+        log("START parse_pages", f"pages={page_count} | text-layer={len(text_pages)} | lazy={lazy}")
+        t0 = time.time()
+        progress = progress or PipelineProgress()
+        progress.pages = page_count + len(text_pages)
+        for page_no, md in sorted(text_pages.items()):
+            progress.page_done(page_no, md)
+
+        page_slots = asyncio.Semaphore(max(1, OCR_PAGE_WORKERS))
+
+        async def _run(image, page_no):
+            try:
+                return await ocr_page(image, page_no, progress)
+            finally:
+                page_slots.release()
+
+        # render_seconds: time spent rasterizing + encoding, summed over pages;
+        # render_wait_seconds: time OCR sat waiting on the hand-off. Throughput
+        # is pages over the render stage's wall time minus the time it was held
+        # back by busy OCR slots; per-worker throughput is pages / render_seconds.
+        numbers, image_bytes = [], []
+        rendered, render_seconds, render_wait, slot_wait = 0, 0.0, 0.0, 0.0
+        r0 = time.perf_counter()
+        if lazy:
+            progress.stage_started("render")
+        while not any(t.done() and not t.cancelled() and t.exception() for t in tasks):
+            w0 = time.perf_counter()
+            await page_slots.acquire()
+            w1 = time.perf_counter()
+            if is_async:
+                image = await anext(images, None)
+            else:
+                image = await asyncio.to_thread(next, images, None) if lazy else next(images, None)
+            slot_wait   += w1 - w0
+            render_wait += time.perf_counter() - w1
+            if image is None:
+                page_slots.release()
+                break
+            if "renderSeconds" in image:
+                rendered += 1; render_seconds += image.pop("renderSeconds")
+            numbers.append(image.get("page", len(numbers) + 1))
+            image_bytes.append({"bytes": image.get("bytes", {})})
+            tasks.append(asyncio.create_task(_run(image, numbers[-1])))
+            del image
+        if lazy:
+            render_wall = time.perf_counter() - r0 - slot_wait
+            progress.timings["render_wait_seconds"] = round(render_wait, 3)
+            if rendered and render_seconds > 0:
+                progress.timings["render_seconds"]                 = round(render_seconds, 3)
+                progress.timings["render_pages_per_second"]        = round(rendered / max(render_wall, 1e-6), 2)
+                progress.timings["render_worker_pages_per_second"] = round(rendered / render_seconds, 2)
+            progress.stage_finished("render")
+        results = await asyncio.gather(*tasks)
+
+        by_page  = {**text_pages, **{n: md for n, (md, _) in zip(numbers, results)}}
+        markdown = PAGE_SEPARATOR.join(by_page[n] for n in sorted(by_page) if by_page[n].strip())
+        if not markdown.strip():
+            raise ValueError("No text recognised on any page")
+        audit    = merge_page_audits([a for _, a in results], numbers if text_pages else None)
+
+        progress.stage_started("stage3")
+        doc           = await stage3_to_tiptap(markdown)
+        progress.stage_finished("stage3")
         total_elapsed = round(time.time() - t0, 2)
-        log("SUCCESS parse_document", f"total={total_elapsed}s | risk={risk}")
+        log("SUCCESS parse_pages", f"total={total_elapsed}s | risk={audit['hallucination_risk']}")
 
         doc["_audit"] = {
-            "hallucination_risk": risk,
-            "issues_found":       audit.get("issues_found", []),
-            "corrections_made":   audit.get("corrections_made", []),
-            "illegible_fields":   audit.get("illegible_fields", []),
-            "pipeline_seconds":   total_elapsed,
-            "engine_version":     ENGINE_VERSION,
+            **audit,
+            "pages":            progress.pages,
+            "text_layer_pages": sorted(text_pages),
+            "llm_calls_avoided": LLM_CALLS_PER_OCR_PAGE * len(text_pages),
+            "timings":          progress.timings,
+            "image_bytes":      sum_image_bytes(image_bytes),
+            "pipeline_seconds": total_elapsed,
+            "engine_version":   ENGINE_VERSION,
         }
         return doc
     except Exception as e:
-        log("❌ ERROR in parse_document", repr(e))
+        log("❌ ERROR in parse_pages", repr(e))
         traceback.print_exc()
         raise
+    finally:
+        for task in tasks:
+            task.cancel()                    # no-op unless a sibling page failed
+        try:
+            if is_async:
+                await images.aclose()
+            else:
+                getattr(images, "close", lambda: None)()
+        except ValueError:                   # still rendering in its thread; it finishes on its own
+            pass
 
 
-def run_ocr_job(jobId: str):
+async def run_ocr_job(jobId: str):
+    progress = None
     try:
         log("JOB START", jobId)
-        job = load_job(jobId)
+        job = await asyncio.to_thread(load_job, jobId)
         if not job:
             raise RuntimeError("Job not found")
-        update_job(jobId, state="processing")
+        if not await asyncio.to_thread(transition_job, jobId, ("queued", "uploaded"), state="processing"):
+            log("JOB SKIPPED (already picked up)", jobId)
+            return
 
         file_path = job.get("filePath")
         if not file_path or not os.path.exists(file_path):
             raise RuntimeError("File path missing or invalid")
 
-        with open(file_path, "rb") as f:
-            raw_bytes = f.read()
-
-        image_bytes = pdf_to_image_bytes(raw_bytes) if is_pdf(raw_bytes) else to_png_bytes(raw_bytes)
-        document    = parse_document(image_bytes)
-
-        update_job(jobId, state="ready", contentJson=document)
+        progress = JobProgress(jobId)
+        progress.stage_started("render")
+        scanned, text_pages, over_budget = None, {}, 0
+        if OCR_PAGE_MODE == "per-page" and _file_is_pdf(file_path):
+            if OCR_HYBRID:
+                kinds = (await asyncio.to_thread(pdf_page_kinds, file_path))["pages"]
+            else:
+                kinds = ["scanned"] * await asyncio.to_thread(pdf_page_count, file_path)
+            over_budget = max(0, len(kinds) - OCR_PAGE_BUDGET)
+            kinds       = kinds[:OCR_PAGE_BUDGET]
+            scanned     = [i for i, kind in enumerate(kinds) if kind == "scanned"]
+            text_pages  = await asyncio.to_thread(
+                pdf_text_page_markdown, file_path, [i for i, kind in enumerate(kinds) if kind == "digital"])
+            empty = [n for n, md in text_pages.items() if not md.strip()]
+            if empty:   # text layer yielded nothing (e.g. ink drawn as paths): OCR those pages instead
+                log("Empty text-layer pages sent to OCR", f"{jobId}: {empty}")
+                scanned    = sorted(scanned + [n - 1 for n in empty])
+                text_pages = {n: md for n, md in text_pages.items() if md.strip()}
+            if over_budget:
+                log("⚠️ Page budget reached", f"{jobId}: {over_budget} pages past {OCR_PAGE_BUDGET} skipped")
+        if scanned is not None and RENDER_POOL.workers:
+            page_images = aiter_pdf_page_images(file_path, scanned)
+        else:
+            page_images = iter_file_page_images(file_path, scanned)   # rendered as OCR slots free up
+        document    = await parse_pages(page_images, progress, text_pages,
+                                        page_count=1 if scanned is None else len(scanned))
+        document["_audit"]["pages_over_budget"] = over_budget
+
+        await progress.flush()
+        await asyncio.to_thread(update_job, jobId, state="ready", contentJson=document,
+                                llmCallsAvoided=document["_audit"]["llm_calls_avoided"])
         log("JOB DONE", jobId)
     except Exception as e:
         log("JOB ERROR", repr(e))
-        update_job(jobId, state="error")
+        if progress is not None:
+            await progress.flush()
+        await asyncio.to_thread(update_job, jobId, state="error")
+
+
+# ─────────────────────────────────────────────────────────────
+# OCR JOB SCHEDULER  (bounded queue, priority lanes, drain)
+# ─────────────────────────────────────────────────────────────
+#
+# The pipeline is I/O-bound (LLM calls) and already pushes rendering to
+# threads, so workers are asyncio tasks pulling from one priority queue.
+# Paid jobs always run before free previews; FIFO within a lane.
+
+PRIORITY_LANES = {"paid": 0, "free": 1}
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class OcrScheduler:
+
+    def __init__(self, workers: int, high_water: int):
+        self.workers    = max(1, workers)
+        self.high_water = high_water
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._pending: dict = {}    # jobId → (lane, seq) still waiting
+        self._running: dict = {}    # worker task → jobId
+        self._tasks:   list = []
+        self._seq       = 0
+        self._accepting = False
+        self.completed  = 0
+        self.rejected   = 0
+
+    def start(self):
+        self._queue     = asyncio.PriorityQueue()
+        self._accepting = True
+        self._tasks     = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        log("OCR scheduler started", f"workers={self.workers} high_water={self.high_water}")
+
+    async def recover(self):
+        """Re-enqueue jobs left in "queued" (or stale in "processing") by a restart; run_ocr_job's transition dedupes."""
+        await asyncio.to_thread(self._take_stale)
+        queued = await asyncio.to_thread(
+            lambda: [(jobId, (load_job(jobId) or {}).get("priority", "paid")) for jobId in JOB_STORE.ids_in_state("queued")])
+        for jobId, priority in queued:
+            self.submit(jobId, priority, force=True)
+
+    async def requeue_stale(self):
+        for jobId, priority in await asyncio.to_thread(self._take_stale):
+            if self._accepting:
+                self.submit(jobId, priority, force=True)
+
+    def _take_stale(self) -> list:
+        """
+        Move jobs stuck in "processing" (their worker died) back to "queued" →
+        [(jobId, priority)]. Another uvicorn worker may still be running one, so
+        only records not updated for OCR_STALE_SECONDS are taken; progress
+        updates keep live jobs fresh.
+        """
+        cutoff, mine, taken = (time.time() - OCR_STALE_SECONDS) * 1000, set(self._running.values()), []
+        for jobId in JOB_STORE.ids_in_state("processing"):
+            job = load_job(jobId) or {}
+            if jobId in mine or job.get("updatedAt", 0) >= cutoff:
+                continue
+            if transition_job(jobId, ("processing",), state="queued"):
+                log("Re-queued stale OCR job", jobId)
+                taken.append((jobId, job.get("priority", "paid")))
+        return taken
+
+    def submit(self, jobId: str, priority: str = "paid", force: bool = False) -> int:
+        if not self._accepting:
+            raise QueueFullError("scheduler is shutting down")
+        if jobId in self._pending:
+            return self.position(jobId)
+        if not force and len(self._pending) >= self.high_water:
+            self.rejected += 1
+            raise QueueFullError(f"queue depth {len(self._pending)} ≥ {self.high_water}")
+        self._seq += 1
+        entry = (PRIORITY_LANES.get(priority, PRIORITY_LANES["paid"]), self._seq)
+        self._pending[jobId] = entry
+        self._queue.put_nowait((*entry, jobId))
+        return self.position(jobId)
+
+    def position(self, jobId: str) -> Optional[int]:
+        """1-based place in line, or None if the job is not waiting here."""
+        entry = self._pending.get(jobId)
+        if entry is None:
+            return None
+        return 1 + sum(1 for other in self._pending.values() if other < entry)
+
+    async def _worker(self, n: int):
+        me = asyncio.current_task()
+        while self._accepting:
+            _, _, jobId = await self._queue.get()
+            if self._pending.pop(jobId, None) is None:
+                continue
+            self._running[me] = jobId
+            try:
+                await run_ocr_job(jobId)
+            except asyncio.CancelledError:
+                # Drain timed out mid-job: hand it back so recover() runs it after the restart
+                await asyncio.to_thread(transition_job, jobId, ("processing",), state="queued")
+                log("OCR job interrupted, re-queued", jobId)
+                raise
+            finally:
+                self._running.pop(me, None)
+                self.completed += 1
+
+    async def shutdown(self):
+        """Stop taking work, let running jobs finish (up to OCR_DRAIN_TIMEOUT). Queued jobs stay "queued" for recover()."""
+        self._accepting = False
+        idle = [t for t in self._tasks if t not in self._running]
+        for t in idle:
+            t.cancel()
+        busy = list(self._running)
+        if busy:
+            log("Draining OCR jobs", list(self._running.values()))
+            _, still_running = await asyncio.wait(busy, timeout=OCR_DRAIN_TIMEOUT)
+            for t in still_running:
+                t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        lanes = {name: sum(1 for lane, _ in self._pending.values() if lane == idx)
+                 for name, idx in PRIORITY_LANES.items()}
+        return {
+            "workers":   self.workers,
+            "running":   len(self._running),
+            "queued":    len(self._pending),
+            "lanes":     lanes,
+            "highWater": self.high_water,
+            "completed": self.completed,
+            "rejected":  self.rejected,
+        }
+
+
+SCHEDULER = OcrScheduler(OCR_WORKERS, OCR_QUEUE_HIGH_WATER)
 
 
 # =============================================================
@@ -458,6 +2124,20 @@ H2_BORDER_SIZE  = 24    # 1/8-pt → 3 pt
 META_LABEL_FILL  = "EFF6FF"
 META_HEADER_FILL = "F8FAFC"
 
+# Table styles added by configure_document_styles (styleId = name without spaces)
+TABLE_STYLE      = "Formyxa Table"        # firstRow → bold on META_HEADER_FILL
+META_TABLE_STYLE = "Formyxa Meta Table"   # odd columns → label (bold caps 9 pt on META_LABEL_FILL)
+
+# Paragraph styles and list definitions added by configure_document_styles;
+# runs only carry what differs from them (marks, sizes, colours).
+BODY_STYLE          = "Formyxa Body"            # 0 / 6 pt, 1.35 lines
+HEADING_STYLE       = "Formyxa Heading"         # body + bold, left-aligned
+LIST_STYLE          = "Formyxa List"            # 0 / 3 pt, 1.35 lines; indent comes from numbering
+LIST_CONTINUE_STYLE = "Formyxa List Continue"   # list + 24 pt indent, no marker
+CELL_STYLE          = "Formyxa Cell"            # meta-table cells: 2 / 2 pt
+BULLET_LIST         = "Formyxa Bullet"          # abstractNum names in numbering.xml
+ORDERED_LIST        = "Formyxa Decimal"
+
 
 # ─────────────────────────────────────────────────────────────
 # LAYOUT RESOLUTION  (mirrors lib/docLayout.ts exactly)
@@ -485,35 +2165,43 @@ SLUG_STYLE_OVERRIDES: dict = {
 }
 
 
-def get_layout(template_slug: Optional[str], design_key: Optional[str]) -> dict:
+def get_layout_key(template_slug: Optional[str], design_key: Optional[str]) -> str:
     s = (template_slug or "").lower()
     if s.startswith("leave-application-"):
-        return DOC_LAYOUTS["plain_editor"]
+        return "plain_editor"
     if design_key and design_key in DOC_LAYOUTS:
-        return DOC_LAYOUTS[design_key]
+        return design_key
     if template_slug:
         if template_slug in SLUG_STYLE_OVERRIDES:
-            return DOC_LAYOUTS[SLUG_STYLE_OVERRIDES[template_slug]]
+            return SLUG_STYLE_OVERRIDES[template_slug]
         if any(k in s for k in ("offer", "appointment", "joining")):
-            return DOC_LAYOUTS["offer_modern_blue"]
+            return "offer_modern_blue"
         if "noc" in s:
-            return DOC_LAYOUTS["noc_plain"]
+            return "noc_plain"
         if any(k in s for k in ("rental", "lease")):
-            return DOC_LAYOUTS["rental_plain"]
+            return "rental_plain"
         if any(k in s for k in ("blog", "ai-blog", "content", "copywriter", "proposal")):
-            return DOC_LAYOUTS["plain_editor"]
-    return DOC_LAYOUTS["default"]
+            return "plain_editor"
+    return "default"
 
 
 # ─────────────────────────────────────────────────────────────
 # DOCX STYLE HELPERS
 # ─────────────────────────────────────────────────────────────
 
+def style_id(name: str) -> str:
+    return name.replace(" ", "")
+
+
 def configure_document_styles(document: Document):
+    # Body size lives on docDefaults, not Normal: with Word's
+    # overrideTableStyleFontSizeAndJustification compat flag a size on Normal
+    # would beat the 9 pt label size of META_TABLE_STYLE.
+    set_default_run_font(document, BODY_FONT, BODY_SIZE)
     try:
         n = document.styles["Normal"]
         n.font.name = BODY_FONT
-        n.font.size = Pt(BODY_SIZE)
+        n.font.size = None
     except KeyError:
         pass
     for name, size in (("Heading 1", H1_SIZE), ("Heading 2", H2_SIZE), ("Heading 3", H3_SIZE)):
@@ -522,14 +2210,113 @@ def configure_document_styles(document: Document):
             s.font.name = BODY_FONT; s.font.size = Pt(size); s.font.bold = True
         except KeyError:
             pass
-
-
-def apply_body_spacing(paragraph):
-    fmt = paragraph.paragraph_format
-    fmt.space_before      = Pt(0)
-    fmt.space_after       = Pt(6)
-    fmt.line_spacing_rule = WD_LINE_SPACING.MULTIPLE
-    fmt.line_spacing      = 1.35
+    add_table_styles(document)
+    add_paragraph_styles(document)
+    add_list_numbering(document)
+
+
+def set_default_run_font(document: Document, name: str, size: float):
+    styles   = document.styles.element
+    defaults = styles.find(qn("w:docDefaults"))
+    if defaults is None:
+        defaults = OxmlElement("w:docDefaults"); styles.insert(0, defaults)
+    rpr_default = defaults.find(qn("w:rPrDefault"))
+    if rpr_default is None:
+        rpr_default = OxmlElement("w:rPrDefault"); defaults.insert(0, rpr_default)
+    rpr = rpr_default.find(qn("w:rPr"))
+    if rpr is None:
+        rpr = OxmlElement("w:rPr"); rpr_default.append(rpr)
+    fonts = rpr.get_or_add_rFonts()
+    for theme in ("w:asciiTheme", "w:hAnsiTheme"):   # theme fonts would win over w:ascii / w:hAnsi
+        fonts.attrib.pop(qn(theme), None)
+    fonts.set(qn("w:ascii"), name); fonts.set(qn("w:hAnsi"), name)
+    rpr.sz_val = Pt(size)
+
+
+def add_table_styles(document: Document):
+    styles = document.styles.element
+    known  = {s.get(qn("w:styleId")) for s in styles.findall(qn("w:style"))}
+    shd    = lambda fill: f'<w:tcPr><w:shd w:val="clear" w:color="auto" w:fill="{fill}"/></w:tcPr>'
+    conditional = {
+        TABLE_STYLE:      f'<w:tblStylePr w:type="firstRow"><w:rPr><w:b/></w:rPr>{shd(META_HEADER_FILL)}</w:tblStylePr>',
+        META_TABLE_STYLE: (f'<w:tblStylePr w:type="band1Vert"><w:rPr><w:b/><w:caps/><w:sz w:val="18"/></w:rPr>'
+                           f'{shd(META_LABEL_FILL)}</w:tblStylePr>'
+                           f'<w:tblStylePr w:type="band2Vert">{shd("FFFFFF")}</w:tblStylePr>'),
+    }
+    for name, parts in conditional.items():
+        if style_id(name) in known:
+            continue
+        styles.append(parse_xml(
+            f'<w:style {nsdecls("w")} w:type="table" w:customStyle="1" w:styleId="{style_id(name)}">'
+            f'<w:name w:val="{name}"/><w:basedOn w:val="TableNormal"/><w:uiPriority w:val="99"/>'
+            f'<w:tblPr><w:tblStyleColBandSize w:val="1"/></w:tblPr>{parts}</w:style>'))
+
+
+def add_paragraph_styles(document: Document):
+    styles = document.styles
+    specs  = (   # name, based on, space before / after, line spacing, left indent, bold, alignment
+        (BODY_STYLE,          "Normal",   0, 6, 1.35, None, None, None),
+        (HEADING_STYLE,       BODY_STYLE, None, None, None, None, True, WD_ALIGN_PARAGRAPH.LEFT),
+        (LIST_STYLE,          BODY_STYLE, None, 3, None, None, None, None),
+        (LIST_CONTINUE_STYLE, LIST_STYLE, None, None, None, 24, None, None),
+        (CELL_STYLE,          "Normal",   2, 2, None, None, None, None),
+    )
+    for name, base, before, after, line, indent, bold, align in specs:
+        if name in styles:
+            continue
+        s = styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+        s.base_style = styles[base]
+        fmt = s.paragraph_format
+        if before is not None: fmt.space_before = Pt(before)
+        if after  is not None: fmt.space_after  = Pt(after)
+        if line   is not None: fmt.line_spacing_rule = WD_LINE_SPACING.MULTIPLE; fmt.line_spacing = line
+        if indent is not None: fmt.left_indent  = Pt(indent)
+        if bold:               s.font.bold      = True
+        if align is not None:  fmt.alignment    = align
+
+
+def add_list_numbering(document: Document):
+    """Bullet and decimal list definitions (marker at 12 pt, text at 24 pt) plus the shared bullet instance."""
+    numbering = document.part.numbering_part.element
+    ids       = [int(i) for i in numbering.xpath("./w:abstractNum/@w:abstractNumId")]
+    for name, fmt, text in ((BULLET_LIST, "bullet", "•"), (ORDERED_LIST, "decimal", "%1.")):
+        if list_abstract_id(document, name) is not None:
+            continue
+        abstract_id = max(ids, default=-1) + 1; ids.append(abstract_id)
+        el = parse_xml(
+            f'<w:abstractNum {nsdecls("w")} w:abstractNumId="{abstract_id}">'
+            f'<w:multiLevelType w:val="singleLevel"/><w:name w:val="{name}"/>'
+            f'<w:lvl w:ilvl="0"><w:start w:val="1"/><w:numFmt w:val="{fmt}"/><w:lvlText w:val="{text}"/>'
+            f'<w:lvlJc w:val="left"/><w:pPr><w:ind w:left="480" w:hanging="240"/></w:pPr></w:lvl></w:abstractNum>')
+        first_num = numbering.find(qn("w:num"))
+        first_num.addprevious(el) if first_num is not None else numbering.append(el)
+        if name == BULLET_LIST:
+            numbering.add_num(abstract_id)
+
+
+def list_abstract_id(document: Document, name: str) -> Optional[int]:
+    ids = document.part.numbering_part.element.xpath(f'./w:abstractNum[w:name/@w:val="{name}"]/@w:abstractNumId')
+    return int(ids[0]) if ids else None
+
+
+def list_num_id(document: Document, ordered: bool) -> int:
+    """numId for a new list: bullet lists share one instance, every ordered list restarts at 1."""
+    numbering   = document.part.numbering_part.element
+    abstract_id = list_abstract_id(document, ORDERED_LIST if ordered else BULLET_LIST)
+    if not ordered:
+        return int(numbering.xpath(f'./w:num[w:abstractNumId/@w:val="{abstract_id}"]/@w:numId')[0])
+    num = numbering.add_num(abstract_id)
+    num.add_lvlOverride(ilvl=0).add_startOverride(1)
+    return num.numId
+
+
+def set_paragraph_style(paragraph, name: str, num_id: Optional[int] = None):
+    """pStyle by id (Paragraph.style = name searches the styles part on every call), plus list numbering."""
+    pPr = paragraph._p.get_or_add_pPr()
+    pPr.style = style_id(name)
+    if num_id is not None:
+        numPr = pPr.get_or_add_numPr()
+        numPr.get_or_add_ilvl().val = 0; numPr.get_or_add_numId().val = num_id
 
 
 def set_page_margins(document: Document, top=1.0, bottom=1.0, left=1.0, right=1.0):
@@ -537,6 +2324,128 @@ def set_page_margins(document: Document, top=1.0, bottom=1.0, left=1.0, right=1.
     s.top_margin = s.bottom_margin = s.left_margin = s.right_margin = Inches(top)
 
 
+# ─────────────────────────────────────────────────────────────
+# TEMPLATE REGISTRY
+# ─────────────────────────────────────────────────────────────
+#
+# Opening BASE_TEMPLATE and restyling it is identical for every export, so
+# it is done once and kept as a parsed snapshot. Each export works on a deep
+# copy of it, which skips unzipping and re-parsing every part; layout
+# specifics (brand header, footer banner) are rendered per export on top.
+# The snapshot is dropped and rebuilt when the template file's mtime changes.
+
+class TemplateRegistry:
+
+    def __init__(self, template_path: str):
+        self.template_path = template_path
+        self._snapshot = None   # styled Document, never mutated
+        self._package  = None   # serialized pieces for DocxStreamWriter
+        self._mtime    = None
+        self._lock     = threading.Lock()
+        self.builds = self.clones = self.reloads = 0
+
+    def template_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.template_path)
+        except OSError:
+            return None
+
+    def _build(self) -> Document:
+        document = Document(self.template_path) if os.path.exists(self.template_path) else Document()
+        configure_document_styles(document)
+        set_page_margins(document)
+        return document
+
+    def snapshot(self) -> Document:
+        mtime = self.template_mtime()
+        with self._lock:
+            if mtime != self._mtime:
+                if self._snapshot is not None:
+                    log("♻️ Template changed, reloading", self.template_path)
+                    self.reloads += 1
+                self._snapshot = self._package = None; self._mtime = mtime
+            if self._snapshot is None:
+                self._snapshot = self._build()
+                self.builds += 1
+            return self._snapshot
+
+    def new_document(self) -> Document:
+        """Fresh, already-styled Document; safe to mutate."""
+        document = copy.deepcopy(self.snapshot())
+        self.clones += 1
+        return document
+
+    def package(self) -> dict:
+        """The snapshot as zip parts plus document.xml split around the body content."""
+        snapshot = self.snapshot()
+        with self._lock:
+            pkg = self._package
+        if pkg is None:
+            pkg = self._build_package(copy.deepcopy(snapshot))
+            with self._lock:
+                if self._snapshot is snapshot:   # not reloaded meanwhile
+                    self._package = pkg
+        return pkg
+
+    @staticmethod
+    def _build_package(document: Document) -> dict:
+        buf = io.BytesIO(); document.save(buf)
+        zf  = zipfile.ZipFile(buf)
+
+        # New blocks go right before the body-level sectPr, exactly where add_paragraph puts them
+        root, body = document.element, document.element.body
+        marker     = etree.Comment("BODY")
+        sect_pr    = body.find(qn("w:sectPr"))
+        sect_pr.addprevious(marker) if sect_pr is not None else body.append(marker)
+        prefix, suffix = etree.tostring(root, encoding="UTF-8", standalone=True).split(b"<!--BODY-->")
+
+        # Ordered lists append <w:num> where CT_Numbering.add_num would
+        numbering_part = document.part.numbering_part
+        numbering      = numbering_part.element
+        cleanup        = numbering.find(qn("w:numIdMacAtCleanup"))
+        marker         = etree.Comment("NUMS")
+        cleanup.addprevious(marker) if cleanup is not None else numbering.append(marker)
+        num_head, num_tail = etree.tostring(numbering, encoding="UTF-8", standalone=True).split(b"<!--NUMS-->")
+        bullet_id = list_abstract_id(document, BULLET_LIST)
+
+        numbering_name = numbering_part.partname.lstrip("/")
+        section  = document.sections[-1]
+        used_ids = [int(i) for i in root.xpath("//@id") if i.isdigit()]
+        skip     = {"word/document.xml", "word/_rels/document.xml.rels", "[Content_Types].xml", numbering_name}
+        types    = zf.read("[Content_Types].xml")
+        return {
+            "prefix":            prefix,
+            "suffix":            suffix,
+            "parts":             [(n, zf.read(n)) for n in zf.namelist() if n not in skip],
+            "rels":              zf.read("word/_rels/document.xml.rels"),
+            "contentTypes":      types,
+            "defaultExts":       {e.decode() for e in re.findall(rb'<Default Extension="([^"]+)"', types)},
+            "rIds":              set(document.part.rels.keys()),
+            "mediaNumbers":      {int(m.group(1)) for n in zf.namelist() if (m := re.match(r"word/media/image(\d+)\.", n))},
+            "nextId":            max(used_ids) + 1 if used_ids else 1,
+            "numberingName":     numbering_name,
+            "numberingHead":     num_head,
+            "numberingTail":     num_tail,
+            "numIds":            {int(i) for i in numbering.xpath("./w:num/@w:numId")},
+            "bulletNumId":       int(numbering.xpath(f'./w:num[w:abstractNumId/@w:val="{bullet_id}"]/@w:numId')[0]),
+            "orderedAbstractId": list_abstract_id(document, ORDERED_LIST),
+            "blockWidth":        section.page_width - section.left_margin - section.right_margin,
+            "inlineNs":          "".join(f' xmlns:{p}="{DOCX_NSMAP[p]}"' for p in ("wp", "a", "pic", "r")
+                                         if root.nsmap.get(p) != DOCX_NSMAP[p]),
+        }
+
+    def warm(self):
+        self.package()   # builds the snapshot too
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"loaded": self._snapshot is not None, "builds": self.builds,
+                    "clones": self.clones, "reloads": self.reloads}
+
+
+TEMPLATES = TemplateRegistry(BASE_TEMPLATE)
+
+
 # ─────────────────────────────────────────────────────────────
 # XML HELPERS
 # ─────────────────────────────────────────────────────────────
@@ -565,6 +2474,24 @@ def remove_cell_borders(cell):
     tcPr.append(tcBorders)
 
 
+_TBL_LOOK_BITS = {"firstRow": 0x20, "lastRow": 0x40, "firstColumn": 0x80, "lastColumn": 0x100,
+                  "noHBand": 0x200, "noVBand": 0x400}
+
+
+def table_look_flags(first_row: bool = False, col_bands: bool = False) -> dict:
+    flags = {"firstColumn": False, "firstRow": first_row, "lastColumn": False, "lastRow": False,
+             "noHBand": False, "noVBand": not col_bands}
+    return {**{k: "1" if v else "0" for k, v in flags.items()},
+            "val": f"{sum(bit for k, bit in _TBL_LOOK_BITS.items() if flags[k]):04X}"}
+
+
+def set_table_look(table, first_row: bool = False, col_bands: bool = False):
+    """Which conditional parts of the table style apply (header row, vertical banding)."""
+    look = table._tbl.tblPr.find(qn("w:tblLook"))
+    for key, value in table_look_flags(first_row, col_bands).items():
+        look.set(qn(f"w:{key}"), value)
+
+
 def add_bottom_border_to_cell(cell, color="334155", size=6):
     tcPr     = cell._tc.get_or_add_tcPr()
     tcBorders = OxmlElement("w:tcBorders")
@@ -574,23 +2501,182 @@ def add_bottom_border_to_cell(cell, color="334155", size=6):
 
 
 # ─────────────────────────────────────────────────────────────
-# IMAGE FETCH
+# ASSET CACHE + IMAGE FETCH
 # ─────────────────────────────────────────────────────────────
+#
+# Header/footer banners, logos and signatures repeat across nearly every
+# export. Originals are cached per URL and revalidated after
+# ASSET_CACHE_TTL (ETag / Last-Modified for remote URLs, mtime for files
+# under public/). Failures are cached for ASSET_NEGATIVE_TTL. Each image is
+# also kept pre-resized to the exact width a renderer embeds it at, so a
+# 200 KB banner is decoded and shrunk once, not on every export.
+
+class MemoryLRU:
+    """Thread-safe LRU bounded by total value size in bytes, with hit/miss counters; entries expire after `ttl`."""
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl       = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._items = OrderedDict()   # key → (value, size, stored at)
+        self._size  = 0
+        self._lock  = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self.ttl is not None and time.time() - item[2] > self.ttl:
+                del self._items[key]; self._size -= item[1]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._items[key] = (value, size, time.time())
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, old_size, _) = self._items.popitem(last=False)
+                self._size -= old_size; self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self._size -= item[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":   len(self._items),
+                "bytes":     self._size,
+                "maxBytes":  self.max_bytes,
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "evictions": self.evictions,
+                "hitRate":   round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class AssetCache:
+
+    def __init__(self, max_bytes: int):
+        self._originals = MemoryLRU(max_bytes // 2)   # url → {data, etag, lastModified, mtime, checkedAt}
+        self._variants  = MemoryLRU(max_bytes // 2)   # (url, sha1, width_px) → embed-ready bytes
+        self._negative: dict = {}                     # url → retry-after timestamp
+        self._lock = threading.Lock()
+        self.revalidated = self.not_modified = self.negative_hits = 0
+
+    def _load(self, url: str, entry: Optional[dict]) -> Optional[dict]:
+        if url.startswith("http"):
+            headers = {}
+            if entry and entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry and entry.get("lastModified"):
+                headers["If-Modified-Since"] = entry["lastModified"]
+            r = get_sync_client().get(url, headers=headers)
+            if entry and r.status_code == 304:
+                self.not_modified += 1
+                return {**entry, "checkedAt": time.time()}
+            r.raise_for_status()
+            return {"data": r.content, "etag": r.headers.get("etag"),
+                    "lastModified": r.headers.get("last-modified"), "checkedAt": time.time()}
+
+        local = os.path.join(BASE_DIR, "public", url.lstrip("/"))
+        mtime = os.path.getmtime(local)    # raises if missing → negative-cached
+        if entry and entry.get("mtime") == mtime:
+            return {**entry, "checkedAt": time.time()}
+        with open(local, "rb") as f:
+            return {"data": f.read(), "mtime": mtime, "checkedAt": time.time()}
+
+    def fetch(self, url: str) -> Optional[dict]:
+        """Cache entry (original bytes + validators) for `url`, or None when it cannot be fetched."""
+        with self._lock:
+            if self._negative.get(url, 0) > time.time():
+                self.negative_hits += 1
+                return None
+        entry = self._originals.get(url)
+        if entry and time.time() - entry["checkedAt"] < ASSET_CACHE_TTL:
+            return entry
+        try:
+            if entry:
+                self.revalidated += 1
+            fresh = self._load(url, entry)
+        except Exception as e:
+            if entry:   # serve stale rather than drop a banner on a flaky origin
+                log("⚠️ Asset revalidation failed, serving stale", f"{url}: {e}")
+                fresh = {**entry, "checkedAt": time.time()}
+            else:
+                log("⚠️ fetch_image failed", f"{url}: {e}")
+                with self._lock:
+                    self._negative[url] = time.time() + ASSET_NEGATIVE_TTL
+                return None
+        if "sha1" not in fresh:
+            fresh["sha1"] = hashlib.sha1(fresh["data"]).hexdigest()
+        self._originals.put(url, fresh, len(fresh["data"]))
+        return fresh
+
+    def image(self, url: str, width_in: Optional[float] = None) -> Optional[bytes]:
+        entry = self.fetch(url)
+        if entry is None or not width_in:
+            return entry and entry["data"]
+        width   = int(round(width_in * ASSET_EMBED_DPI))
+        key     = (url, entry["sha1"], width)
+        variant = self._variants.get(key)
+        if variant is None:
+            variant = resize_for_embed(entry["data"], width)
+            self._variants.put(key, variant, len(variant))
+        return variant
+
+    def stats(self) -> dict:
+        with self._lock:
+            negative = sum(1 for t in self._negative.values() if t > time.time())
+        return {"originals": self._originals.stats(), "variants": self._variants.stats(),
+                "revalidated": self.revalidated, "notModified": self.not_modified,
+                "negativeEntries": negative, "negativeHits": self.negative_hits}
+
+
+def resize_for_embed(data: bytes, width_px: int) -> bytes:
+    """
+    Shrink to `width_px` wide (never enlarge) and re-encode in a format
+    python-docx can embed: JPEG stays JPEG, everything else (incl. WebP) → PNG.
+    Undecodable data (GIF, SVG…) is returned unchanged.
+    """
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return data
+    is_jpeg = data[:3] == b"\xff\xd8\xff"
+    if img.shape[1] <= width_px and (is_jpeg or data[:8] == b"\x89PNG\r\n\x1a\n"):
+        return data
+    if img.shape[1] > width_px:
+        height = max(1, round(img.shape[0] * width_px / img.shape[1]))
+        img    = cv2.resize(img, (width_px, height), interpolation=cv2.INTER_AREA)
+    if is_jpeg:
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    else:
+        ok, buf = cv2.imencode(".png", img, [cv2.IMWRITE_PNG_COMPRESSION, 6])
+    return buf.tobytes() if ok else data
+
 
-def fetch_image(url: Optional[str]) -> Optional[io.BytesIO]:
+ASSET_CACHE = AssetCache(ASSET_CACHE_MAX_BYTES)
+
+
+def fetch_image(url: Optional[str], width_in: Optional[float] = None) -> Optional[io.BytesIO]:
+    """Image for embedding at `width_in` inches, served from ASSET_CACHE."""
     if not url:
         return None
-    try:
-        if url.startswith("http"):
-            r = requests.get(url, timeout=8); r.raise_for_status()
-            return io.BytesIO(r.content)
-        local = os.path.join(BASE_DIR, "public", url.lstrip("/"))
-        if os.path.exists(local):
-            with open(local, "rb") as f:
-                return io.BytesIO(f.read())
-    except Exception as e:
-        print(f"⚠️  fetch_image failed for {url}: {e}")
-    return None
+    data = ASSET_CACHE.image(url, width_in)
+    return io.BytesIO(data) if data else None
 
 
 # ─────────────────────────────────────────────────────────────
@@ -598,7 +2684,7 @@ def fetch_image(url: Optional[str]) -> Optional[io.BytesIO]:
 # ─────────────────────────────────────────────────────────────
 
 def render_brand_header(document: Document, layout: dict, brand: Optional[dict], title: Optional[str]):
-    header_img = fetch_image(layout.get("headerImageUrl"))
+    header_img = fetch_image(layout.get("headerImageUrl"), 6.5)
     if header_img:
         p = document.add_paragraph()
         p.add_run().add_picture(header_img, width=Inches(6.5))
@@ -615,7 +2701,7 @@ def render_brand_header(document: Document, layout: dict, brand: Optional[dict],
         remove_cell_borders(cell)
 
     # Logo
-    logo_img = fetch_image(brand.get("logoUrl")) if layout.get("showLogo") else None
+    logo_img = fetch_image(brand.get("logoUrl"), 1.2) if layout.get("showLogo") else None
     if logo_img:
         left_cell.text = ""
         left_cell.paragraphs[0].add_run().add_picture(logo_img, width=Inches(1.2))
@@ -623,12 +2709,12 @@ def render_brand_header(document: Document, layout: dict, brand: Optional[dict],
     # Company name + address
     center_cell.text = ""
     nr = center_cell.paragraphs[0].add_run(brand.get("companyName", ""))
-    nr.bold = True; nr.font.size = Pt(10); nr.font.name = BODY_FONT
+    nr.bold = True; nr.font.size = Pt(10)
     for line in (brand.get("addressLine1"), brand.get("addressLine2")):
         if line:
             p = center_cell.add_paragraph(line)
             for r in p.runs:
-                r.font.size = Pt(8); r.font.name = BODY_FONT
+                r.font.size = Pt(8)
                 r.font.color.rgb = RGBColor(0x47, 0x55, 0x69)
 
     # Phone + email
@@ -638,7 +2724,7 @@ def render_brand_header(document: Document, layout: dict, brand: Optional[dict],
             p = right_cell.add_paragraph(val)
             p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
             for r in p.runs:
-                r.font.size = Pt(8); r.font.name = BODY_FONT
+                r.font.size = Pt(8)
                 r.font.color.rgb = RGBColor(0x47, 0x55, 0x69)
 
     # Document title bar
@@ -646,7 +2732,7 @@ def render_brand_header(document: Document, layout: dict, brand: Optional[dict],
         p = document.add_paragraph()
         p.alignment = WD_ALIGN_PARAGRAPH.CENTER
         run = p.add_run(title.upper())
-        run.bold = True; run.font.size = Pt(9); run.font.name = BODY_FONT
+        run.bold = True; run.font.size = Pt(9)
         run.font.color.rgb = RGBColor(0x1D, 0x4E, 0xD8)
         pPr  = p._p.get_or_add_pPr()
         pBdr = OxmlElement("w:pBdr")
@@ -672,10 +2758,10 @@ def render_signatory_footer(document: Document, signatory: Optional[dict]):
 
     lp = document.add_paragraph("Authorised Signatory")
     for r in lp.runs:
-        r.bold = True; r.font.size = Pt(9); r.font.name = BODY_FONT
+        r.bold = True; r.font.size = Pt(9)
         r.font.color.rgb = RGBColor(0x47, 0x55, 0x69)
 
-    sig_img = fetch_image(signatory.get("signatureImageUrl"))
+    sig_img = fetch_image(signatory.get("signatureImageUrl"), 1.5)
     if sig_img:
         p = document.add_paragraph()
         p.add_run().add_picture(sig_img, width=Inches(1.5))
@@ -689,12 +2775,12 @@ def render_signatory_footer(document: Document, signatory: Optional[dict]):
             p = document.add_paragraph(text)
             p.paragraph_format.space_before = Pt(0); p.paragraph_format.space_after = Pt(1)
             for r in p.runs:
-                r.bold = bold; r.font.size = Pt(BODY_SIZE if bold else 10); r.font.name = BODY_FONT
-                if not bold: r.font.color.rgb = RGBColor(0x47, 0x55, 0x69)
+                r.bold = bold
+                if not bold: r.font.size = Pt(10); r.font.color.rgb = RGBColor(0x47, 0x55, 0x69)
 
 
 def render_footer_banner(document: Document, layout: dict):
-    footer_img = fetch_image(layout.get("footerImageUrl"))
+    footer_img = fetch_image(layout.get("footerImageUrl"), 6.5)
     if not footer_img:
         return
     p = document.add_paragraph()
@@ -707,17 +2793,19 @@ def render_footer_banner(document: Document, layout: dict):
 # TEXT RUNS
 # ─────────────────────────────────────────────────────────────
 
-def add_text_runs_from_tiptap(content_nodes: list, paragraph):
-    if not content_nodes:
-        return
-    for node in content_nodes:
+def add_text_runs_from_tiptap(content_nodes: list, paragraph, sizes: bool = True) -> list:
+    """
+    Append runs for `content_nodes`; returns them. Font and size come from the
+    paragraph style; `sizes=False` also ignores fontSize marks.
+    """
+    runs = []
+    for node in content_nodes or []:
         ntype = node.get("type")
 
         if ntype == "text":
             text  = node.get("text", "")
             marks = node.get("marks", []) or []
             run   = paragraph.add_run(text)
-            run.font.name = BODY_FONT; run.font.size = Pt(BODY_SIZE)
             for m in marks:
                 mt = m.get("type")
                 if mt == "bold":      run.bold        = True
@@ -732,7 +2820,7 @@ def add_text_runs_from_tiptap(content_nodes: list, paragraph):
                                 int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
                         except Exception:
                             pass
-                if mt == "fontSize":
+                if mt == "fontSize" and sizes:
                     sz = m.get("attrs", {}).get("size")
                     if sz:
                         try:
@@ -746,66 +2834,69 @@ def add_text_runs_from_tiptap(content_nodes: list, paragraph):
             label   = (attrs.get("label") or "Field").strip()
             display = value if value else f"[{label}]"
             run = paragraph.add_run(display)
-            run.font.name = BODY_FONT; run.font.size = Pt(BODY_SIZE)
             if attrs.get("bold"):  run.bold      = True
             if not value:          run.underline = True
+        else:
+            continue
+        runs.append(run)
+    return runs
 
 
 # ─────────────────────────────────────────────────────────────
 # TABLE RENDERERS
 # ─────────────────────────────────────────────────────────────
 
+# Rows are appended one at a time and each row's cells fetched once, so cost
+# is linear in the number of cells (indexing table.rows[i] rebuilds the row
+# list on every access). Header and label looks come from the table styles;
+# only tableHeader cells the style cannot reach get direct formatting.
+
 def render_meta_table(node, document: Document):
     rows = node.get("content", [])
     if not rows: return
-    num_rows = len(rows)
     num_cols = max(len(r.get("content", [])) for r in rows)
-    table = document.add_table(rows=num_rows, cols=num_cols)
+    table = document.add_table(rows=0, cols=num_cols)
+    table.style = META_TABLE_STYLE; set_table_look(table, col_bands=True)
     table.alignment = WD_TABLE_ALIGNMENT.CENTER; table.autofit = True
 
-    for r_idx, row in enumerate(rows):
+    for row in rows:
+        cells = table.add_row().cells
         for c_idx, cell_node in enumerate(row.get("content", [])):
-            cell = table.rows[r_idx].cells[c_idx]; cell.text = ""
+            cell, runs = cells[c_idx], []
+            p = cell.paragraphs[0]
             for child in cell_node.get("content", []):
                 if child.get("type") != "paragraph": continue
-                p = cell.paragraphs[0]
-                add_text_runs_from_tiptap(child.get("content", []) or [], p)
-                p.paragraph_format.space_before = Pt(2); p.paragraph_format.space_after = Pt(2)
-            is_label = (c_idx % 2 == 0) or (cell_node.get("type") == "tableHeader")
-            if is_label:
+                runs += add_text_runs_from_tiptap(child.get("content", []) or [], p); set_paragraph_style(p, CELL_STYLE)
+            if c_idx % 2 and cell_node.get("type") == "tableHeader":   # label in a value column
                 shade_cell(cell, META_LABEL_FILL)
-                for p in cell.paragraphs:
-                    for r in p.runs:
-                        r.bold = True; r.font.size = Pt(9); r.font.name = BODY_FONT; r.text = r.text.upper()
-            else:
-                shade_cell(cell, "FFFFFF")
-                for p in cell.paragraphs:
-                    for r in p.runs:
-                        r.font.size = Pt(BODY_SIZE); r.font.name = BODY_FONT
+                for r in runs:
+                    r.bold = True; r.font.all_caps = True; r.font.size = Pt(9)
     document.add_paragraph()
 
 
 def render_table_node(node, document: Document):
     rows = node.get("content", [])
     if not rows: return
-    num_rows = len(rows)
-    num_cols = max(len(r.get("content", [])) for r in rows)
-    table = document.add_table(rows=num_rows, cols=num_cols)
+    num_cols   = max(len(r.get("content", [])) for r in rows)
+    first      = rows[0].get("content", [])
+    header_row = bool(first) and all(c.get("type") == "tableHeader" for c in first)
+    table = document.add_table(rows=0, cols=num_cols)
+    table.style = TABLE_STYLE; set_table_look(table, first_row=header_row)
     table.alignment = WD_TABLE_ALIGNMENT.CENTER; table.autofit = True
 
     for r_idx, row in enumerate(rows):
+        cells = table.add_row().cells
         for c_idx, cell_node in enumerate(row.get("content", [])):
-            cell = table.rows[r_idx].cells[c_idx]; cell.text = ""
+            cell, runs = cells[c_idx], []
+            p = cell.paragraphs[0]
             for child in cell_node.get("content", []):
                 if child.get("type") != "paragraph": continue
                 if (child.get("attrs") or {}).get("instructional"): continue
                 content = child.get("content", []) or []
                 if not any(c.get("type") == "text" and c.get("text", "").strip() for c in content): continue
-                p = cell.paragraphs[0]
-                add_text_runs_from_tiptap(content, p); apply_body_spacing(p)
-            if cell_node.get("type") == "tableHeader":
-                for p in cell.paragraphs:
-                    for r in p.runs: r.bold = True
+                runs += add_text_runs_from_tiptap(content, p); set_paragraph_style(p, BODY_STYLE)
+            if cell_node.get("type") == "tableHeader" and not (r_idx == 0 and header_row):
+                for r in runs: r.bold = True
                 shade_cell(cell, META_HEADER_FILL)
 
 
@@ -829,7 +2920,7 @@ def render_signatures_block(node, document: Document, signatory: Optional[dict])
     def _set(cell, text, bold=False, size=BODY_SIZE):
         cell.text = ""
         p = cell.paragraphs[0]; run = p.add_run(text)
-        run.font.name = BODY_FONT; run.font.size = Pt(size)
+        run.font.size = Pt(size)
         if bold: run.bold = True
         p.paragraph_format.space_before = Pt(2); p.paragraph_format.space_after = Pt(4)
 
@@ -837,7 +2928,7 @@ def render_signatures_block(node, document: Document, signatory: Optional[dict])
     _set(table.rows[0].cells[1], right_title, bold=True, size=10)
 
     for idx, cell in enumerate(table.rows[1].cells):
-        sig_img = fetch_image(signatory.get("signatureImageUrl")) if (idx == 1 and signatory) else None
+        sig_img = fetch_image(signatory.get("signatureImageUrl"), 1.2) if (idx == 1 and signatory) else None
         if sig_img:
             p = cell.paragraphs[0]; p.paragraph_format.space_before = Pt(4)
             p.add_run().add_picture(sig_img, width=Inches(1.2))
@@ -857,7 +2948,7 @@ def render_signatures_block(node, document: Document, signatory: Optional[dict])
     if signatory:
         rc = table.rows[3].cells[1]; rc.text = ""
         run = rc.paragraphs[0].add_run(f"{signatory.get('fullName', '')}  ({signatory.get('designation', '')})")
-        run.font.size = Pt(9); run.font.name = BODY_FONT
+        run.font.size = Pt(9)
 
     _set(table.rows[4].cells[0], "Name / Date", size=9)
     _set(table.rows[4].cells[1], "Name / Date", size=9)
@@ -869,11 +2960,11 @@ def render_signatures_block(node, document: Document, signatory: Optional[dict])
 
 def render_image_node(node, document: Document):
     src = (node.get("attrs") or {}).get("src")
-    img = fetch_image(src)
+    img = fetch_image(src, 4.5)
     if not img: return
     p = document.add_paragraph()
     p.add_run().add_picture(img, width=Inches(4.5))
-    apply_body_spacing(p)
+    set_paragraph_style(p, BODY_STYLE)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -884,17 +2975,12 @@ def render_node(node, document: Document, signatory: Optional[dict] = None):
     ntype = node.get("type")
 
     # ── Heading ───────────────────────────────────────────────────────────────
-    # Match the editor exactly: bold, left-aligned, body font + size.
+    # Match the editor exactly: bold, left-aligned, body font + size (HEADING_STYLE).
     # NO uppercase, NO centering, NO left border, NO size changes.
     if ntype == "heading":
         p = document.add_paragraph()
-        add_text_runs_from_tiptap(node.get("content", []), p)
-        for r in p.runs:
-            r.bold = True
-            r.font.name = BODY_FONT
-            r.font.size = Pt(BODY_SIZE)
-        p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-        apply_body_spacing(p)
+        set_paragraph_style(p, HEADING_STYLE)
+        add_text_runs_from_tiptap(node.get("content", []), p, sizes=False)
         return
 
     # ── Paragraph ─────────────────────────────────────────────────────────────
@@ -904,19 +2990,22 @@ def render_node(node, document: Document, signatory: Optional[dict] = None):
         content = node.get("content", []) or []
         if not any(c.get("type") == "text" and c.get("text", "").strip() for c in content): return
         p = document.add_paragraph()
+        set_paragraph_style(p, BODY_STYLE)
         add_text_runs_from_tiptap(content, p)
-        apply_body_spacing(p)
         align = (attrs.get("textAlign") or "").lower()
         if align == "center":    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
         elif align == "right":   p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
         elif align == "justify": p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
         return
 
-    # ── Bullet list ───────────────────────────────────────────────────────────
-    # First paragraph in each listItem gets the bullet prefix.
-    # Extra paragraphs inside the same listItem are continuation lines
-    # (indented, no bullet) — matches how the editor renders them.
-    if ntype == "bulletList":
+    # ── Bullet / ordered list ─────────────────────────────────────────────────
+    # First paragraph in each listItem carries the list numbering (bullet or
+    # "N."); numbers only advance on items that render a paragraph, and every
+    # ordered list restarts at 1. Extra paragraphs inside the SAME listItem are
+    # continuation/address lines — indented, NO marker — so address sub-lines
+    # never become separate items.
+    if ntype in ("bulletList", "orderedList"):
+        num_id = None
         for li in node.get("content", []):
             if li.get("type") != "listItem": continue
             paras = [c for c in li.get("content", []) if c.get("type") == "paragraph"]
@@ -926,48 +3015,11 @@ def render_node(node, document: Document, signatory: Optional[dict] = None):
                 if not any(c.get("type") == "text" and c.get("text", "").strip() for c in content): continue
                 p = document.add_paragraph()
                 if i == 0:
-                    br = p.add_run("•  ")
-                    br.font.name = BODY_FONT; br.font.size = Pt(BODY_SIZE)
+                    num_id = num_id or list_num_id(document, ntype == "orderedList")
+                    set_paragraph_style(p, LIST_STYLE, num_id)
+                else:
+                    set_paragraph_style(p, LIST_CONTINUE_STYLE)
                 add_text_runs_from_tiptap(content, p)
-                fmt = p.paragraph_format
-                fmt.left_indent       = Pt(24)
-                fmt.first_line_indent = Pt(-12) if i == 0 else Pt(0)
-                fmt.space_before      = Pt(0)
-                fmt.space_after       = Pt(3)
-                fmt.line_spacing_rule = WD_LINE_SPACING.MULTIPLE
-                fmt.line_spacing      = 1.35
-        return
-
-    # ── Ordered list ──────────────────────────────────────────────────────────
-    # First paragraph in each listItem gets "N.  " prefix.
-    # Extra paragraphs inside the SAME listItem are continuation/address lines —
-    # they get indentation only, NO number. This prevents address sub-lines
-    # from becoming separate numbered items.
-    if ntype == "orderedList":
-        idx = 1
-        for li in node.get("content", []):
-            if li.get("type") != "listItem": continue
-            paras = [c for c in li.get("content", []) if c.get("type") == "paragraph"]
-            has_content = False
-            for i, child in enumerate(paras):
-                if (child.get("attrs") or {}).get("instructional"): continue
-                content = child.get("content", []) or []
-                if not any(c.get("type") == "text" and c.get("text", "").strip() for c in content): continue
-                p = document.add_paragraph()
-                if i == 0:
-                    nr = p.add_run(f"{idx}.  ")
-                    nr.font.name = BODY_FONT; nr.font.size = Pt(BODY_SIZE)
-                add_text_runs_from_tiptap(content, p)
-                fmt = p.paragraph_format
-                fmt.left_indent       = Pt(24)
-                fmt.first_line_indent = Pt(-12) if i == 0 else Pt(0)
-                fmt.space_before      = Pt(0)
-                fmt.space_after       = Pt(3)
-                fmt.line_spacing_rule = WD_LINE_SPACING.MULTIPLE
-                fmt.line_spacing      = 1.35
-                has_content = True
-            if has_content:
-                idx += 1
         return
 
     if ntype == "table":
@@ -1011,10 +3063,9 @@ def tiptap_doc_to_docx(
     file_name:     str            = "document",
 ) -> Document:
 
-    document = Document(BASE_TEMPLATE) if os.path.exists(BASE_TEMPLATE) else Document()
-    configure_document_styles(document)
-    set_page_margins(document)
-    layout = get_layout(template_slug, design_key)
+    layout_key = get_layout_key(template_slug, design_key)
+    layout     = DOC_LAYOUTS[layout_key]
+    document   = TEMPLATES.new_document()
 
     if layout.get("showLogo") or layout.get("headerImageUrl"):
         render_brand_header(document, layout, brand, file_name)
@@ -1038,6 +3089,1090 @@ def sanitize_filename(name: str) -> str:
     return name.strip() or "document"
 
 
+# ─────────────────────────────────────────────────────────────
+# STREAMING DOCX WRITER
+# ─────────────────────────────────────────────────────────────
+#
+# Alternative to tiptap_doc_to_docx for large documents. Walks the TipTap
+# tree once and writes word/document.xml straight into a zip stream,
+# without building python-docx objects. Each stream_* function mirrors a
+# render_* function above and emits the exact XML python-docx would
+# serialize for it (same elements, attribute order, ids and rIds), so both
+# engines produce identical document.xml. If you change a renderer, change
+# its stream_* twin too; `python bench.py export` diffs the two outputs.
+
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+_NO_BORDERS   = ("<w:tcBorders>" + "".join(f'<w:{s} w:val="none"/>' for s in
+                 ("top", "left", "bottom", "right", "insideH", "insideV")) + "</w:tcBorders>")
+_BOTTOM_RULE  = '<w:tcBorders><w:bottom w:val="single" w:sz="6" w:color="334155"/></w:tcBorders>'
+_TBL_LOOK     = ('<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+                 'w:noHBand="0" w:noVBand="1" w:val="04A0"/>')   # python-docx default, unstyled tables
+_JC           = {"center": "center", "right": "right", "justify": "both"}
+_SLATE        = "475569"
+
+
+def _el(tag: str, inner: str = "") -> str:
+    return f"<{tag}>{inner}</{tag}>" if inner else f"<{tag}/>"
+
+
+def _hps(pt: float) -> int:
+    """Point size → half-points, rounded the way python-docx writes w:sz."""
+    return int(Pt(pt).pt * 2)
+
+
+def _twips(pt: float) -> int:
+    return Pt(pt).twips
+
+
+def _spacing(before: float, after: float) -> str:
+    return f'<w:spacing w:before="{_twips(before)}" w:after="{_twips(after)}"/>'
+
+
+def _x_text(text: str) -> str:
+    """Run content for `text`: <w:t> segments split on tabs and line breaks."""
+    if _XML_INVALID.search(text):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    out = []
+    for part in re.split(r"(\t|\r|\n)", text):
+        if part == "\t":
+            out.append("<w:tab/>")
+        elif part in ("\r", "\n"):
+            out.append("<w:br/>")
+        elif part:
+            space = ' xml:space="preserve"' if len(part.strip()) < len(part) else ""
+            out.append(f"<w:t{space}>{xml_escape(part)}</w:t>")
+    return "".join(out)
+
+
+def _x_run(text: str, fmt: dict) -> str:
+    """
+    One <w:r>. `fmt` keys: b/i/caps/strike/u (True, False or absent),
+    color (hex), sz (half-points).
+    """
+    props = []
+    for key in ("b", "i", "caps", "strike"):
+        if key in fmt:
+            props.append(f"<w:{key}/>" if fmt[key] else f'<w:{key} w:val="0"/>')
+    if "color" in fmt:
+        props.append(f'<w:color w:val="{fmt["color"]}"/>')
+    if "sz" in fmt:
+        props.append(f'<w:sz w:val="{fmt["sz"]}"/>')
+    if "u" in fmt:
+        props.append('<w:u w:val="single"/>' if fmt["u"] else '<w:u w:val="none"/>')
+    return _el("w:r", (_el("w:rPr", "".join(props)) if props else "") + _x_text(text or ""))
+
+
+def _x_para(ppr: str, runs: str) -> str:
+    return _el("w:p", (_el("w:pPr", ppr) if ppr else "") + runs)
+
+
+def _x_style(name: str, num_id: Optional[int] = None) -> str:
+    """pPr content written by set_paragraph_style."""
+    numbering = f'<w:numPr><w:ilvl w:val="0"/><w:numId w:val="{num_id}"/></w:numPr>' if num_id is not None else ""
+    return f'<w:pStyle w:val="{style_id(name)}"/>' + numbering
+
+
+def _x_cell(width: str, tcpr: str, paras: str) -> str:
+    return f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width}"/>{tcpr}</w:tcPr>{paras}</w:tc>'
+
+
+def _tiptap_runs(content_nodes: list, sizes: bool = True) -> list:
+    """(text, fmt) pairs — same run split and formatting as add_text_runs_from_tiptap."""
+    runs = []
+    for node in content_nodes or []:
+        ntype = node.get("type")
+        if ntype == "text":
+            fmt = {}
+            for m in node.get("marks", []) or []:
+                mt = m.get("type")
+                if mt == "bold":      fmt["b"]      = True
+                if mt == "italic":    fmt["i"]      = True
+                if mt == "underline": fmt["u"]      = True
+                if mt == "strike":    fmt["strike"] = True
+                if mt == "textStyle":
+                    color = m.get("attrs", {}).get("color", "")
+                    if color and color.startswith("#") and len(color) == 7:
+                        try:
+                            fmt["color"] = str(RGBColor(
+                                int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)))
+                        except Exception:
+                            pass
+                if mt == "fontSize" and sizes:
+                    sz = m.get("attrs", {}).get("size")
+                    if sz:
+                        try:
+                            fmt["sz"] = _hps(float(re.sub(r"[^\d.]", "", str(sz))) * 0.75)
+                        except Exception:
+                            pass
+            runs.append((node.get("text", ""), fmt))
+
+        elif ntype == "formyxaField":
+            attrs = node.get("attrs", {}) or {}
+            value = (attrs.get("value") or "").strip()
+            label = (attrs.get("label") or "Field").strip()
+            fmt   = {}
+            if attrs.get("bold"): fmt["b"] = True
+            if not value:         fmt["u"] = True
+            runs.append((value if value else f"[{label}]", fmt))
+    return runs
+
+
+def _has_text(content: list) -> bool:
+    return any(c.get("type") == "text" and c.get("text", "").strip() for c in content)
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object for zipfile; compressed bytes are drained by the caller."""
+
+    def __init__(self):
+        self._chunks = []
+        self.size    = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data)); self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear(); self.size = 0
+        return out
+
+
+# Rendered XML per top-level node, keyed by the node's canonical JSON plus the
+# render context (engine version, layout, template mtime), so a re-export only
+# renders the nodes that changed. Nodes that embed images are always rendered:
+# their docPr ids and rIds depend on the rest of the document and the image
+# may have changed. signaturesBlock is the only node that reads the signatory,
+# so the signatory does not need to be part of the key. Ordered-list numIds
+# are stored as placeholders and re-allocated when a fragment is reused.
+# Stream-engine exports run on EXPORT_POOL, so each worker keeps its own;
+# generate-docx sends a document to the same worker while it is idle
+# (ExportPool.slot_for) and records the stats each worker reports back.
+FRAGMENT_CACHE   = MemoryLRU(FRAGMENT_CACHE_MAX_BYTES)
+FRAGMENT_WORKERS: dict = {}   # export worker pid → its FRAGMENT_CACHE stats, as of its last export
+_UNCACHED_NODES  = ("image", "resizableImage", "signaturesBlock")
+_NUM_PLACEHOLDER = "\x00{}\x00"   # never in rendered text: _x_text rejects NUL
+
+
+def fragment_cache_stats() -> dict:
+    """FRAGMENT_CACHE stats summed over this process and the live export workers."""
+    live   = EXPORT_POOL.pids()
+    for pid in [p for p in FRAGMENT_WORKERS if p not in live]:   # worker killed and replaced
+        del FRAGMENT_WORKERS[pid]
+    parts  = [FRAGMENT_CACHE.stats(), *FRAGMENT_WORKERS.values()]
+    total  = {k: sum(p[k] for p in parts) for k in ("entries", "bytes", "maxBytes", "hits", "misses", "evictions")}
+    lookup = total["hits"] + total["misses"]
+    return {**total, "hitRate": round(total["hits"] / lookup, 3) if lookup else 0.0, "workers": len(FRAGMENT_WORKERS)}
+
+
+class DocxStreamWriter:
+
+    CHUNK_BYTES = 64 * 1024
+
+    def __init__(self, layout_key: str, fragments: bool = True):
+        self.layout_key = layout_key
+        self.fragments  = fragments   # False for one-off content (PDF conversion)
+        self.layout     = DOC_LAYOUTS[layout_key]
+        self.pkg        = TEMPLATES.package()
+        self._col_cache = {}
+        self._next_id   = self.pkg["nextId"]
+        self._rids      = set(self.pkg["rIds"])
+        self._media_ids = set(self.pkg["mediaNumbers"])
+        self._images    = {}   # sha1 → (rId, partname, blob, ext, content type)
+        self._num_ids   = set(self.pkg["numIds"])
+        self._nums      = []   # numIds added for ordered lists
+        self._context   = f"{ENGINE_VERSION}|{layout_key}|{TEMPLATES.template_mtime()}|"
+
+    # ── images ────────────────────────────────────────────────
+
+    def _image_rid(self, image) -> str:
+        known = self._images.get(image.sha1)
+        if known:
+            return known[0]
+        rid = next(f"rId{n}" for n in range(1, len(self._rids) + 2) if f"rId{n}" not in self._rids)
+        num = next(n for n in range(1, len(self._media_ids) + 2) if n not in self._media_ids)
+        self._rids.add(rid); self._media_ids.add(num)
+        self._images[image.sha1] = (rid, f"media/image{num}.{image.ext}", image.blob, image.ext, image.content_type)
+        return rid
+
+    def picture_run(self, blob: io.BytesIO, width_in: float) -> str:
+        image   = DocxImage.from_blob(blob.getvalue())
+        rid     = self._image_rid(image)
+        cx, cy  = image.scaled_dimensions(Inches(width_in), None)
+        shape   = self._next_id; self._next_id += 1
+        return (
+            f'<w:r><w:drawing><wp:inline{self.pkg["inlineNs"]}><wp:extent cx="{cx}" cy="{cy}"/>'
+            f'<wp:docPr id="{shape}" name="Picture {shape}"/>'
+            '<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<pic:pic><pic:nvPicPr><pic:cNvPr id="0" name="{image.filename}"/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            '<a:prstGeom prst="rect"/></pic:spPr></pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing></w:r>'
+        )
+
+    # ── tables ────────────────────────────────────────────────
+
+    def _col_width(self, cols: int) -> str:
+        if cols not in self._col_cache:
+            self._col_cache[cols] = str(Emu(self.pkg["blockWidth"] // cols).twips if cols > 0 else 0)
+        return self._col_cache[cols]
+
+    def _table(self, rows: list, cols: int, centered: bool, style: Optional[str] = None,
+               look: Optional[dict] = None) -> str:
+        """`rows` is a list of lists of <w:tc> XML; short rows are padded with empty cells."""
+        width = self._col_width(cols)
+        empty = _x_cell(width, "", "<w:p/>")
+        look  = ("<w:tblLook " + " ".join(f'w:{k}="{v}"' for k, v in look.items()) + "/>") if look else _TBL_LOOK
+        return (
+            "<w:tbl><w:tblPr>" + (f'<w:tblStyle w:val="{style_id(style)}"/>' if style else "")
+            + '<w:tblW w:type="auto" w:w="0"/>'
+            + ('<w:jc w:val="center"/>' if centered else "")
+            + '<w:tblLayout w:type="autofit"/>' + look + "</w:tblPr>"
+            + "<w:tblGrid>" + f'<w:gridCol w:w="{width}"/>' * cols + "</w:tblGrid>"
+            + "".join("<w:tr>" + "".join(r) + empty * (cols - len(r)) + "</w:tr>" for r in rows)
+            + "</w:tbl>"
+        )
+
+    def stream_meta_table(self, node) -> str:
+        rows = node.get("content", [])
+        if not rows: return ""
+        cols  = max(len(r.get("content", [])) for r in rows)
+        width = self._col_width(cols)
+        out   = []
+        for row in rows:
+            cells = []
+            for c_idx, cell_node in enumerate(row.get("content", [])):
+                runs, spaced = [], False
+                for child in cell_node.get("content", []):
+                    if child.get("type") != "paragraph": continue
+                    runs += _tiptap_runs(child.get("content", []) or []); spaced = True
+                tcpr = ""
+                if c_idx % 2 and cell_node.get("type") == "tableHeader":
+                    tcpr = f'<w:shd w:val="clear" w:color="auto" w:fill="{META_LABEL_FILL}"/>'
+                    runs = [(t, {**f, "b": True, "caps": True, "sz": _hps(9)}) for t, f in runs]
+                body = "".join(_x_run(t, f) for t, f in runs)
+                cells.append(_x_cell(width, tcpr, _x_para(_x_style(CELL_STYLE) if spaced else "", body)))
+            out.append(cells)
+        return self._table(out, cols, centered=True, style=META_TABLE_STYLE,
+                           look=table_look_flags(col_bands=True)) + "<w:p/>"
+
+    def stream_table_node(self, node) -> str:
+        rows = node.get("content", [])
+        if not rows: return ""
+        cols       = max(len(r.get("content", [])) for r in rows)
+        width      = self._col_width(cols)
+        first      = rows[0].get("content", [])
+        header_row = bool(first) and all(c.get("type") == "tableHeader" for c in first)
+        out        = []
+        for r_idx, row in enumerate(rows):
+            cells = []
+            for cell_node in row.get("content", []):
+                runs, spaced = [], False
+                for child in cell_node.get("content", []):
+                    if child.get("type") != "paragraph": continue
+                    if (child.get("attrs") or {}).get("instructional"): continue
+                    content = child.get("content", []) or []
+                    if not _has_text(content): continue
+                    runs += _tiptap_runs(content); spaced = True
+                tcpr = ""
+                if cell_node.get("type") == "tableHeader" and not (r_idx == 0 and header_row):
+                    tcpr = f'<w:shd w:val="clear" w:color="auto" w:fill="{META_HEADER_FILL}"/>'
+                    runs = [(t, {**f, "b": True}) for t, f in runs]
+                body = _x_para(_x_style(BODY_STYLE) if spaced else "", "".join(_x_run(t, f) for t, f in runs))
+                cells.append(_x_cell(width, tcpr, body))
+            out.append(cells)
+        return self._table(out, cols, centered=True, style=TABLE_STYLE, look=table_look_flags(first_row=header_row))
+
+    # ── blocks ────────────────────────────────────────────────
+
+    def stream_signatures_block(self, node, signatory: Optional[dict]) -> str:
+        attrs = node.get("attrs", {}) or {}
+        width = self._col_width(2)
+
+        def _set(text, bold=False, size=BODY_SIZE, tcpr=_NO_BORDERS):
+            fmt = {"sz": _hps(size), **({"b": True} if bold else {})}
+            return _x_cell(width, tcpr, _x_para(_spacing(2, 4), "<w:r/>" + _x_run(text, fmt)))
+
+        titles = [_set(attrs.get("leftTitle", "CLIENT"), True, 10), _set(attrs.get("rightTitle", "SERVICE PROVIDER"), True, 10)]
+
+        sig_row = []
+        for idx in range(2):
+            sig_img = fetch_image(signatory.get("signatureImageUrl"), 1.2) if (idx == 1 and signatory) else None
+            if sig_img:
+                sig_row.append(_x_cell(width, _NO_BORDERS, _x_para(_spacing(4, 2), self.picture_run(sig_img, 1.2))))
+            else:
+                sig_row.append(_x_cell(width, _NO_BORDERS + _BOTTOM_RULE, _x_para(_spacing(24, 2), "")))
+
+        name_row = [_x_cell(width, _NO_BORDERS + _BOTTOM_RULE, _x_para(_spacing(18, 2), "<w:r/>"))] * 2
+        if signatory:
+            text = f"{signatory.get('fullName', '')}  ({signatory.get('designation', '')})"
+            name_row[1] = _x_cell(width, _NO_BORDERS + _BOTTOM_RULE,
+                                  _x_para("", "<w:r/>" + _x_run(text, {"sz": _hps(9)})))
+
+        rows = [titles, sig_row, [_set("Signature", size=9)] * 2, name_row, [_set("Name / Date", size=9)] * 2]
+        return _x_para(_spacing(24, 6), "") + self._table(rows, 2, centered=True)
+
+    def stream_image_node(self, node) -> str:
+        img = fetch_image((node.get("attrs") or {}).get("src"), 4.5)
+        if not img: return ""
+        return _x_para(_x_style(BODY_STYLE), self.picture_run(img, 4.5))
+
+    def _list_num_id(self, ordered: bool) -> int:
+        if not ordered:
+            return self.pkg["bulletNumId"]
+        num = next(n for n in range(1, len(self._num_ids) + 2) if n not in self._num_ids)
+        self._num_ids.add(num); self._nums.append(num)
+        return num
+
+    def stream_list(self, node) -> str:
+        out, num_id = [], None
+        for li in node.get("content", []):
+            if li.get("type") != "listItem": continue
+            paras = [c for c in li.get("content", []) if c.get("type") == "paragraph"]
+            for i, child in enumerate(paras):
+                if (child.get("attrs") or {}).get("instructional"): continue
+                content = child.get("content", []) or []
+                if not _has_text(content): continue
+                if i == 0:
+                    num_id = num_id or self._list_num_id(node.get("type") == "orderedList")
+                    ppr = _x_style(LIST_STYLE, num_id)
+                else:
+                    ppr = _x_style(LIST_CONTINUE_STYLE)
+                out.append(_x_para(ppr, "".join(_x_run(t, f) for t, f in _tiptap_runs(content))))
+        return "".join(out)
+
+    def stream_node(self, node, signatory: Optional[dict] = None) -> str:
+        ntype = node.get("type")
+
+        if ntype == "heading":
+            runs = _tiptap_runs(node.get("content", []), sizes=False)
+            return _x_para(_x_style(HEADING_STYLE), "".join(_x_run(t, f) for t, f in runs))
+
+        if ntype == "paragraph":
+            attrs = node.get("attrs", {}) or {}
+            if attrs.get("instructional"): return ""
+            content = node.get("content", []) or []
+            if not _has_text(content): return ""
+            jc = _JC.get((attrs.get("textAlign") or "").lower())
+            return _x_para(_x_style(BODY_STYLE) + (f'<w:jc w:val="{jc}"/>' if jc else ""),
+                           "".join(_x_run(t, f) for t, f in _tiptap_runs(content)))
+
+        if ntype in ("bulletList", "orderedList"):
+            return self.stream_list(node)
+
+        if ntype == "table":
+            cls = (node.get("attrs") or {}).get("class", "")
+            return self.stream_meta_table(node) if cls == "meta-table" else self.stream_table_node(node)
+
+        if ntype == "signaturesBlock":
+            return self.stream_signatures_block(node, signatory)
+
+        if ntype in ("image", "resizableImage"):
+            return self.stream_image_node(node)
+
+        if ntype == "horizontalRule":
+            return _x_para('<w:pBdr><w:bottom w:val="single" w:sz="6" w:color="CBD5E1"/></w:pBdr>' + _spacing(12, 12), "")
+
+        if ntype == "pageBreak":
+            return _x_para('<w:pageBreakBefore w:val="true"/>', "")
+        return ""
+
+    def node_xml(self, node, signatory: Optional[dict] = None) -> str:
+        """stream_node through FRAGMENT_CACHE."""
+        if not self.fragments or node.get("type") in _UNCACHED_NODES:
+            return self.stream_node(node, signatory)
+        canonical = json.dumps(node, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        key       = self._context + sha256_hex(canonical.encode("utf-8"))
+        hit       = FRAGMENT_CACHE.get(key)
+        if hit is not None:
+            xml, nums = hit
+            for k in range(nums):
+                xml = xml.replace(_NUM_PLACEHOLDER.format(k), str(self._list_num_id(True)))
+            return xml
+        first    = len(self._nums)
+        xml      = self.stream_node(node, signatory)
+        template = xml
+        for k, num in enumerate(self._nums[first:]):
+            template = template.replace(f'<w:numId w:val="{num}"/>', f'<w:numId w:val="{_NUM_PLACEHOLDER.format(k)}"/>')
+        FRAGMENT_CACHE.put(key, (template, len(self._nums) - first), len(template))
+        return xml
+
+    # ── page shell ────────────────────────────────────────────
+
+    def stream_brand_header(self, brand: Optional[dict], title: Optional[str]) -> str:
+        out = []
+        header_img = fetch_image(self.layout.get("headerImageUrl"), 6.5)
+        if header_img:
+            out.append(_x_para(_spacing(0, 6) + '<w:jc w:val="center"/>', self.picture_run(header_img, 6.5)))
+        if not brand:
+            return "".join(out)
+
+        width = self._col_width(3)
+        small = {"color": _SLATE, "sz": _hps(8)}
+        logo  = fetch_image(brand.get("logoUrl"), 1.2) if self.layout.get("showLogo") else None
+        left  = _x_para("", "<w:r/>" + self.picture_run(logo, 1.2)) if logo else "<w:p/>"
+        center = _x_para("", "<w:r/>" + _x_run(brand.get("companyName", ""), {"b": True, "sz": _hps(10)}))
+        center += "".join(_x_para("", _x_run(line, small))
+                          for line in (brand.get("addressLine1"), brand.get("addressLine2")) if line)
+        right = "<w:p><w:r/></w:p>" + "".join(_x_para('<w:jc w:val="right"/>', _x_run(val, small))
+                                              for val in (brand.get("phone"), brand.get("email")) if val)
+        out.append(self._table([[_x_cell(width, _NO_BORDERS, left), _x_cell(width, _NO_BORDERS, center),
+                                 _x_cell(width, _NO_BORDERS, right)]], 3, centered=False))
+        if title:
+            out.append(_x_para(
+                _spacing(6, 8) + '<w:jc w:val="center"/><w:pBdr><w:top w:val="single" w:sz="8" w:color="3B82F6"/>'
+                '<w:bottom w:val="single" w:sz="8" w:color="3B82F6"/></w:pBdr>',
+                _x_run(title.upper(), {"b": True, "color": "1D4ED8", "sz": _hps(9)})))
+        out.append("<w:p/>")
+        return "".join(out)
+
+    def stream_signatory_footer(self, signatory: Optional[dict]) -> str:
+        if not signatory:
+            return ""
+        out = [_x_para(_spacing(24, 4), ""),
+               _x_para("", _x_run("Authorised Signatory", {"b": True, "color": _SLATE, "sz": _hps(9)}))]
+        sig_img = fetch_image(signatory.get("signatureImageUrl"), 1.5)
+        out.append(_x_para(_spacing(4, 2), self.picture_run(sig_img, 1.5)) if sig_img else _x_para(_spacing(16, 2), ""))
+        for text, bold in ((signatory.get("fullName", ""), True), (signatory.get("designation", ""), False)):
+            if text:
+                fmt = {"b": True} if bold else {"b": False, "color": _SLATE, "sz": _hps(10)}
+                out.append(_x_para(_spacing(0, 1), _x_run(text, fmt)))
+        return "".join(out)
+
+    def stream_footer_banner(self) -> str:
+        footer_img = fetch_image(self.layout.get("footerImageUrl"), 6.5)
+        if not footer_img:
+            return ""
+        return _x_para(_spacing(12, 0) + '<w:jc w:val="center"/>', self.picture_run(footer_img, 6.5))
+
+    # ── package ───────────────────────────────────────────────
+
+    def iter_body(self, tiptap_doc: Optional[dict], brand: Optional[dict], signatory: Optional[dict], file_name: str):
+        if self.layout.get("showLogo") or self.layout.get("headerImageUrl"):
+            yield self.stream_brand_header(brand, file_name)
+        if tiptap_doc and tiptap_doc.get("type") == "doc":
+            for node in tiptap_doc.get("content", []):
+                yield self.node_xml(node, signatory)
+        if self.layout.get("showSignature") and signatory:
+            yield self.stream_signatory_footer(signatory)
+        if self.layout.get("footerImageUrl"):
+            yield self.stream_footer_banner()
+
+    def iter_docx(self, tiptap_doc: Optional[dict], brand: Optional[dict] = None,
+                  signatory: Optional[dict] = None, file_name: str = "document", body=None):
+        """
+        Yield the .docx as compressed chunks while the body is still being
+        generated. `body` replaces iter_body with document.xml already
+        rendered elsewhere (no images or numbered lists; see iter_pdf_docx_xml).
+        """
+        sink = _ChunkSink()
+        zf   = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+        for name, data in self.pkg["parts"]:
+            zf.writestr(name, data)
+
+        with zf.open("word/document.xml", "w") as out:
+            out.write(self.pkg["prefix"])
+            for xml in body if body is not None else self.iter_body(tiptap_doc, brand, signatory, file_name):
+                out.write(xml.encode("utf-8"))
+                if sink.size >= self.CHUNK_BYTES:
+                    yield sink.drain()
+            out.write(self.pkg["suffix"])
+
+        rels, types = [], {}
+        for rid, partname, blob, ext, content_type in self._images.values():
+            zf.writestr(f"word/{partname}", blob)
+            rels.append(f'<Relationship Id="{rid}" Type="{RT.IMAGE}" Target="{partname}"/>')
+            if ext not in self.pkg["defaultExts"]:
+                types[ext] = content_type
+        nums = "".join(f'<w:num w:numId="{num}"><w:abstractNumId w:val="{self.pkg["orderedAbstractId"]}"/>'
+                       '<w:lvlOverride w:ilvl="0"><w:startOverride w:val="1"/></w:lvlOverride></w:num>' for num in self._nums)
+        zf.writestr(self.pkg["numberingName"], self.pkg["numberingHead"] + nums.encode() + self.pkg["numberingTail"])
+        zf.writestr("word/_rels/document.xml.rels",
+                    self.pkg["rels"].replace(b"</Relationships>", "".join(rels).encode() + b"</Relationships>"))
+        defaults = "".join(f'<Default Extension="{ext}" ContentType="{ct}"/>' for ext, ct in types.items())
+        zf.writestr("[Content_Types].xml", self.pkg["contentTypes"].replace(b"</Types>", defaults.encode() + b"</Types>"))
+        zf.close()
+        yield sink.drain()
+
+
+def doc_node_count(tiptap_doc: Any) -> int:
+    return len(tiptap_doc.get("content") or []) if isinstance(tiptap_doc, dict) else 0
+
+
+def use_stream_engine(tiptap_doc: Any) -> bool:
+    if DOCX_ENGINE != "auto":
+        return DOCX_ENGINE == "stream"
+    return doc_node_count(tiptap_doc) >= DOCX_STREAM_MIN_NODES
+
+
+# ─────────────────────────────────────────────────────────────
+# EXPORT POOL
+# ─────────────────────────────────────────────────────────────
+#
+# python-docx and PyMuPDF work is CPU-bound and would stall the event loop
+# (and every /api/job-status poll) for the length of an export. Large exports
+# run in EXPORT_WORKERS spawned processes instead. Each worker is its own
+# single-process executor, so an export that times out or whose client
+# disconnects is stopped by killing just that worker, which is then replaced.
+# Stream-engine exports are written by the worker to a temp file that the
+# request streams out as it grows (stream_pooled_docx), so a slow client
+# does not hold a worker past EXPORT_TIMEOUT; python-docx exports and batch
+# items come back whole. A run can prefer one worker (slot_for) so a
+# document's re-exports find that worker's caches warm; when that worker is
+# busy the run takes any idle one rather than queueing behind it.
+# RENDER_POOL is a second pool of the same kind, without the template
+# warm-up, that renders OCR page images (see aiter_pdf_page_images).
+
+def docx_export_bytes(tiptap_doc: Optional[dict], template_slug: Optional[str], design_key: Optional[str],
+                      brand: Optional[dict], signatory: Optional[dict], file_name: str) -> bytes:
+    if use_stream_engine(tiptap_doc):
+        writer = DocxStreamWriter(get_layout_key(template_slug, design_key))
+        return b"".join(writer.iter_docx(tiptap_doc, brand, signatory, file_name))
+    document = tiptap_doc_to_docx(tiptap_doc, template_slug, design_key, brand, signatory, file_name)
+    buf = io.BytesIO(); document.save(buf)
+    return buf.getvalue()
+
+
+def docx_stream_to_file(path: str, tiptap_doc: Optional[dict], template_slug: Optional[str],
+                        design_key: Optional[str], brand: Optional[dict], signatory: Optional[dict],
+                        file_name: str) -> dict:
+    """Stream-engine export written to `path` chunk by chunk, for the parent to send on as it grows."""
+    writer = DocxStreamWriter(get_layout_key(template_slug, design_key))
+    with open(path, "wb") as out:
+        for chunk in writer.iter_docx(tiptap_doc, brand, signatory, file_name):
+            out.write(chunk); out.flush()
+    return {"pid": os.getpid(), **FRAGMENT_CACHE.stats()}
+
+
+async def stream_pooled_docx(payload, key: str, headers: dict, request: Request) -> StreamingResponse:
+    """
+    Run docx_stream_to_file on EXPORT_POOL (on this document's worker when it
+    is idle) and stream the file out while the worker is still writing it,
+    so neither process holds the whole package. The response starts once
+    the first chunk exists: a failure before that is still an error status.
+    """
+    fd, path = tempfile.mkstemp(suffix=".docx")
+    os.close(fd)
+    slot = EXPORT_POOL.slot_for(f"{payload.fileName}|{get_layout_key(payload.templateSlug, payload.designKey)}")
+    work = asyncio.ensure_future(EXPORT_POOL.run(
+        docx_stream_to_file, path, payload.contentJson, payload.templateSlug, payload.designKey,
+        payload.brand, payload.signatory, payload.fileName or "document",
+        inline=doc_node_count(payload.contentJson) <= EXPORT_INLINE_MAX_NODES, request=request, slot=slot))
+    src = open(path, "rb")
+
+    async def _next_chunk() -> bytes:
+        while True:
+            chunk = await asyncio.to_thread(src.read, DocxStreamWriter.CHUNK_BYTES)
+            if chunk:
+                return chunk
+            if work.done():
+                chunk = await asyncio.to_thread(src.read, DocxStreamWriter.CHUNK_BYTES)   # written before it returned
+                if not chunk:
+                    stats = work.result()   # raises the worker's error
+                    if stats["pid"] != os.getpid():
+                        FRAGMENT_WORKERS[stats.pop("pid")] = stats
+                return chunk
+            await asyncio.wait([work], timeout=EXPORT_STREAM_POLL)
+
+    def _read_all() -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _cleanup():
+        work.cancel(); src.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    try:
+        first = await _next_chunk()
+    except BaseException:
+        _cleanup()
+        raise
+
+    async def _body():
+        try:
+            chunk = first
+            while chunk:
+                yield chunk
+                chunk = await _next_chunk()
+            size = os.path.getsize(path)
+            if size <= EXPORT_CACHE.max_bytes:
+                data = await asyncio.to_thread(_read_all)
+                EXPORT_CACHE.put(key, data, size)
+        finally:
+            _cleanup()
+
+    return StreamingResponse(_body(), media_type=DOCX_MIME, headers=headers)
+
+
+def pdf_text_docx_bytes(file_path: str) -> bytes:
+    """Digital PDF → plain DOCX: one paragraph per text block."""
+    pdf      = open_pdf(file_path)
+    word_doc = Document()
+    s = word_doc.sections[0]
+    s.top_margin = s.bottom_margin = s.left_margin = s.right_margin = Inches(1)
+    for page in pdf:
+        raw_text = page.get_text().strip()
+        if not raw_text: continue
+        for block in [b.strip() for b in raw_text.split("\n\n") if b.strip()]:
+            p = word_doc.add_paragraph(block)
+            p.paragraph_format.line_spacing = 1.5
+            p.paragraph_format.space_after  = Pt(12)
+            p.paragraph_format.space_before = Pt(0)
+            for run in p.runs:
+                run.font.name = "Times New Roman"; run.font.size = Pt(12)
+    buf = io.BytesIO()
+    word_doc.save(buf)
+    return buf.getvalue()
+
+
+def _export_worker_init():
+    TEMPLATES.warm()
+
+
+def _export_worker_ready() -> int:
+    return os.getpid()
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportPool:
+
+    def __init__(self, workers: int, initializer=_export_worker_init, name: str = "Export"):
+        self.workers = max(0, workers)
+        self.initializer = initializer
+        self.name        = name
+        self._slots: list = []   # index → single-process executor
+        self._idle:  list = []   # index → free to take work
+        self._waiters: Optional[deque] = None   # futures of runs waiting for a worker; None until started
+        self.busy = self.waiting = 0
+        self.inline = self.completed = self.failed = 0
+        self.timeouts = self.cancelled = self.restarts = 0
+        self.queued = 0                                # runs that got a slot, and their wait for it
+        self.queue_wait = self.queue_wait_max = 0.0
+
+    def _new_slot(self) -> ProcessPoolExecutor:
+        slot = ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn"),
+                                   initializer=self.initializer)
+        slot.submit(_export_worker_ready)   # spawn + warm now, not on the first export
+        return slot
+
+    @staticmethod
+    def _kill(slot: ProcessPoolExecutor):
+        # No public way to stop a running task; terminate the worker process itself
+        for proc in list((slot._processes or {}).values()):
+            proc.kill()
+        slot.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        if self._waiters is not None or not self.workers:
+            return
+        self._slots   = [self._new_slot() for _ in range(self.workers)]
+        self._idle    = [True] * self.workers
+        self._waiters = deque()
+        log(f"{self.name} pool started", f"workers={self.workers}")
+
+    def shutdown(self):
+        for slot in self._slots:
+            slot.shutdown(wait=False, cancel_futures=True)
+        self._slots, self._idle, self._waiters = [], [], None
+
+    def pids(self) -> set:
+        return {pid for slot in self._slots for pid in (slot._processes or {})}
+
+    def slot_for(self, affinity: str) -> Optional[int]:
+        """Stable worker index for `affinity`, so related runs share that worker's in-process caches."""
+        return int(sha256_hex(affinity.encode("utf-8"))[:8], 16) % self.workers if self.workers else None
+
+    def _release(self, index: int):
+        while self._waiters:   # hand the worker straight to the oldest waiting run
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(index)
+                return
+        self._idle[index] = True
+
+    async def _acquire(self, prefer: Optional[int] = None) -> int:
+        t0 = time.perf_counter()
+        if prefer is not None and self._idle[prefer]:
+            free = prefer
+        else:   # pinned worker busy: any idle one beats queueing behind it
+            free = next((i for i, idle in enumerate(self._idle) if idle), None)
+        if free is not None:
+            self._idle[free] = False
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            self.waiting += 1
+            try:
+                free = await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():   # handed a worker as we were cancelled
+                    self._release(fut.result())
+                raise
+            finally:
+                self.waiting -= 1
+        waited = time.perf_counter() - t0
+        self.queued += 1; self.queue_wait += waited
+        self.queue_wait_max = max(self.queue_wait_max, waited)
+        return free
+
+    async def _run_in_slot(self, fn, *args, index: Optional[int] = None):
+        """Wait for a free worker (`index` if it is idle), then give `fn` EXPORT_TIMEOUT seconds on it; queueing is not timed."""
+        index = await self._acquire(index)
+        self.busy += 1
+        try:
+            slot = self._slots[index]
+            return await asyncio.wait_for(asyncio.wrap_future(slot.submit(fn, *args)), EXPORT_TIMEOUT)
+        except (asyncio.CancelledError, asyncio.TimeoutError, BrokenProcessPool):
+            self._kill(slot)
+            if self._waiters is not None:   # not shutting down
+                self._slots[index] = self._new_slot(); self.restarts += 1
+            raise
+        finally:
+            self.busy -= 1
+            if self._waiters is not None:
+                self._release(index)
+
+    @staticmethod
+    async def _disconnected(request: Request):
+        while not await request.is_disconnected():
+            await asyncio.sleep(EXPORT_DISCONNECT_POLL)
+
+    async def run(self, fn, *args, inline: bool = False, request: Optional[Request] = None,
+                  slot: Optional[int] = None):
+        """
+        `fn(*args)` in a worker process (worker `slot` when given and idle,
+        see slot_for), or in a thread when `inline` (or the pool has no workers).
+        Raises asyncio.TimeoutError once `fn` has run EXPORT_TIMEOUT seconds
+        in its worker (time queued for a worker does not count) and
+        ExportCancelled if `request`'s client disconnects first.
+        """
+        if inline or not self.workers:
+            self.inline += 1
+            return await asyncio.to_thread(fn, *args)
+        self.start()
+        work  = asyncio.ensure_future(self._run_in_slot(fn, *args, index=slot))
+        watch = asyncio.ensure_future(self._disconnected(request)) if request is not None else None
+        try:
+            await asyncio.wait([t for t in (work, watch) if t], return_when=asyncio.FIRST_COMPLETED)
+            if not work.done():
+                self.cancelled += 1
+                raise ExportCancelled("client disconnected")
+            result = work.result()
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except (ExportCancelled, asyncio.CancelledError):
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            tasks = [t for t in (work, watch) if t]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)   # let a killed worker be replaced first
+
+    def stats(self) -> dict:
+        return {
+            "workers":    self.workers,
+            "busy":       self.busy,
+            "waiting":    self.waiting,
+            "saturation": round((self.busy + self.waiting) / self.workers, 2) if self.workers else 0.0,
+            "inline":     self.inline,
+            "completed":  self.completed,
+            "failed":     self.failed,
+            "timeouts":   self.timeouts,
+            "cancelled":  self.cancelled,
+            "restarts":   self.restarts,
+            "queueWaitAvgSeconds": round(self.queue_wait / self.queued, 3) if self.queued else 0.0,
+            "queueWaitMaxSeconds": round(self.queue_wait_max, 3),
+        }
+
+
+EXPORT_POOL = ExportPool(EXPORT_WORKERS)
+RENDER_POOL = ExportPool(OCR_RENDER_WORKERS, initializer=None, name="Render")
+
+
+# ─────────────────────────────────────────────────────────────
+# DIGITAL PDF → DOCX  (layout mode)
+# ─────────────────────────────────────────────────────────────
+#
+# Each worker opens the PDF by path and turns a page range into TipTap nodes
+# from PyMuPDF's span output: font size relative to the document's body size
+# (measured once, before the ranges go out, so every range agrees) makes
+# headings, span flags keep bold / italic, ruled tables found by
+# find_tables become table nodes. The ranges come back in page order and go
+# through DocxStreamWriter, with at most 2 × EXPORT_WORKERS ranges in flight,
+# so memory does not grow with the page count.
+
+PDF_SPAN_BOLD   = 16   # fitz span flags
+PDF_SPAN_ITALIC = 2
+
+
+def pdf_page_count(file_path: str) -> int:
+    with fitz.open(file_path) as pdf:
+        return len(pdf)
+
+
+def _pdf_text(text: Optional[str]) -> str:
+    return _XML_INVALID.sub("", text or "")
+
+
+def _pdf_block_runs(block: dict) -> tuple:
+    """([text, marks] runs with lines joined by spaces, {rounded size: chars})."""
+    runs, sizes = [], {}
+    for line in block.get("lines", []):
+        if runs and not runs[-1][0].endswith((" ", "-")):
+            runs[-1][0] += " "
+        for span in line.get("spans", []):
+            text = _pdf_text(span.get("text"))
+            if not text:
+                continue
+            flags = span.get("flags", 0)
+            marks = tuple(m for m, bit in (("bold", PDF_SPAN_BOLD), ("italic", PDF_SPAN_ITALIC)) if flags & bit)
+            size  = round(span.get("size", 0) * 2) / 2
+            sizes[size] = sizes.get(size, 0) + len(text.strip())
+            if runs and (runs[-1][1] == marks or not text.strip()):
+                runs[-1][0] += text
+            else:
+                runs.append([text, marks])
+    return runs, sizes
+
+
+def _pdf_text_nodes(runs: list) -> list:
+    nodes = []
+    for n, (text, marks) in enumerate(runs):
+        if n == 0: text = text.lstrip()
+        if n == len(runs) - 1: text = text.rstrip()
+        if text:
+            nodes.append({"type": "text", "text": text, **({"marks": [{"type": m} for m in marks]} if marks else {})})
+    return nodes
+
+
+def _pdf_table_node(table) -> Optional[dict]:
+    rows = [[_pdf_text(c).strip() for c in row] for row in table.extract()]
+    if len(rows) < 2 or max(len(r) for r in rows) < 2:
+        return None
+    cell = lambda kind, t: {"type": kind, "content": [{"type": "paragraph", "content": [{"type": "text", "text": t}] if t else []}]}
+    return {"type": "table", "content": [
+        {"type": "tableRow", "content": [cell("tableHeader" if r == 0 else "tableCell", t) for t in row]}
+        for r, row in enumerate(rows)]}
+
+
+def _pdf_body_size(pdf) -> float:
+    """Most common font size (by characters) over up to PDF_BODY_SAMPLE_PAGES evenly spaced pages."""
+    count = len(pdf)
+    step  = max(1, -(-count // max(1, PDF_BODY_SAMPLE_PAGES)))
+    sizes = {}
+    for n in range(0, count, step):
+        for span in pdf[n].get_texttrace():   # spans without layout analysis: cheaper than get_text("dict")
+            size = round(span["size"] * 2) / 2
+            sizes[size] = sizes.get(size, 0) + len(span["chars"])
+    return max(sizes, key=sizes.get) if sizes else 12
+
+
+def pdf_body_size(file_path: str) -> float:
+    with fitz.open(file_path) as pdf:
+        return _pdf_body_size(pdf)
+
+
+def pdf_pages_to_tiptap(file_path: str, start: int, stop: int, body_size: Optional[float] = None) -> list:
+    """TipTap nodes for pages [start, stop), in reading order; `body_size` defaults to the whole document's."""
+    pages = []   # per page: [(y, node or (runs, sizes))]
+    with fitz.open(file_path) as pdf:
+        body_size = body_size or _pdf_body_size(pdf)
+        for page in pdf.pages(start, stop):
+            items, boxes = [], []
+            if PDF_EXPORT_TABLES:
+                for table in page.find_tables().tables:
+                    node = _pdf_table_node(table)
+                    if node:
+                        items.append((table.bbox[1], node)); boxes.append(fitz.Rect(table.bbox))
+            for block in page.get_text("dict", sort=True)["blocks"]:
+                if block.get("type") != 0: continue
+                rect = fitz.Rect(block["bbox"])
+                if any(box.contains((rect.tl + rect.br) / 2) for box in boxes): continue
+                runs, sizes = _pdf_block_runs(block)
+                if not runs: continue
+                items.append((rect.y0, (runs, sizes)))
+            pages.append(sorted(items, key=lambda item: item[0]))
+
+    nodes = []
+    for items in pages:
+        for _, item in items:
+            if isinstance(item, dict):
+                nodes.append(item); continue
+            runs, sizes = item
+            content = _pdf_text_nodes(runs)
+            if not content: continue
+            size  = max(sizes, key=sizes.get)
+            ratio = size / body_size if body_size else 1
+            if ratio >= 1.15 and sum(len(t["text"]) for t in content) <= 200:
+                level = 1 if ratio >= 1.6 else 2 if ratio >= 1.3 else 3
+                nodes.append({"type": "heading", "attrs": {"level": level}, "content": content})
+            else:
+                nodes.append({"type": "paragraph", "content": content})
+    return nodes
+
+
+def pdf_pages_to_docx_xml(file_path: str, start: int, stop: int, body_size: float) -> str:
+    """document.xml body for pages [start, stop); headings, paragraphs and tables need no writer state."""
+    writer = DocxStreamWriter("default", fragments=False)
+    return "".join(writer.stream_node(node) for node in pdf_pages_to_tiptap(file_path, start, stop, body_size))
+
+
+def iter_pdf_docx_xml(file_path: str, page_count: int, loop: asyncio.AbstractEventLoop):
+    """
+    All pages' body XML in order. Runs in a thread: ranges are extracted and
+    rendered on EXPORT_POOL (so each is timed and counted like any export),
+    submitted on `loop` a bounded window ahead of the one being consumed.
+    """
+    step    = max(1, PDF_EXPORT_RANGE_PAGES)
+    ranges  = deque((s, min(s + step, page_count)) for s in range(0, page_count, step))
+    window  = max(2, 2 * EXPORT_POOL.workers)
+    pending = deque()
+    body    = pdf_body_size(file_path)
+    submit  = lambda r: asyncio.run_coroutine_threadsafe(
+        EXPORT_POOL.run(pdf_pages_to_docx_xml, file_path, *r, body), loop)
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < window:
+                pending.append(submit(ranges.popleft()))
+            yield pending.popleft().result()
+    finally:
+        for future in pending:   # abandoned download: stop the workers still extracting
+            future.cancel()
+
+
+# ─────────────────────────────────────────────────────────────
+# EXPORT CACHE
+# ─────────────────────────────────────────────────────────────
+#
+# Re-exports of an identical request (double clicks, preview then download)
+# are served from memory. The key doubles as the ETag. It covers the request,
+# engine and template but not the header/logo/signature images behind the
+# brand URLs, so entries expire with the asset cache (EXPORT_CACHE_TTL
+# defaults to ASSET_CACHE_TTL) and a matching If-None-Match only gets a 304
+# while the entry is still cached; after that the export is rebuilt.
+
+class ExportCache(MemoryLRU):
+
+    def __init__(self, max_bytes: int, ttl: float):
+        super().__init__(max_bytes, ttl)
+        self.not_modified = 0
+
+    def stats(self) -> dict:
+        return {**super().stats(), "notModified": self.not_modified}
+
+
+EXPORT_CACHE = ExportCache(EXPORT_CACHE_MAX_BYTES, EXPORT_CACHE_TTL)
+
+
+def export_cache_key(payload: BaseModel) -> str:
+    """Canonical JSON of the request + ENGINE_VERSION + chosen engine + template mtime (not asset contents)."""
+    request = json.dumps(payload.model_dump(), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    engine  = "stream" if use_stream_engine(getattr(payload, "contentJson", None)) else "python-docx"
+    return sha256_hex("|".join((ENGINE_VERSION, engine, str(TEMPLATES.template_mtime()), request)).encode("utf-8"))
+
+
+def export_etag(key: str) -> str:
+    return f'"{key[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+# ─────────────────────────────────────────────────────────────
+# BATCH EXPORT
+# ─────────────────────────────────────────────────────────────
+#
+# Items render in parallel on EXPORT_POOL (at most one per worker in flight,
+# so a large batch does not crowd single exports out of the queue) and are
+# appended to the ZIP in completion order. Workers keep their templates and
+# asset cache between items, and items already in EXPORT_CACHE are not
+# rendered again. A failed item is listed in manifest.json instead of failing
+# the batch.
+
+def docx_filename(file_name: Optional[str]) -> str:
+    safe_name = sanitize_filename(file_name or "document")
+    return safe_name if safe_name.lower().endswith(".docx") else safe_name + ".docx"
+
+
+def _unique_name(name: str, taken: set) -> str:
+    stem, ext, n = name[:-5], name[-5:], 2
+    while name.lower() in taken:
+        name = f"{stem} ({n}){ext}"; n += 1
+    taken.add(name.lower())
+    return name
+
+
+async def iter_docx_batch(items: list):
+    """Yield a ZIP (stored, .docx is already deflated) as items finish, ending with manifest.json."""
+    sink  = _ChunkSink()
+    zf    = zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED)
+    gate  = asyncio.Semaphore(max(1, EXPORT_POOL.workers))
+    t0    = time.time()
+
+    async def render(idx: int, item) -> tuple:
+        key    = export_cache_key(item)
+        cached = EXPORT_CACHE.get(key)
+        if cached is not None:
+            return idx, cached, None
+        async with gate:
+            try:
+                data = await EXPORT_POOL.run(
+                    docx_export_bytes, item.contentJson, item.templateSlug, item.designKey,
+                    item.brand, item.signatory, item.fileName or "document")
+                EXPORT_CACHE.put(key, data, len(data))
+                return idx, data, None
+            except asyncio.TimeoutError:
+                return idx, None, "EXPORT_TIMEOUT"
+            except Exception as e:
+                log("❌ Batch item failed", f"#{idx}: {e!r}")
+                return idx, None, str(e) or type(e).__name__
+
+    tasks    = [asyncio.ensure_future(render(i, item)) for i, item in enumerate(items)]
+    manifest = [None] * len(items)
+    taken    = set()
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            idx, data, error = await next_done
+            entry = {"index": idx, "fileName": items[idx].fileName}
+            if error is None:
+                entry.update(status="ok", file=_unique_name(docx_filename(items[idx].fileName), taken), bytes=len(data))
+                zf.writestr(entry["file"], data)
+            else:
+                entry.update(status="error", error=error)
+            manifest[idx] = entry
+            yield sink.drain()
+        ok = sum(1 for m in manifest if m["status"] == "ok")
+        zf.writestr("manifest.json", json.dumps({
+            "items": manifest, "ok": ok, "failed": len(items) - ok, "seconds": round(time.time() - t0, 2),
+        }, ensure_ascii=False, indent=2))
+        zf.close()
+        yield sink.drain()
+    finally:
+        for t in tasks:   # client went away: stop queued and running items
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 # =============================================================
 # ░░░░  SECTION 3 — ALL ROUTES  ░░░░░░░░░░░░░░░░░░░░░░░░░░░░░
 # =============================================================
@@ -1045,86 +4180,208 @@ def sanitize_filename(name: str) -> str:
 # ── OCR / Job routes (unchanged) ─────────────────────────────
 
 class ProcessRequest(BaseModel):
-    jobId: str
+    jobId:    str
+    priority: str = "paid"   # "paid" | "free" (free-preview lane)
 
 @app.post("/api/handwritten/process")
-async def start_handwritten_process(payload: ProcessRequest, background_tasks: BackgroundTasks):
-    log("Starting background OCR job", payload.jobId)
-    update_job(payload.jobId, state="queued")
-    background_tasks.add_task(run_ocr_job, payload.jobId)
-    return {"started": True}
+async def start_handwritten_process(payload: ProcessRequest):
+    log("Queueing OCR job", f"{payload.jobId} lane={payload.priority}")
+    # Moved to "queued" before submit, so a worker that picks the job up finds it
+    # there; rolled back to "uploaded" if the queue turns it away. A duplicate or
+    # retried POST for a job already running or done must not run (and bill) it again.
+    if not await asyncio.to_thread(transition_job, payload.jobId, ("uploaded", "error"),
+                                   state="queued", priority=payload.priority):
+        job = await asyncio.to_thread(load_job, payload.jobId)
+        if not job:
+            raise HTTPException(status_code=404, detail="JOB_NOT_FOUND")
+        if job.get("state") != "queued":
+            log("OCR job not re-queued", f"{payload.jobId} is {job.get('state')}")
+            return {"started": False, "state": job.get("state"), "queuePosition": None}
+        # already "queued": submit is idempotent, this just reports its place in line
+    try:
+        position = SCHEDULER.submit(payload.jobId, payload.priority)
+    except QueueFullError as e:
+        log("⚠️ OCR queue full", repr(e))
+        await asyncio.to_thread(transition_job, payload.jobId, ("queued",), state="uploaded")
+        return JSONResponse(status_code=429, content={"error": "QUEUE_FULL"}, headers={"Retry-After": "30"})
+    return {"started": True, "queuePosition": position}
 
 
 @app.post("/api/job-register")
 async def register_job(payload: dict):
     jobId = payload["jobId"]
-    update_job(jobId, filePath=payload["filePath"], source=payload.get("source", "scanned"),
-               strict=payload.get("strict", True), state="uploaded")
+    await asyncio.to_thread(update_job, jobId, filePath=payload["filePath"], source=payload.get("source", "scanned"),
+                            strict=payload.get("strict", True), state="uploaded")
     return {"ok": True}
 
 
 @app.get("/api/job-status")
 async def job_status(jobId: str):
-    job = load_job(jobId)
+    job = await asyncio.to_thread(load_job, jobId)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
+    if job.get("state") == "queued":
+        job["queuePosition"] = SCHEDULER.position(jobId)
     return job
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/api/job-events")
+async def job_events(jobId: str, request: Request):
+    """
+    Server-Sent Events view of one job. Driven by the same job-record
+    updates as /api/job-status: wakes on in-process writes and re-reads
+    the store every JOB_EVENTS_POLL seconds for writes from other workers.
+
+    Events: state · stage (progress + timings) · markdown (partial) · done
+    """
+    if not await asyncio.to_thread(load_job, jobId):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        loop    = asyncio.get_running_loop()
+        wake    = asyncio.Event()
+        watcher = (loop, wake)
+        JOB_WATCHERS.setdefault(jobId, set()).add(watcher)
+        last    = {"version": None, "state": None, "progress": None, "markdown": None}
+        idle    = 0.0
+        try:
+            while not await request.is_disconnected():
+                wake.clear()
+                job = await asyncio.to_thread(load_job, jobId)
+                if not job:
+                    yield _sse("done", {"state": "missing"}); return
+                if job.get("version") != last["version"]:
+                    last["version"] = job.get("version")
+                    state = job.get("state")
+                    if state != last["state"]:
+                        last["state"] = state
+                        payload = {"state": state}
+                        if state == "queued":
+                            payload["queuePosition"] = SCHEDULER.position(jobId)
+                        yield _sse("state", payload)
+                    if job.get("progress") and job["progress"] != last["progress"]:
+                        last["progress"] = job["progress"]
+                        yield _sse("stage", job["progress"])
+                    md = (job.get("partialOffset", 0), job.get("partialMarkdown"))
+                    if md[1] and md != last["markdown"]:
+                        last["markdown"] = md
+                        yield _sse("markdown", {"markdown": md[1], "offset": md[0]})
+                    if state in FINISHED_JOB_STATES:
+                        yield _sse("done", {"state": state}); return
+                    idle = 0.0
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=JOB_EVENTS_POLL)
+                except asyncio.TimeoutError:
+                    idle += JOB_EVENTS_POLL
+                    if idle >= 15:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+        finally:
+            JOB_WATCHERS.get(jobId, set()).discard(watcher)
+            if not JOB_WATCHERS.get(jobId):
+                JOB_WATCHERS.pop(jobId, None)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "ocrCache":     OCR_CACHE.stats(),
+        "ocrScheduler": SCHEDULER.stats(),
+        "assetCache":   ASSET_CACHE.stats(),
+        "templates":    TEMPLATES.stats(),
+        "exportPool":   EXPORT_POOL.stats(),
+        "renderPool":   RENDER_POOL.stats(),
+        "exportCache":  EXPORT_CACHE.stats(),
+        "fragments":    fragment_cache_stats(),
+    }
+
+
 @app.post("/api/job-complete-free")
 async def complete_free_job(payload: dict):
-    update_job(payload["jobId"], state="free-ready", source="digital-pdf")
+    await asyncio.to_thread(update_job, payload["jobId"], state="free-ready", source="digital-pdf")
     return {"ok": True}
 
 
 @app.post("/api/detect-pdf-type")
 async def detect_pdf_type_route(file: UploadFile = File(...)):
-    data = await file.read()
-    doc  = fitz.open(stream=data, filetype="pdf")
-    for i in range(min(len(doc), 3)):
-        if doc.load_page(i).get_text().strip():
-            return {"type": "digital"}
-    return {"type": "scanned"}
+    """
+    "type" stays the whole-file verdict the frontend routes on: any scanned
+    page sends the file to OCR. "pages" is the per-page map behind it.
+    """
+    try:
+        path, file_hash, _ = await spool_upload(file, max_bytes=UPLOAD_MAX_BYTES)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="FILE_TOO_LARGE")
+    try:
+        kinds = await asyncio.to_thread(pdf_page_kinds, path, file_hash)
+    except (fitz.FileDataError, RuntimeError, ValueError) as e:
+        log("⚠️ PDF detection failed", repr(e))
+        raise HTTPException(status_code=400, detail="INVALID_PDF")
+    finally:
+        os.remove(path)
+    scanned = kinds["pages"].count("scanned")
+    return {
+        "type":      "scanned" if scanned or not kinds["pageCount"] else "digital",
+        "mixed":     0 < scanned < kinds["pageCount"],
+        "pageCount": kinds["pageCount"],
+        "pages":     kinds["pages"],
+        "hash":      kinds["hash"],
+    }
 
 
 class ExportRequest(BaseModel):
     filePath: str
+    mode:     Optional[str] = None   # "plain" | "layout"; default PDF_EXPORT_MODE
 
 @app.post("/api/export-digital-docx")
-async def export_digital_docx(payload: ExportRequest):
+async def export_digital_docx(payload: ExportRequest, request: Request):
     if not os.path.exists(payload.filePath):
         raise HTTPException(status_code=400, detail="FILE_NOT_FOUND")
-    with open(payload.filePath, "rb") as f:
-        pdf_bytes = f.read()
-    pdf      = fitz.open(stream=pdf_bytes, filetype="pdf")
-    word_doc = Document()
-    s = word_doc.sections[0]
-    s.top_margin = s.bottom_margin = s.left_margin = s.right_margin = Inches(1)
-    for page in pdf:
-        raw_text = page.get_text().strip()
-        if not raw_text: continue
-        for block in [b.strip() for b in raw_text.split("\n\n") if b.strip()]:
-            p = word_doc.add_paragraph(block)
-            p.paragraph_format.line_spacing = 1.5
-            p.paragraph_format.space_after  = Pt(12)
-            p.paragraph_format.space_before = Pt(0)
-            for run in p.runs:
-                run.font.name = "Times New Roman"; run.font.size = Pt(12)
-    buf = io.BytesIO()
-    word_doc.save(buf); buf.seek(0)
-    return StreamingResponse(buf,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": "attachment; filename=Converted_Document.docx"})
+    headers = {"Content-Disposition": "attachment; filename=Converted_Document.docx"}
+
+    if (payload.mode or PDF_EXPORT_MODE) == "layout":
+        try:
+            page_count = await asyncio.to_thread(pdf_page_count, payload.filePath)
+            body   = iter_pdf_docx_xml(payload.filePath, page_count, asyncio.get_running_loop())
+            chunks = DocxStreamWriter("default", fragments=False).iter_docx(None, body=body)
+            first  = await asyncio.to_thread(next, chunks)   # first ranges extracted: the PDF opens and parses
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="EXPORT_TIMEOUT")
+        except Exception as e:
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+
+        def _body():
+            yield first
+            yield from chunks
+
+        return StreamingResponse(_body(), media_type=DOCX_MIME, headers=headers)
+
+    inline = os.path.getsize(payload.filePath) <= EXPORT_INLINE_MAX_BYTES
+    try:
+        data = await EXPORT_POOL.run(pdf_text_docx_bytes, payload.filePath, inline=inline, request=request)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="EXPORT_TIMEOUT")
+    except ExportCancelled:
+        return Response(status_code=499)
+    return Response(content=data, media_type=DOCX_MIME, headers=headers)
 
 
 @app.post("/api/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
-        os.makedirs("uploads", exist_ok=True)
-        file_path = os.path.join("uploads", f"{datetime.now().timestamp()}_{file.filename}")
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        return {"filePath": file_path}
+        stored = await store_upload(file)
+        log("Upload stored", f"{stored['hash'][:12]} {stored['size']}B dedup={stored['deduplicated']}")
+        return stored
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="FILE_TOO_LARGE")
     except Exception:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="UPLOAD_FAILED")
@@ -1141,8 +4398,8 @@ async def parse_document_route(
         raw_bytes = await file.read()
         if not raw_bytes:
             raise HTTPException(status_code=400, detail="EMPTY_FILE")
-        image_bytes = pdf_to_image_bytes(raw_bytes) if is_pdf(raw_bytes) else to_png_bytes(raw_bytes)
-        document    = parse_document(image_bytes)
+        page_images = await asyncio.to_thread(load_page_images, raw_bytes)
+        document    = await parse_pages(page_images)
         return {"success": True, "engine_version": ENGINE_VERSION, "document": document}
     except HTTPException:
         raise
@@ -1168,37 +4425,60 @@ class GenerateDocxRequest(BaseModel):
 
 
 @app.post("/generate-docx")
-async def generate_docx_route(payload: GenerateDocxRequest):
+async def generate_docx_route(payload: GenerateDocxRequest, request: Request):
     try:
         log("GENERATE DOCX", f"slug={payload.templateSlug} design={payload.designKey} file={payload.fileName}")
 
-        document = tiptap_doc_to_docx(
-            tiptap_doc    = payload.contentJson,
-            template_slug = payload.templateSlug,
-            design_key    = payload.designKey,
-            brand         = payload.brand,
-            signatory     = payload.signatory,
-            file_name     = payload.fileName or "document",
-        )
-
-        buf = io.BytesIO()
-        document.save(buf); buf.seek(0)
-
-        safe_name = sanitize_filename(payload.fileName or "document")
-        if not safe_name.lower().endswith(".docx"):
-            safe_name += ".docx"
-
-        return Response(
-            content=buf.read(),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f'attachment; filename="{safe_name}"'},
+        key     = export_cache_key(payload)
+        headers = {"Content-Disposition": f'attachment; filename="{docx_filename(payload.fileName)}"',
+                   "ETag": export_etag(key)}
+        cached = EXPORT_CACHE.get(key)
+        if cached is not None:   # 304 only for a live entry: assets may have changed since it expired
+            if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+                EXPORT_CACHE.not_modified += 1
+                return Response(status_code=304, headers={"ETag": headers["ETag"]})
+            return Response(content=cached, media_type=DOCX_MIME, headers=headers)
+
+        if use_stream_engine(payload.contentJson):
+            return await stream_pooled_docx(payload, key, headers, request)
+
+        data = await EXPORT_POOL.run(
+            docx_export_bytes, payload.contentJson, payload.templateSlug, payload.designKey,
+            payload.brand, payload.signatory, payload.fileName or "document",
+            inline  = doc_node_count(payload.contentJson) <= EXPORT_INLINE_MAX_NODES,
+            request = request,
         )
+        EXPORT_CACHE.put(key, data, len(data))
+        return Response(content=data, media_type=DOCX_MIME, headers=headers)
 
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="EXPORT_TIMEOUT")
+    except ExportCancelled:
+        return Response(status_code=499)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class GenerateDocxBatchRequest(BaseModel):
+    items:    list[GenerateDocxRequest]
+    fileName: Optional[str] = Field(default="documents")
+
+
+@app.post("/generate-docx/batch")
+async def generate_docx_batch_route(payload: GenerateDocxBatchRequest):
+    log("GENERATE DOCX BATCH", f"items={len(payload.items)}")
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="EMPTY_BATCH")
+    if len(payload.items) > EXPORT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail="BATCH_TOO_LARGE")
+    zip_name = sanitize_filename(payload.fileName or "documents")
+    if not zip_name.lower().endswith(".zip"):
+        zip_name += ".zip"
+    return StreamingResponse(iter_docx_batch(payload.items), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{zip_name}"'})
+
+
 # ─────────────────────────────────────────────────────────────
 # ENTRY POINT
 # ─────────────────────────────────────────────────────────────
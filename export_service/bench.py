@@ -0,0 +1,449 @@
+# bench.py
+# =============================================================
+# Micro-benchmarks for the OCR render path and the DOCX exporter.
+#
+#   python bench.py stitch        # legacy vs. canvas page stitching
+#   python bench.py render        # stitched canvas vs. lazy per-page rendering on scanned PDFs
+#   python bench.py export        # python-docx vs. streaming DOCX writer
+#   python bench.py tables        # per-cell indexing vs. one-pass table rendering
+#   python bench.py docxml        # document.xml size + export time on sample documents
+#   python bench.py incremental   # stream export before / after a one-paragraph edit
+#   python bench.py pdfexport     # digital PDF → DOCX, plain vs. page-parallel layout mode
+#
+# Each case runs in a fresh process so peak RSS is not polluted by the
+# previous one. Needs the same .env as app.py (keys may be dummies).
+# =============================================================
+
+import os
+import sys
+import time
+import resource
+import tracemalloc
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+os.environ.setdefault("HANDW_API_KEY", "bench")
+os.environ.setdefault("JOB_STORE_BACKEND", "memory")
+os.environ.setdefault("OCR_CACHE_MAX_BYTES", "0")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _run_isolated(fn, *args) -> dict:
+    # executor workers are non-daemonic, so a case may start its own process pool
+    with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def _measure(work, trace: bool = True) -> dict:
+    """`trace=False` skips tracemalloc, which slows object-heavy Python code several-fold."""
+    base = _peak_rss_mb()
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    work()
+    elapsed = time.perf_counter() - t0
+    py_peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 3), "py_peak_mb": round(py_peak / 2**20, 1),
+            "rss_growth_mb": round(_peak_rss_mb() - base, 1)}
+
+
+def _table(title: str, header: tuple, rows: list):
+    print(f"\n{title}")
+    widths = [max(len(str(x)) for x in col) for col in zip(header, *rows)]
+    for row in (header, *rows):
+        print("  ".join(str(x).rjust(w) for x, w in zip(row, widths)))
+
+
+# ─────────────────────────────────────────────────────────────
+# STITCH — legacy PNG round-trip vs. preallocated canvas
+# ─────────────────────────────────────────────────────────────
+
+def _sample_pdf(pages: int) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        for line in range(40):
+            page.insert_text((56, 60 + line * 18), f"Page {n + 1} line {line + 1} — the quick brown fox 0123456789",
+                             fontsize=11)
+    return doc.tobytes()
+
+
+def _legacy_stitch(pdf_bytes: bytes, max_pages: int = 20):
+    """The pre-canvas path: PNG per page → imdecode → hstack pad → vstack → PNG → imdecode."""
+    import fitz, cv2, numpy as np
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    imgs = []
+    for i in range(min(len(doc), max_pages)):
+        pix = doc.load_page(i).get_pixmap(dpi=300)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        ok, buf = cv2.imencode(".png", img)
+        imgs.append(cv2.imdecode(np.frombuffer(buf.tobytes(), np.uint8), cv2.IMREAD_COLOR))
+    max_w  = max(i.shape[1] for i in imgs)
+    padded = [i if i.shape[1] == max_w else
+              np.hstack([i, np.ones((i.shape[0], max_w - i.shape[1], 3), dtype=np.uint8) * 255]) for i in imgs]
+    sep, parts = np.ones((10, max_w, 3), dtype=np.uint8) * 255, []
+    for n, i in enumerate(padded):
+        parts.append(i)
+        if n < len(padded) - 1:
+            parts.append(sep)
+    ok, buf = cv2.imencode(".png", np.vstack(parts))
+    return cv2.imdecode(np.frombuffer(buf.tobytes(), np.uint8), cv2.IMREAD_COLOR)
+
+
+def _stitch_case(path: str, pages: int) -> dict:
+    pdf = _sample_pdf(pages)
+    if path == "legacy":
+        return _measure(lambda: _legacy_stitch(pdf))
+    # same 300-DPI colour output as the legacy path, for a like-for-like comparison
+    os.environ.update(OCR_COLOR_MODE="color", OCR_RENDER_DPI="300", OCR_MIN_RENDER_DPI="300")
+    import app
+    return _measure(lambda: app.pdf_to_stitched_array(pdf))
+
+
+def bench_stitch():
+    rows = []
+    for pages in (1, 5, 20):
+        for path in ("legacy", "canvas"):
+            r = _run_isolated(_stitch_case, path, pages)
+            rows.append((pages, path, r["seconds"], r["py_peak_mb"], r["rss_growth_mb"]))
+    _table("Stitch 300-DPI pages (colour)", ("pages", "path", "seconds", "np peak MB", "RSS growth MB"), rows)
+
+
+# ─────────────────────────────────────────────────────────────
+# RENDER — stitched canvas vs. lazy per-page rendering (scanned PDFs)
+# ─────────────────────────────────────────────────────────────
+
+def _sample_scan_pdf(path: str, pages: int):
+    """One distinct full-page grayscale noise image per page, like a scanner's output."""
+    import fitz, numpy as np
+    rng = np.random.default_rng(0)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_image(page.rect, pixmap=fitz.Pixmap(
+            fitz.csGRAY, 300, 400, rng.integers(0, 255, (400, 300), dtype=np.uint8).tobytes(), False))
+    doc.save(path)
+
+
+def _render_case(path: str, pages: int) -> dict:
+    import tempfile
+    import app
+    pdf = os.path.join(tempfile.mkdtemp(), "scan.pdf")
+    _sample_scan_pdf(pdf, pages)
+    sink = {"encoded": 0}
+
+    def lazy():
+        for image in app.iter_pdf_page_images(pdf):
+            sink["encoded"] += len(image["data"])
+
+    def stitched():
+        sink["encoded"] += len(app.preprocess_for_ocr(app.pdf_to_stitched_array(pdf))["data"])
+
+    result = _measure(lazy if path == "lazy" else stitched, trace=False)
+    return {**result, "kb": sink["encoded"] // 1024}
+
+
+def bench_render():
+    rows = []
+    for pages in (20, 100, 200):
+        for path in ("stitched", "lazy"):
+            if path == "stitched" and pages > 20:
+                continue   # the canvas is capped at OCR_STITCH_MAX_PAGES
+            r = _run_isolated(_render_case, path, pages)
+            rows.append((pages, path, r["seconds"], r["rss_growth_mb"], r["kb"]))
+    _table("Render scanned PDF pages for OCR", ("pages", "path", "seconds", "RSS growth MB", "encoded KB"), rows)
+
+
+# ─────────────────────────────────────────────────────────────
+# EXPORT — python-docx object model vs. DocxStreamWriter
+# ─────────────────────────────────────────────────────────────
+
+def _sample_contract(pages: int) -> dict:
+    """Roughly one printed page of clauses per `pages`, with lists and a table every 5 pages."""
+    text    = lambda t, *marks: {"type": "text", "text": t, "marks": [{"type": m} for m in marks]}
+    para    = lambda *c: {"type": "paragraph", "content": list(c)}
+    content = []
+    for n in range(pages):
+        content.append({"type": "heading", "attrs": {"level": 2}, "content": [text(f"{n + 1}. Clause heading")]})
+        for k in range(5):
+            content.append(para(text("The parties agree that "), text("this obligation", "bold"),
+                                text(f" survives termination for a period of {k + 1} years, subject to the "
+                                     "limitations set out elsewhere in this agreement.", "italic")))
+        content.append({"type": "bulletList", "content": [
+            {"type": "listItem", "content": [para(text(f"Sub-clause {n + 1}.{k + 1} applies in full."))]}
+            for k in range(4)]})
+        if n % 5 == 4:
+            cell = lambda kind, t: {"type": kind, "content": [para(text(t))]}
+            content.append({"type": "table", "content": [
+                {"type": "tableRow", "content": [cell("tableHeader" if r == 0 else "tableCell", f"R{r}C{c}")
+                                                 for c in range(4)]} for r in range(6)]})
+    return {"type": "doc", "content": content}
+
+
+def _export_case(engine: str, pages: int) -> dict:
+    import io
+    import app
+    doc  = _sample_contract(pages)
+    sink = {"bytes": 0}
+
+    def python_docx():
+        buf = io.BytesIO(); app.tiptap_doc_to_docx(doc).save(buf)
+        sink["bytes"] = buf.tell()
+
+    def stream():
+        sink["bytes"] = sum(len(c) for c in app.DocxStreamWriter("default").iter_docx(doc))
+
+    result = _measure(python_docx if engine == "python-docx" else stream)
+    return {**result, "kb": sink["bytes"] // 1024}
+
+
+def _export_identical(pages: int) -> bool:
+    import io, zipfile
+    import app
+    doc = _sample_contract(pages)
+    buf = io.BytesIO(); app.tiptap_doc_to_docx(doc).save(buf)
+    streamed = b"".join(app.DocxStreamWriter("default").iter_docx(doc))
+    read = lambda data: zipfile.ZipFile(io.BytesIO(data)).read("word/document.xml")
+    return read(buf.getvalue()) == read(streamed)
+
+
+def bench_export():
+    rows = []
+    for pages in (10, 50, 100):
+        for engine in ("python-docx", "stream"):
+            r = _run_isolated(_export_case, engine, pages)
+            rows.append((pages, engine, r["seconds"], r["py_peak_mb"], r["rss_growth_mb"], r["kb"]))
+    _table("Export TipTap contract to DOCX", ("pages", "engine", "seconds", "py peak MB", "RSS growth MB", "KB"), rows)
+    print(f"\ndocument.xml identical across engines: {_run_isolated(_export_identical, 20)}")
+
+
+# ─────────────────────────────────────────────────────────────
+# TABLES — table.rows[i].cells[j] per cell vs. one pass + table styles
+# ─────────────────────────────────────────────────────────────
+
+def _sample_table(cols: int, rows: int) -> dict:
+    cell = lambda kind, t: {"type": kind, "content": [{"type": "paragraph", "content": [{"type": "text", "text": t}]}]}
+    return {"type": "table", "content": [
+        {"type": "tableRow", "content": [cell("tableHeader" if r == 0 else "tableCell", f"{r}:{c} 1,234.00")
+                                         for c in range(cols)]} for r in range(rows)]}
+
+
+def _legacy_table(node, document):
+    """The pre-style renderer: index every cell through table.rows, then restyle runs cell by cell."""
+    import app
+    rows  = node["content"]
+    table = document.add_table(rows=len(rows), cols=max(len(r["content"]) for r in rows))
+    table.alignment = app.WD_TABLE_ALIGNMENT.CENTER; table.autofit = True
+    for r_idx, row in enumerate(rows):
+        for c_idx, cell_node in enumerate(row["content"]):
+            cell = table.rows[r_idx].cells[c_idx]; cell.text = ""
+            for child in cell_node["content"]:
+                p = cell.paragraphs[0]
+                app.add_text_runs_from_tiptap(child["content"], p)
+                fmt = p.paragraph_format
+                fmt.space_before = app.Pt(0); fmt.space_after = app.Pt(6)
+                fmt.line_spacing_rule = app.WD_LINE_SPACING.MULTIPLE; fmt.line_spacing = 1.35
+            if cell_node["type"] == "tableHeader":
+                for p in cell.paragraphs:
+                    for r in p.runs: r.bold = True
+                app.shade_cell(cell, app.META_HEADER_FILL)
+
+
+def _table_case(path: str, cols: int, rows: int) -> dict:
+    import app
+    node = _sample_table(cols, rows)
+    if path == "stream":
+        return _measure(lambda: app.DocxStreamWriter("default").stream_node(node), trace=False)
+    render   = _legacy_table if path == "legacy" else app.render_table_node
+    document = app.TEMPLATES.new_document()
+    return _measure(lambda: render(node, document), trace=False)
+
+
+def bench_tables():
+    rows = []
+    for cols, n_rows in ((10, 500), (20, 2000)):
+        for path in ("legacy", "one-pass", "stream"):
+            r = _run_isolated(_table_case, path, cols, n_rows)
+            rows.append((f"{cols}x{n_rows}", path, r["seconds"], round(r["seconds"] * 1e6 / (cols * n_rows), 1),
+                         r["rss_growth_mb"]))
+    _table("Render one TipTap table", ("table", "path", "seconds", "µs/cell", "RSS growth MB"), rows)
+
+
+# ─────────────────────────────────────────────────────────────
+# DOCXML — how much XML each sample document turns into
+# ─────────────────────────────────────────────────────────────
+
+def _sample_letter() -> dict:
+    """A one-page offer letter: a few headings, paragraphs, a short numbered list and a meta table."""
+    text = lambda t: {"type": "text", "text": t}
+    para = lambda t: {"type": "paragraph", "content": [text(t)]}
+    cell = lambda kind, t: {"type": kind, "content": [para(t)]}
+    return {"type": "doc", "content": [
+        {"type": "table", "attrs": {"class": "meta-table"}, "content": [
+            {"type": "tableRow", "content": [cell("tableCell", "Name"), cell("tableCell", "A. Candidate"),
+                                             cell("tableCell", "Date"), cell("tableCell", "1 March")]}]},
+        {"type": "heading", "attrs": {"level": 2}, "content": [text("Offer of employment")]},
+        *[para("We are pleased to offer you the position described below, on the terms of this letter.")] * 4,
+        {"type": "orderedList", "content": [{"type": "listItem", "content": [para(f"Term {k + 1} of the offer.")]}
+                                            for k in range(6)]},
+        para("Please sign and return a copy to confirm your acceptance."),
+    ]}
+
+
+def _sample_checklist(items: int) -> dict:
+    """Mostly lists: numbered steps, each with a continuation line and a bullet list of notes."""
+    text = lambda t: {"type": "text", "text": t}
+    para = lambda t: {"type": "paragraph", "content": [text(t)]}
+    item = lambda *t: {"type": "listItem", "content": [para(x) for x in t]}
+    content = []
+    for n in range(items // 10):
+        content.append({"type": "orderedList", "content": [item(f"Step {k + 1}", "Owner: operations") for k in range(10)]})
+        content.append({"type": "bulletList", "content": [item(f"Note {k + 1}") for k in range(5)]})
+    return {"type": "doc", "content": content}
+
+
+DOCXML_SAMPLES = {"letter": _sample_letter, "contract-20": lambda: _sample_contract(20),
+                  "contract-100": lambda: _sample_contract(100), "checklist-1000": lambda: _sample_checklist(1000)}
+
+
+def _docxml_case(sample: str, engine: str) -> dict:
+    import io, zipfile
+    import app
+    doc  = DOCXML_SAMPLES[sample]()
+    sink = {}
+
+    def python_docx():
+        buf = io.BytesIO(); app.tiptap_doc_to_docx(doc).save(buf)
+        sink["data"] = buf.getvalue()
+
+    def stream():
+        sink["data"] = b"".join(app.DocxStreamWriter("default").iter_docx(doc))
+
+    result = _measure(python_docx if engine == "python-docx" else stream, trace=False)
+    xml    = zipfile.ZipFile(io.BytesIO(sink["data"])).read("word/document.xml")
+    return {**result, "xml_kb": round(len(xml) / 1024, 1), "docx_kb": round(len(sink["data"]) / 1024, 1)}
+
+
+def bench_docxml():
+    rows = []
+    for sample in DOCXML_SAMPLES:
+        for engine in ("python-docx", "stream"):
+            r = _run_isolated(_docxml_case, sample, engine)
+            rows.append((sample, engine, r["xml_kb"], r["docx_kb"], r["seconds"]))
+    _table("document.xml size and export time", ("document", "engine", "xml KB", "docx KB", "seconds"), rows)
+
+
+# ─────────────────────────────────────────────────────────────
+# INCREMENTAL — re-export after editing one paragraph (fragment cache)
+# ─────────────────────────────────────────────────────────────
+
+def _incremental_case(pages: int) -> dict:
+    """Both exports go through EXPORT_POOL, pinned to one worker, as generate-docx runs them."""
+    import asyncio, copy, tempfile, threading
+    import app
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    on_loop = lambda coro: asyncio.run_coroutine_threadsafe(coro, loop).result()
+    path    = os.path.join(tempfile.mkdtemp(), "out.docx")
+    slot    = app.EXPORT_POOL.slot_for("contract|default")
+    sink    = {}
+
+    def export(d):
+        sink["stats"] = on_loop(app.EXPORT_POOL.run(app.docx_stream_to_file, path, d, None, None, None, None,
+                                                    "contract", slot=slot))
+
+    doc = _sample_contract(pages)
+    on_loop(asyncio.to_thread(app.EXPORT_POOL.start))
+    on_loop(app.EXPORT_POOL.run(time.sleep, 0, slot=slot))   # worker spawned and warm before timing
+    cold   = _measure(lambda: export(doc), trace=False)
+    before = sink["stats"]["hits"]
+    edited = copy.deepcopy(doc)
+    edited["content"][1]["content"][0]["text"] = "The parties now agree that "
+    warm   = _measure(lambda: export(edited), trace=False)
+    on_loop(asyncio.to_thread(app.EXPORT_POOL.shutdown))
+    return {"nodes": len(doc["content"]), "cold": cold["seconds"], "edit": warm["seconds"],
+            "hits": sink["stats"]["hits"] - before}
+
+
+def bench_incremental():
+    rows = []
+    for pages in (10, 100, 300):
+        r = _run_isolated(_incremental_case, pages)
+        rows.append((pages, r["nodes"], r["cold"], r["edit"], r["hits"]))
+    _table(f"Stream export on a pinned pool worker, then re-export with one paragraph edited "
+           f"(EXPORT_WORKERS={os.getenv('EXPORT_WORKERS', '2')})",
+           ("pages", "nodes", "cold s", "after edit s", "fragments reused"), rows)
+
+
+# ─────────────────────────────────────────────────────────────
+# PDFEXPORT — digital PDF → DOCX, plain text blocks vs. layout mode
+# ─────────────────────────────────────────────────────────────
+
+def _sample_report_pdf(path: str, pages: int):
+    """Per page: a 20 pt bold heading, wrapped body paragraphs with bold leads, one ruled 4x3 table."""
+    import fitz
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Section {n + 1}", fontsize=20, fontname="hebo")
+        y = 110
+        for k in range(8):
+            page.insert_text((72, y), "Bold lead.", fontsize=11, fontname="hebo")
+            page.insert_text((72, y + 14), f"Paragraph {k + 1} of page {n + 1}, wrapped over two lines of body", fontsize=11)
+            page.insert_text((72, y + 28), "text that the exporter has to join back together.", fontsize=11)
+            y += 50
+        for r in range(4):
+            for c in range(3):
+                page.draw_rect(fitz.Rect(72 + c * 140, y + r * 20, 212 + c * 140, y + 20 + r * 20), color=(0, 0, 0), width=0.7)
+                page.insert_text((76 + c * 140, y + 14 + r * 20), f"R{r} C{c}", fontsize=10)
+    doc.save(path)
+
+
+def _pdfexport_case(mode: str, pages: int) -> dict:
+    import asyncio, tempfile, threading
+    import app
+    path = os.path.join(tempfile.mkdtemp(), "report.pdf")
+    _sample_report_pdf(path, pages)
+    sink = {}
+
+    def plain():
+        sink["bytes"] = len(app.pdf_text_docx_bytes(path))
+
+    def layout():
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        body = app.iter_pdf_docx_xml(path, app.pdf_page_count(path), loop)
+        sink["bytes"] = sum(len(c) for c in app.DocxStreamWriter("default", fragments=False).iter_docx(
+            None, body=body))
+        asyncio.run_coroutine_threadsafe(asyncio.to_thread(app.EXPORT_POOL.shutdown), loop).result()
+
+    result = _measure(plain if mode == "plain" else layout, trace=False)
+    return {**result, "kb": sink["bytes"] // 1024}
+
+
+def bench_pdfexport():
+    rows = []
+    for pages in (50, 300):
+        for mode in ("plain", "layout"):
+            r = _run_isolated(_pdfexport_case, mode, pages)
+            rows.append((pages, mode, r["seconds"], r["rss_growth_mb"], r["kb"]))
+    _table(f"Digital PDF → DOCX (EXPORT_WORKERS={os.getenv('EXPORT_WORKERS', '2')})",
+           ("pages", "mode", "seconds", "RSS growth MB", "KB"), rows)
+
+
+BENCHES = {"stitch": bench_stitch, "render": bench_render, "export": bench_export, "tables": bench_tables, "docxml": bench_docxml,
+           "incremental": bench_incremental, "pdfexport": bench_pdfexport}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHES)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    for name in names:
+        BENCHES[name]()
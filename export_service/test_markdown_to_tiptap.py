@@ -0,0 +1,91 @@
+# test_markdown_to_tiptap.py
+# =============================================================
+# Local Markdown → TipTap converter (stage 3, STAGE3_MODE=local).
+#
+#   python -m pytest -q export_service
+# =============================================================
+
+import os
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+os.environ.setdefault("HANDW_API_KEY", "test")
+os.environ.setdefault("JOB_STORE_BACKEND", "memory")
+os.environ.setdefault("OCR_CACHE_MAX_BYTES", "0")
+
+from app import markdown_to_tiptap
+
+
+def test_underscore_blank_line_stays_text():
+    # STAGE1_PROMPT writes fill-in fields as __________; they are not rules
+    doc = markdown_to_tiptap("Signed by:\n\n__________\n\nDate: __________")
+    assert [n["type"] for n in doc["content"]] == ["paragraph", "paragraph", "paragraph"]
+    assert doc["content"][1]["content"] == [{"type": "text", "text": "__________"}]
+    assert doc["content"][2]["content"] == [{"type": "text", "text": "Date: __________"}]
+
+
+def test_dash_and_star_lines_are_rules():
+    doc = markdown_to_tiptap("Page one\n\n---\n\nPage two\n\n* * *\n\nEnd")
+    assert [n["type"] for n in doc["content"]] == [
+        "paragraph", "horizontalRule", "paragraph", "horizontalRule", "paragraph"]
+
+
+def _text(node):
+    return "".join(t.get("text", "") for t in node.get("content", []))
+
+
+def test_table_header_and_ragged_rows():
+    doc = markdown_to_tiptap("| a | b |\n|---|---|\n| 1 |\n| 2 | 3 | 4 |")
+    table = doc["content"][0]
+    assert table["type"] == "table"
+    rows = table["content"]
+    assert [c["type"] for c in rows[0]["content"]] == ["tableHeader"] * 3
+    assert all(len(r["content"]) == 3 for r in rows)           # short rows padded to the widest
+    assert [_text(c["content"][0]) for c in rows[1]["content"]] == ["1", "", ""]
+    assert [_text(c["content"][0]) for c in rows[2]["content"]] == ["2", "3", "4"]
+
+
+def test_table_without_header_row():
+    rows = markdown_to_tiptap("| a | b |\n| c | d |")["content"][0]["content"]
+    assert {c["type"] for r in rows for c in r["content"]} == {"tableCell"}
+
+
+def test_separator_only_table_is_dropped():
+    assert markdown_to_tiptap("|---|---|")["content"] == []
+    doc = markdown_to_tiptap("text\n|---|\nmore")
+    assert [_text(n) for n in doc["content"]] == ["text", "more"]
+
+
+def test_nested_bullet_list():
+    doc = markdown_to_tiptap("- a\n  - b\n- c")
+    items = doc["content"][0]["content"]
+    assert doc["content"][0]["type"] == "bulletList" and len(items) == 2
+    nested = items[0]["content"][1]
+    assert nested["type"] == "bulletList" and _text(nested["content"][0]["content"][0]) == "b"
+    assert _text(items[1]["content"][0]) == "c"
+
+
+def test_ordered_list_start_and_blank_lines():
+    doc = markdown_to_tiptap("3. x\n4. y\n\n5) z")
+    assert len(doc["content"]) == 1
+    node = doc["content"][0]
+    assert node["type"] == "orderedList" and node["attrs"] == {"start": 3}
+    assert [_text(li["content"][0]) for li in node["content"]] == ["x", "y", "z"]
+
+
+def test_headings():
+    doc = markdown_to_tiptap("# Title\n### Section ###\n####### not a heading")
+    assert [(n["type"], n.get("attrs")) for n in doc["content"]] == [
+        ("heading", {"level": 1}), ("heading", {"level": 3}), ("paragraph", None)]
+    assert _text(doc["content"][1]) == "Section"
+
+
+def test_inline_marks():
+    content = markdown_to_tiptap("**b** *i* ***bi*** ~~s~~ `a*b*c`")["content"][0]["content"]
+    marked = [(t["text"], [m["type"] for m in t.get("marks", [])]) for t in content]
+    assert marked == [("b", ["bold"]), (" ", []), ("i", ["italic"]), (" ", []), ("bi", ["bold", "italic"]),
+                      (" ", []), ("s", ["strike"]), (" a*b*c", [])]   # no code mark: literal text
+
+
+def test_escaped_markers_stay_literal():
+    assert markdown_to_tiptap(r"\*not italic\*")["content"][0]["content"] == [
+        {"type": "text", "text": "*not italic*"}]